@@ -0,0 +1,194 @@
+"""Record/replay cache for Bedrock Runtime calls.
+
+Wraps a boto3 ``bedrock-runtime`` client so that ``converse`` and
+``converse_stream`` calls are stored on disk keyed by a hash of the request,
+and served back from disk on later runs. Because strands' BedrockModel talks
+to Bedrock through the same client (``BedrockModel.client``), the wrapper sits
+under every demo in this repository.
+
+Configuration comes from environment variables:
+
+    BEDROCK_REPLAY_MODE    off (default), record, replay or auto
+                           (replay when recorded, otherwise record)
+    BEDROCK_REPLAY_DIR     directory for recordings (default: .bedrock_replay
+                           next to this file)
+    BEDROCK_REPLAY_TIMING  original (default) re-creates the recorded stream
+                           timing, fast serves events immediately
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+MODES = ("off", "record", "replay", "auto")
+TIMINGS = ("original", "fast")
+
+DEFAULT_REPLAY_DIR = Path(__file__).resolve().parent / ".bedrock_replay"
+
+
+class ReplayMissError(KeyError):
+    """Raised in replay mode when a request has no recording."""
+
+
+def _encode(value):
+    """Make a request/response JSON-serializable, keeping bytes round-trippable."""
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {"__bytes__"}:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def request_hash(operation, request):
+    """Hash an operation name and its keyword arguments."""
+    canonical = json.dumps(
+        {"operation": operation, "request": _encode(request)},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ReplayBedrockClient:
+    """Drop-in wrapper for a bedrock-runtime client with record/replay."""
+
+    def __init__(self, client, mode="record", replay_dir=None, timing="original"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown replay mode: {mode}")
+        if timing not in TIMINGS:
+            raise ValueError(f"Unknown replay timing: {timing}")
+        self._client = client
+        self.mode = mode
+        self.timing = timing
+        self.replay_dir = Path(replay_dir or DEFAULT_REPLAY_DIR)
+        self.replay_dir.mkdir(parents=True, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # meta, count_tokens, exceptions, ... go straight to the real client
+        return getattr(self._client, name)
+
+    def _path(self, key):
+        return self.replay_dir / f"{key}.json"
+
+    def _load(self, key):
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, key, recording):
+        # Write to a temp file first so concurrent readers never see partial JSON
+        fd, tmp_path = tempfile.mkstemp(dir=self.replay_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(recording, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.stats["recorded"] += 1
+
+    def _lookup(self, operation, request):
+        key = request_hash(operation, request)
+        recording = self._load(key) if self.mode in ("replay", "auto") else None
+        with self._lock:
+            self.stats["hits" if recording else "misses"] += 1
+        if recording is None and self.mode == "replay":
+            raise ReplayMissError(f"No recording for {operation} request {key[:12]} in {self.replay_dir}")
+        return key, recording
+
+    def converse(self, **request):
+        key, recording = self._lookup("converse", request)
+        if recording:
+            if self.timing == "original":
+                time.sleep(recording.get("duration", 0))
+            return _decode(recording["response"])
+
+        started = time.perf_counter()
+        response = self._client.converse(**request)
+        self._save(key, {
+            "operation": "converse",
+            "model_id": request.get("modelId"),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duration": time.perf_counter() - started,
+            "response": _encode(response)
+        })
+        return response
+
+    def converse_stream(self, **request):
+        key, recording = self._lookup("converse_stream", request)
+        if recording:
+            response = _decode(recording["response"])
+            response["stream"] = self._replay_stream(recording["events"])
+            return response
+
+        started = time.perf_counter()
+        response = self._client.converse_stream(**request)
+        metadata = {k: v for k, v in response.items() if k != "stream"}
+        response["stream"] = self._record_stream(key, request, response["stream"], metadata, started)
+        return response
+
+    def _replay_stream(self, events):
+        started = time.perf_counter()
+        for entry in events:
+            if self.timing == "original":
+                delay = entry["offset"] - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield _decode(entry["event"])
+
+    def _record_stream(self, key, request, stream, metadata, started):
+        events = []
+        for event in stream:
+            events.append({"offset": time.perf_counter() - started, "event": _encode(event)})
+            yield event
+        # Only complete streams are saved; an abandoned stream is not a valid recording
+        self._save(key, {
+            "operation": "converse_stream",
+            "model_id": request.get("modelId"),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "response": _encode(metadata),
+            "events": events
+        })
+
+
+def wrap_bedrock_client(client, mode=None, replay_dir=None, timing=None):
+    """Wrap a bedrock-runtime client according to BEDROCK_REPLAY_* settings.
+
+    Returns the client unchanged when the mode is "off".
+    """
+    mode = mode or os.getenv("BEDROCK_REPLAY_MODE", "off")
+    if mode == "off":
+        return client
+    return ReplayBedrockClient(
+        client,
+        mode=mode,
+        replay_dir=replay_dir or os.getenv("BEDROCK_REPLAY_DIR"),
+        timing=timing or os.getenv("BEDROCK_REPLAY_TIMING", "original")
+    )
+
+
+def wrap_bedrock_model(model, **kwargs):
+    """Install the record/replay wrapper under a strands BedrockModel."""
+    model.client = wrap_bedrock_client(model.client, **kwargs)
+    return model
@@ -9,9 +9,14 @@ import boto3
 import json
 import logging
 import base64
+import sys
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+# 仓库根目录下的 Bedrock 录制/回放封装
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bedrock_replay import wrap_bedrock_client
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,7 +30,7 @@ class DocumentReviewer:
             region_name: AWS区域名称
             prompt_file: 系统提示词文件路径
         """
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name=region_name)
+        self.bedrock_client = wrap_bedrock_client(boto3.client('bedrock-runtime', region_name=region_name))
         self.model_id = 'global.anthropic.claude-haiku-4-5-20251001-v1:0'
         self.prompt_file = prompt_file
         self.system_prompt = self._load_system_prompt()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+repl / file / tools 三种分析模式的基准测试
+- 生成不同规模的 EC2 监控数据集
+- 用替身模型（ScriptedModel）按剧本发起工具调用，不访问 Bedrock；Agent、工具和数据处理都是真实的
+- 记录每种模式的耗时、工具往返次数、输入/输出 token，并与本地 pandas 计算的标准答案比对
+
+替身模型在 file 模式下直接解析附件 CSV 作答，因此正确率衡量的是"发给模型的数据是否足以回答问题"，
+而不是大模型本身的计算能力；token 数按字符数估算（约 4 字符 1 token）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+from strands import Agent
+from strands.models import Model
+
+from metrics_engine import create_metrics_tools
+from metrics_summary import load_metrics, summarize_metrics, format_summary_csv
+
+os.environ.setdefault("BYPASS_TOOL_CONSENT", "true")
+
+MODES = ["repl", "file", "file_raw", "tools"]
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_INSTANCES = 20
+
+QUESTIONS = {
+    "high_cpu": "请找出平均 CPU 使用率大于 75% 的机器",
+    "top3_cpu": "请找出平均 CPU 使用率 Top3 的机器",
+    "top_p95_memory": "请找出内存使用率 p95 最高的机器",
+}
+
+
+def generate_dataset(path: str, rows: int, instances: int = DEFAULT_INSTANCES, seed: int = 0) -> str:
+    """生成每小时采样的监控数据，部分实例 CPU 负载偏高，使每个问题都有非空答案"""
+    rng = np.random.default_rng(seed)
+    per_instance = max(1, rows // instances)
+    instance_ids = np.array([f"i-{seed:02d}{i:015x}" for i in range(instances)])
+    base_cpu = rng.uniform(30, 85, instances)
+    base_memory = rng.uniform(40, 80, instances)
+    base_disk = rng.uniform(30, 70, instances)
+
+    hours = np.arange(per_instance)
+    timestamps = np.datetime64("2024-12-26T08:00:00") + hours.astype("timedelta64[h]")
+    daily = 10 * np.sin(2 * np.pi * (hours % 24) / 24)
+
+    def metric(base, noise):
+        values = base[None, :] + daily[:, None] + rng.normal(0, noise, (per_instance, instances))
+        return np.clip(values, 0, 100).round(1).ravel()
+
+    df = pd.DataFrame({
+        "timestamp": np.repeat(timestamps, instances).astype("datetime64[s]").astype(str),
+        "instance_id": np.tile(instance_ids, per_instance),
+        "cpu_usage": metric(base_cpu, 8),
+        "memory_usage": metric(base_memory, 6),
+        "disk_usage": metric(base_disk, 3),
+    })
+    df["timestamp"] = df["timestamp"].str.replace("T", " ")
+    df.to_csv(path, index=False)
+    return path
+
+
+def ground_truth(csv_file_name: str) -> dict:
+    """用 pandas 在本地计算每个问题的标准答案"""
+    df = load_metrics(csv_file_name)
+    cpu_mean = df.groupby("instance_id")["cpu_usage"].mean()
+    memory_p95 = df.groupby("instance_id")["memory_usage"].quantile(0.95)
+    return {
+        "high_cpu": sorted(cpu_mean[cpu_mean > 75].index),
+        "top3_cpu": list(cpu_mean.sort_values(ascending=False).index[:3]),
+        "top_p95_memory": [memory_p95.idxmax()],
+    }
+
+
+def estimate_tokens(value) -> int:
+    """按字符数粗略估算 token（附件按字节数计）"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) // 4
+    if isinstance(value, dict):
+        return sum(estimate_tokens(v) for v in value.values())
+    if isinstance(value, list):
+        return sum(estimate_tokens(v) for v in value)
+    return len(str(value)) // 4
+
+
+# 每种模式下回答每个问题的剧本：要发起的工具调用
+def repl_code(csv_file_name, question):
+    load = f"import pandas as pd, json\ndf = pd.read_csv({csv_file_name!r})\n"
+    body = {
+        "high_cpu": "m = df.groupby('instance_id')['cpu_usage'].mean()\nprint(json.dumps(sorted(m[m > 75].index)))",
+        "top3_cpu": "m = df.groupby('instance_id')['cpu_usage'].mean()\n"
+                    "print(json.dumps(list(m.sort_values(ascending=False).index[:3])))",
+        "top_p95_memory": "m = df.groupby('instance_id')['memory_usage'].quantile(0.95)\n"
+                          "print(json.dumps([m.idxmax()]))",
+    }[question]
+    return load + body
+
+
+TOOL_SCRIPTS = {
+    "high_cpu": ("metrics_threshold_filter", {"metric": "cpu_usage", "operator": ">", "value": 75}),
+    "top3_cpu": ("metrics_top_k", {"metric": "cpu_usage", "k": 3}),
+    "top_p95_memory": ("metrics_top_k", {"metric": "memory_usage", "k": 1, "aggregation": "p95"}),
+}
+
+
+def answer_from_document(question, document_bytes, summarized):
+    """file 模式：替身模型直接读附件作答"""
+    df = pd.read_csv(StringIO(document_bytes.decode("utf-8")))
+    if summarized:
+        table = df.set_index("instance_id")
+        cpu_mean, memory_p95 = table["cpu_usage_mean"], table["memory_usage_p95"]
+    else:
+        cpu_mean = df.groupby("instance_id")["cpu_usage"].mean()
+        memory_p95 = df.groupby("instance_id")["memory_usage"].quantile(0.95)
+    if question == "high_cpu":
+        return sorted(cpu_mean[cpu_mean > 75].index)
+    if question == "top3_cpu":
+        return list(cpu_mean.sort_values(ascending=False).index[:3])
+    return [memory_p95.idxmax()]
+
+
+def _tool_result_text(messages):
+    for block in messages[-1]["content"]:
+        if "toolResult" in block:
+            return "\n".join(c.get("text", "") for c in block["toolResult"]["content"])
+    return ""
+
+
+def _find_document(messages):
+    for message in messages:
+        for block in message["content"]:
+            if "document" in block:
+                return block["document"]
+    return None
+
+
+class ScriptedModel(Model):
+    """按剧本回放工具调用的替身模型
+
+    第一次被调用时发起剧本里的工具调用，拿到工具结果后解析出实例列表作为最终回答；
+    没有剧本（file 模式）时直接解析附件作答
+    """
+
+    def __init__(self, mode, question, csv_file_name, latency_ms=0):
+        self.config = {"model_id": "scripted-model", "latency_ms": latency_ms}
+        self.mode = mode
+        self.question = question
+        self.csv_file_name = csv_file_name
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError("ScriptedModel does not support structured output")
+
+    def _next_action(self, messages):
+        """返回 ("tool", 名称, 参数) 或 ("answer", 文本)"""
+        if messages[-1]["role"] == "user" and any("toolResult" in b for b in messages[-1]["content"]):
+            text = _tool_result_text(messages)
+            if self.mode == "tools":
+                answer = [row["instance_id"] for row in json.loads(text)]
+            else:
+                answer = json.loads(re.findall(r"\[.*\]", text)[-1])
+            return ("answer", json.dumps(answer, ensure_ascii=False))
+
+        if self.mode == "repl":
+            return ("tool", "python_repl",
+                    {"code": repl_code(self.csv_file_name, self.question), "interactive": False})
+        if self.mode == "tools":
+            name, arguments = TOOL_SCRIPTS[self.question]
+            return ("tool", name, arguments)
+        document = _find_document(messages)
+        answer = answer_from_document(self.question, document["source"]["bytes"], self.mode == "file")
+        return ("answer", json.dumps(answer, ensure_ascii=False))
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        input_tokens = estimate_tokens(system_prompt or "") + estimate_tokens(messages) + \
+            estimate_tokens(json.dumps(tool_specs or [], ensure_ascii=False))
+        if self.config["latency_ms"]:
+            await asyncio.sleep(self.config["latency_ms"] / 1000)
+
+        action = self._next_action(messages)
+        yield {"messageStart": {"role": "assistant"}}
+        if action[0] == "tool":
+            _, name, arguments = action
+            payload = json.dumps(arguments, ensure_ascii=False)
+            yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": f"tool-{len(messages)}", "name": name}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": payload}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+        else:
+            payload = action[1]
+            yield {"contentBlockStart": {"start": {}}}
+            yield {"contentBlockDelta": {"delta": {"text": payload}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+
+        output_tokens = estimate_tokens(payload)
+        yield {
+            "metadata": {
+                "usage": {
+                    "inputTokens": input_tokens,
+                    "outputTokens": output_tokens,
+                    "totalTokens": input_tokens + output_tokens
+                },
+                "metrics": {"latencyMs": self.config["latency_ms"]}
+            }
+        }
+
+
+def build_request(mode, question, csv_file_name):
+    """按 demo_strands_ana_file.py 中各模式的方式构造工具和请求"""
+    text = QUESTIONS[question]
+    if mode == "repl":
+        from strands_tools import python_repl
+        return [python_repl], f"我有一份 EC2 服务器的性能监控数据（CSV 格式），存储在{csv_file_name}，{text}"
+    if mode == "tools":
+        return create_metrics_tools(csv_file_name), f"我有一份 EC2 服务器的性能监控数据，已加载到指标引擎中，{text}"
+
+    if mode == "file":
+        document = format_summary_csv(summarize_metrics(load_metrics(csv_file_name))).encode("utf-8")
+    else:
+        with open(csv_file_name, "rb") as f:
+            document = f.read()
+    return [], [
+        {"text": f"我有一份 EC2 服务器的性能监控数据（CSV 格式），{text}"},
+        {"document": {"format": "csv", "name": "ec2_metrics", "source": {"bytes": document}}}
+    ]
+
+
+def measure_case(mode, question, csv_file_name, latency_ms=0):
+    """在当前进程中运行一个 (模式, 问题) 组合，返回耗时、往返次数、token 和替身模型的回答"""
+    tools, request = build_request(mode, question, csv_file_name)
+    agent = Agent(
+        model=ScriptedModel(mode, question, csv_file_name, latency_ms),
+        system_prompt="作为监控系统专家，仔细分析监控指标",
+        tools=tools,
+        callback_handler=None
+    )
+    started = time.perf_counter()
+    result = agent(request)
+    elapsed = time.perf_counter() - started
+
+    usage = result.metrics.get_summary()["accumulated_usage"]
+    try:
+        answer = json.loads(str(result).strip())
+    except json.JSONDecodeError:
+        answer = None
+    return {
+        "latency_ms": round(elapsed * 1000, 1),
+        "round_trips": result.metrics.cycle_count,
+        "tool_calls": sum(m.call_count for m in result.metrics.tool_metrics.values()),
+        "input_tokens": usage.get("inputTokens", 0),
+        "output_tokens": usage.get("outputTokens", 0),
+        "answer": answer
+    }
+
+
+def measure_case_in_subprocess(mode, question, csv_file_name, latency_ms=0, workdir=None):
+    """在独立的子进程中运行一个用例
+
+    strands_tools 的 python_repl 在进程内共用一份 REPL 状态，并持久化到 PYTHON_REPL_PERSISTENCE_DIR（默认当前目录的
+    repl_state/）；每个用例用新的解释器、以临时目录为当前目录和持久化目录，变量不会带到下一个用例
+    """
+    case_dir = tempfile.mkdtemp(prefix=f"{mode}_{question}_", dir=workdir)
+    env = {**os.environ, "PYTHON_REPL_PERSISTENCE_DIR": case_dir}
+    command = [sys.executable, os.path.abspath(__file__), "--measure_case", mode, question,
+               os.path.abspath(csv_file_name), "--latency_ms", str(latency_ms)]
+    completed = subprocess.run(command, cwd=case_dir, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"基准用例 {mode}/{question} 运行失败:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_case(mode, question, csv_file_name, expected, latency_ms=0, workdir=None):
+    """运行一个 (模式, 问题) 组合，返回耗时、往返次数、token 和是否正确
+
+    repl 模式在 workdir 下独立目录中的子进程里运行，每个用例都是全新的 REPL 状态
+    """
+    if mode == "repl":
+        measured = measure_case_in_subprocess(mode, question, csv_file_name, latency_ms, workdir)
+    else:
+        measured = measure_case(mode, question, csv_file_name, latency_ms)
+    answer = measured.pop("answer")
+    correct = answer == expected if question != "high_cpu" else sorted(answer or []) == expected
+    return {"mode": mode, "question": question, **measured, "correct": correct}
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, modes=MODES, instances=DEFAULT_INSTANCES, latency_ms=0, workdir=None):
+    """对每个数据规模、每种模式跑完整问题集，返回逐条结果和按 (模式, 规模) 汇总的结果
+
+    数据集和 REPL 状态写在 workdir 下；不指定时使用临时目录，结束后删除
+    """
+    if workdir is None:
+        with tempfile.TemporaryDirectory(prefix="ec2_bench_") as tmp:
+            return run_benchmark(sizes, modes, instances, latency_ms, tmp)
+
+    cases, rows = [], []
+    for size in sizes:
+        csv_file_name = generate_dataset(os.path.join(workdir, f"ec2_metrics_{size}.csv"), size, instances)
+        expected = ground_truth(csv_file_name)
+        for mode in modes:
+            results = [run_case(mode, q, csv_file_name, expected[q], latency_ms, workdir) for q in QUESTIONS]
+            cases += [{**r, "rows": size} for r in results]
+            rows.append({
+                "mode": mode,
+                "rows": size,
+                "file_bytes": os.path.getsize(csv_file_name),
+                "latency_ms": round(sum(r["latency_ms"] for r in results), 1),
+                "round_trips": sum(r["round_trips"] for r in results),
+                "tool_calls": sum(r["tool_calls"] for r in results),
+                "input_tokens": sum(r["input_tokens"] for r in results),
+                "output_tokens": sum(r["output_tokens"] for r in results),
+                "correct": f"{sum(r['correct'] for r in results)}/{len(results)}"
+            })
+    return {"cases": cases, "summary": rows, "scaling": scaling_report(rows)}
+
+
+def scaling_report(rows):
+    """每种模式从最小到最大数据规模，耗时和输入 token 的增长倍数"""
+    report = {}
+    for mode in dict.fromkeys(r["mode"] for r in rows):
+        mode_rows = sorted((r for r in rows if r["mode"] == mode), key=lambda r: r["rows"])
+        first, last = mode_rows[0], mode_rows[-1]
+        report[mode] = {
+            "rows_growth": round(last["rows"] / first["rows"], 1),
+            "latency_growth": round(last["latency_ms"] / max(first["latency_ms"], 1e-9), 1),
+            "input_token_growth": round(last["input_tokens"] / max(first["input_tokens"], 1), 1),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="repl/file/tools 分析模式基准测试（替身模型，不调用 Bedrock）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="数据集行数")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="要测试的模式")
+    parser.add_argument("--instances", type=int, default=DEFAULT_INSTANCES, help="实例数量")
+    parser.add_argument("--latency_ms", type=int, default=0, help="替身模型每次调用的模拟延迟")
+    parser.add_argument("--output", help="把完整结果写入 JSON 文件")
+    # 内部使用：在子进程中运行单个用例，把结果以 JSON 打印到标准输出
+    parser.add_argument("--measure_case", nargs=3, metavar=("MODE", "QUESTION", "CSV"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_case:
+        mode, question, csv_file_name = args.measure_case
+        print(json.dumps(measure_case(mode, question, csv_file_name, args.latency_ms), ensure_ascii=False))
+        return
+
+    results = run_benchmark(args.sizes, args.modes, args.instances, args.latency_ms)
+    print(pd.DataFrame(results["summary"]).to_string(index=False))
+    print("\n规模增长倍数:")
+    print(pd.DataFrame(results["scaling"]).T.to_string())
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
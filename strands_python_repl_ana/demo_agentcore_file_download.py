@@ -3,21 +3,25 @@
 演示如何从 CodeInterpreter 沙箱下载生成的文件
 """
 
-from bedrock_agentcore.tools.code_interpreter_client import CodeInterpreter
+import atexit
 import json
 import base64
 from typing import Dict, Any, List, Optional
 
-# 初始化 CodeInterpreter
-code_client = CodeInterpreter('ap-northeast-1')
-code_client.start(session_timeout_seconds=1200)
+from session_pool import SandboxSessionPool
+from sandbox_stream import invoke_and_collect, print_output
+from sandbox_download import download_files
 
+# 一次性脚本只需要一个会话：单独启动 size=1 的会话池（仍有保活），
+# 进程退出时关闭会话，示例中途失败也会执行
+session_pool = SandboxSessionPool(size=1).start()
+atexit.register(session_pool.close)
+code_client = session_pool.acquire()
 
-def call_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-    """调用沙箱工具"""
-    response = code_client.invoke(tool_name, arguments)
-    for event in response["stream"]:
-        return event["result"]
+
+def call_tool(tool_name: str, arguments: Dict[str, Any], on_output=None) -> Dict[str, Any]:
+    """调用沙箱工具，消费完整的事件流；on_output 在每个 stdout/stderr 片段到达时调用"""
+    return invoke_and_collect(code_client, tool_name, arguments, on_output)
 
 
 def download_file(file_path: str, local_path: Optional[str] = None) -> Optional[bytes]:
@@ -113,24 +117,16 @@ def list_files(path: str = "") -> List[Dict[str, str]]:
 def execute_code(code: str) -> Dict[str, Any]:
     """在沙箱中执行代码"""
     print(f"\n🐍 执行代码:\n{code}\n")
+    print("📤 输出:")
+    # 输出边执行边打印，不等代码跑完
     result = call_tool("executeCode", {
         "code": code,
         "language": "python",
         "clearContext": False
-    })
+    }, on_output=print_output)
     
     if result.get("isError"):
         print(f"❌ 执行失败: {result}")
-    else:
-        # 打印输出
-        structured = result.get("structuredContent", {})
-        stdout = structured.get("stdout", "")
-        stderr = structured.get("stderr", "")
-        
-        if stdout:
-            print(f"📤 输出:\n{stdout}")
-        if stderr:
-            print(f"⚠️ 错误:\n{stderr}")
     
     return result
 
@@ -266,18 +262,22 @@ print(f"\n找到 {len(all_files)} 个项目")
 downloadable_files = [f for f in all_files if f["type"] == "file"]
 print(f"其中 {len(downloadable_files)} 个是文件\n")
 
-# 下载所有文件
+# 只下载我们生成的文件（跳过系统文件）
+selected = []
 for file_info in downloadable_files:
     filename = file_info["name"]
-    mime_type = file_info.get("mimeType", "")
-    
-    # 只下载我们生成的文件（跳过系统文件）
     if any(filename.endswith(ext) for ext in ['.csv', '.png', '.json', '.txt', '.xlsx']):
-        print(f"📥 下载: {filename} ({mime_type})")
-        download_file(filename, f'downloaded_{filename}')
+        selected.append(filename)
     else:
         print(f"⏭️  跳过: {filename}")
 
+# 多个路径合并到一次 readFiles，批次并行；按哈希清单只下载有变化的文件，再次运行时未变化的文件直接跳过
+for attempt in ("首次同步", "再次同步"):
+    report = download_files(code_client, selected, prefix="downloaded_")
+    print(f"{attempt}: 下载 {len(report['fetched'])} 个，跳过 {len(report['skipped'])} 个，"
+          f"失败 {len(report['failed'])} 个，{report['bytes']} bytes，{report['batches']} 批，"
+          f"耗时 {report['seconds']:.2f} s，{report['mb_per_s']} MB/s\n")
+
 
 print("\n" + "=" * 70)
 print("✅ 所有示例完成！")
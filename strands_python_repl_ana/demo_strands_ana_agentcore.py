@@ -1,13 +1,27 @@
-from bedrock_agentcore.tools.code_interpreter_client import CodeInterpreter
-from strands import Agent, tool
+from strands import Agent, ToolContext, tool
 from strands.models import BedrockModel
 import json
+import os
+import sys
 import pandas as pd
+from pathlib import Path
 from typing import Dict, Any, List
 
-# Initialize the Code Interpreter within a supported AWS region.
-code_client = CodeInterpreter('ap-northeast-1')
-code_client.start(session_timeout_seconds=1200)
+# 仓库根目录下的 Bedrock 录制/回放封装
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bedrock_replay import wrap_bedrock_model
+
+from result_store import ToolResultCompactor, fetch_tool_result
+from sandbox_upload import format_upload_report
+from sandbox_bootstrap import bootstrap_session, describe_sandbox_datasets, DEFAULT_SANDBOX_DATASETS
+from session_pool import get_session_pool
+from sandbox_stream import invoke_and_collect, stream_invoke, print_output
+from sandbox_executor import SandboxToolExecutor, sandbox_session, unavailable_names
+
+# Warm Code Interpreter sessions are started and kept alive in the background by the pool;
+# one is leased below and always returned at the end of the run.
+session_pool = get_session_pool()
+code_client = None
 
 def get_token_stats_from_trace(trace):
     """Extract token usage statistics from trace result."""
@@ -37,26 +51,6 @@ def get_token_stats_from_trace(trace):
     return stats
 
 
-def read_file(file_path: str) -> str:
-    """Helper function to read file content with error handling"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-    except FileNotFoundError:
-        print(f"Error: The file '{file_path}' was not found.")
-        return ""
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return ""
-
-data_file_content = read_file("data/data.csv")
-
-files_to_create = [
-                {
-                    "path": "data.csv",
-                    "text": data_file_content
-                }]
-
 def call_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """Helper function to invoke sandbox tools
 
@@ -67,19 +61,7 @@ def call_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: JSON formatted result
     """
-    response = code_client.invoke(tool_name, arguments)
-    for event in response["stream"]:
-        return json.dumps(event["result"])
-
-# Write files to sandbox
-writing_files = call_tool("writeFiles", {"content": files_to_create})
-print("Writing files result:")
-print(writing_files)
-
-# Verify files were created
-listing_files = call_tool("listFiles", {"path": ""})
-print("\nFiles in sandbox:")
-print(listing_files)
+    return json.dumps(invoke_and_collect(code_client, tool_name, arguments))
 
 SYSTEM_PROMPT = """You are a helpful AI assistant that validates all answers through code execution using the tools provided. DO NOT Answer questions without using the tools
 
@@ -96,6 +78,8 @@ APPROACH:
 - If implementing algorithms, include test cases to prove correctness
 - Document your validation process for transparency
 - The sandbox maintains state between executions, so you can refer to previous results
+- Registered datasets are already loaded as DataFrames (see PRELOADED VARIABLES below)
+- To run several execute_python calls of the same turn in parallel, set independent=true on each of them; they then run in separate sandboxes that only share the preloaded DataFrames, so each must be self-contained. Later calls that read a variable are sent to the sandbox that defined it, but code that combines variables defined by different parallel calls cannot see all of them: recompute them in one call instead. Leave independent unset when code depends on variables from other calls in the same turn
 
 TOOL AVAILABLE:
 - execute_python: Run Python code and see output
@@ -114,9 +98,16 @@ Be thorough, accurate, and always validate your answers when possible."""
 
 
 #Define and configure the code interpreter tool
-@tool
-def execute_python(code: str, description: str = "") -> str:
-    """Execute Python code in the sandbox."""
+@tool(context=True)
+async def execute_python(code: str, description: str = "", independent: bool = False, tool_context: ToolContext = None):
+    """Execute Python code in the sandbox.
+
+    Args:
+        code: Python code to execute
+        description: Short description of what the code does
+        independent: True if this call does not use variables from other calls in the same turn and may run in
+            parallel in a separate sandbox
+    """
 
     if description:
         code = f"# {description}\n{code}"
@@ -125,37 +116,91 @@ def execute_python(code: str, description: str = "") -> str:
     print(f"\n Generated Code: {code}")
 
 
-    # Call the Invoke method and execute the generated code, within the initialized code interpreter session
-    response = code_client.invoke("executeCode", {
-        "code": code,
-        "language": "python",
-        "clearContext": False
-    })
-    for event in response["stream"]:
-        return json.dumps(event["result"])
+    # Execute the generated code in the session assigned to this call: the session that defined the variables
+    # it reads, a separate session for independent calls running in parallel, otherwise the main session.
+    # stdout/stderr fragments are printed to the console and yielded to the agent callback as they arrive;
+    # the last yield is the merged result.
+    missing = unavailable_names(tool_context)
+    async with sandbox_session(tool_context, code_client) as client:
+        async for event in stream_invoke(client, "executeCode", {
+            "code": code,
+            "language": "python",
+            "clearContext": False
+        }, on_output=print_output):
+            if "result" in event:
+                result = event["result"]
+                if missing:
+                    result = {**result, "note": f"Variables {', '.join(missing)} were defined by a parallel call in "
+                                                f"another sandbox and do not exist here; recompute them in this call"}
+                yield json.dumps(result)
+            else:
+                yield event
 
 
 model_id="global.anthropic.claude-haiku-4-5-20251001-v1:0"
-model= BedrockModel(model_id=model_id)
-
-#configure the strands agent including the model and tool(s)
-agent=Agent(
-    model=model,
-        tools=[execute_python],
-        system_prompt=SYSTEM_PROMPT,
-        callback_handler=None)
-
-query = "Load the file 'data.csv' and perform exploratory data analysis(EDA) on it. Tell me about distributions and outlier values."
-
-response_text = ""
-r1 = agent(query)
-print(r1)
-print("Token 消耗情况：\n" + json.dumps(get_token_stats_from_trace(r1)))
-    
-
-query = "Within the file 'data.csv', how many individuals with the first name 'Kimberly' have 'Crocodile' as their favourite animal?"
-
-response_text = ""
-r2 = agent(query)
-print(r2)
-print("Token 消耗情况：\n" + json.dumps(get_token_stats_from_trace(r2)))
\ No newline at end of file
+model= wrap_bedrock_model(BedrockModel(model_id=model_id))
+
+# 设置 COMPACT_TOOL_RESULTS=1 后，超过 TOOL_RESULT_MAX_CHARS（默认 4000）的输出压缩为摘要 + 结果句柄；默认关闭
+compactor = ToolResultCompactor() if os.getenv("COMPACT_TOOL_RESULTS", "0") == "1" else None
+COMPACT_PROMPT = """
+
+LONG OUTPUTS: Long outputs are replaced by a summary with a result handle (res-...); use the fetch_tool_result tool to read specific lines of the full output"""
+
+# Lease a session for this run
+code_client = session_pool.acquire()
+tool_executor = None
+try:
+    # Write files to sandbox and load them into named DataFrames in the kernel. Uploads are skipped when the
+    # session already holds the same content, otherwise compressed chunks are uploaded in parallel, reassembled
+    # and checksummed in the sandbox.
+    preloaded = bootstrap_session(code_client, DEFAULT_SANDBOX_DATASETS)
+    print("Writing files result:")
+    for name, info in preloaded.items():
+        print(format_upload_report(info["upload"]))
+        print(f"{name}: {info['rows']} rows x {len(info['columns'])} columns loaded from {info['remote_path']}")
+
+    # Verify files were created
+    listing_files = call_tool("listFiles", {"path": ""})
+    print("\nFiles in sandbox:")
+    print(listing_files)
+
+    # execute_python calls marked independent run concurrently, each on its own leased session (bootstrapped
+    # with the same datasets); results are gathered in call order and follow-up calls go to the session holding
+    # the variables they read
+    tool_executor = SandboxToolExecutor(
+        session_pool, code_client,
+        bootstrap=lambda client: bootstrap_session(client, DEFAULT_SANDBOX_DATASETS))
+
+    #configure the strands agent including the model and tool(s)
+    agent=Agent(
+        model=model,
+            tools=[execute_python, fetch_tool_result] if compactor else [execute_python],
+            system_prompt=SYSTEM_PROMPT + (COMPACT_PROMPT if compactor else "") + "\n\n"
+                          + describe_sandbox_datasets(preloaded),
+            hooks=[compactor] if compactor else [],
+            tool_executor=tool_executor,
+            callback_handler=None)
+
+    query = "Load the file 'data.csv' and perform exploratory data analysis(EDA) on it. Tell me about distributions and outlier values."
+
+    response_text = ""
+    r1 = agent(query)
+    print(r1)
+    print("Token 消耗情况：\n" + json.dumps(get_token_stats_from_trace(r1)))
+
+
+    query = "Within the file 'data.csv', how many individuals with the first name 'Kimberly' have 'Crocodile' as their favourite animal?"
+
+    response_text = ""
+    r2 = agent(query)
+    print(r2)
+    print("Token 消耗情况：\n" + json.dumps(get_token_stats_from_trace(r2)))
+    if compactor:
+        print("输出压缩统计：\n" + json.dumps(compactor.stats))
+    print("并发执行统计：\n" + json.dumps(tool_executor.stats))
+finally:
+    # Reset the sessions and return them to the pool, also when a run fails
+    if tool_executor is not None:
+        tool_executor.release()
+    session_pool.release(code_client)
+print("会话池统计：\n" + json.dumps(session_pool.stats))
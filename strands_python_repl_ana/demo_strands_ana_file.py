@@ -5,14 +5,33 @@
 """
 
 import os
+import sys
 import json
+import glob
 import argparse
-from strands import Agent
+import functools
+from pathlib import Path
+import pandas as pd
+from strands import Agent, tool
 from strands_tools import calculator, file_read, shell, python_repl
 from strands.models import BedrockModel
 
 from strands.hooks import AfterToolCallEvent
 
+# 仓库根目录下的 Bedrock 录制/回放封装
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bedrock_replay import wrap_bedrock_model
+
+from metrics_summary import load_metrics, summarize_metrics, format_summary_csv, get_metrics_slice
+from metrics_engine import METRICS_TOOLS, get_engine
+from metrics_anomaly import detect_anomalies, DETECTORS
+from metrics_stream import (aggregate_csv_streaming, aggregate_files, stream_metrics_slice, should_stream,
+                            DEFAULT_CHUNKSIZE)
+from repl_worker import persistent_python_repl, describe_datasets, get_worker
+from exec_cache import ExecutionCache, make_cached_python_repl, run_python_repl
+from tool_profiler import ToolProfiler
+from result_store import ToolResultCompactor, fetch_tool_result
+
 
 from strands.agent.conversation_manager import (
     NullConversationManager,
@@ -48,6 +67,82 @@ def event_loop_tracker(**kwargs):
 
 os.environ["BYPASS_TOOL_CONSENT"] = "true"
 
+METRICS_CSV = 'data/ec2_metrics.csv'
+
+
+@functools.lru_cache(maxsize=4)
+def _load_metrics_cached(csv_file_name: str):
+    return load_metrics(csv_file_name)
+
+
+@tool
+def query_metrics_slice(instance_id: str = "", start_time: str = "", end_time: str = "",
+                        columns: list = None, limit: int = 50) -> str:
+    """按实例和时间范围下钻查询 EC2 原始监控数据
+
+    Args:
+        instance_id: 实例 ID，为空表示所有实例
+        start_time: 起始时间（含），例如 "2024-12-26 08:00:00"，为空表示不限
+        end_time: 结束时间（含），为空表示不限
+        columns: 需要的指标列，可选 cpu_usage, memory_usage, disk_usage，默认全部
+        limit: 最多返回的行数，默认 50
+
+    Returns:
+        CSV 格式的明细数据
+    """
+    if should_stream(METRICS_CSV):
+        # 大文件不整体加载，分块扫描到够 limit 行为止
+        rows = stream_metrics_slice(METRICS_CSV, instance_id, start_time, end_time, columns, limit)
+    else:
+        rows = get_metrics_slice(_load_metrics_cached(METRICS_CSV), instance_id, start_time, end_time, columns, limit)
+    return rows.to_csv(index=False)
+
+
+@tool
+def detect_metric_anomalies(metrics: list = None, detectors: list = None, threshold: float = 3.0,
+                            window: int = 24, min_detectors: int = 1, instance_id: str = "",
+                            top_n: int = 10) -> str:
+    """检测所有 EC2 实例 CPU/内存/磁盘指标的异常时间窗口，按异常程度排序
+
+    检测器：rolling_zscore（与之前 window 个采样点比较）、ewma（与指数加权均值比较）、
+    seasonal（与同一实例一天内同一时段的均值比较）
+
+    Args:
+        metrics: 指标列表，可选 cpu_usage, memory_usage, disk_usage，默认全部
+        detectors: 检测器列表，默认全部
+        threshold: 异常得分阈值（标准差倍数），默认 3.0
+        window: rolling_zscore 的历史窗口采样点数，默认 24
+        min_detectors: 至少多少个检测器同时报警才算异常，默认 1
+        instance_id: 只看某个实例，为空表示所有实例
+        top_n: 返回的异常窗口数，默认 10
+
+    Returns:
+        JSON 列表，每项包含 rank、instance_id、metric、起止时间、采样点数、峰值及得分、报警的检测器
+    """
+    try:
+        windows = detect_anomalies(get_engine(METRICS_CSV), metrics, detectors or DETECTORS, window,
+                                   threshold, min_detectors, instance_id, top_n)
+    except ValueError as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+    return json.dumps(windows, ensure_ascii=False)
+
+
+@tool
+def summarize_metrics_file(csv_file_name: str, chunksize: int = DEFAULT_CHUNKSIZE) -> str:
+    """分块流式读取监控 CSV，返回每台实例的统计摘要（均值、最值、分位数、采样数、时间范围）
+
+    适用于无法一次性载入内存的大文件，内存占用只与实例数量有关
+
+    Args:
+        csv_file_name: CSV 文件路径，需包含 timestamp, instance_id, cpu_usage, memory_usage, disk_usage 列
+        chunksize: 每块读取的行数，默认 200000
+
+    Returns:
+        CSV 格式的实例摘要，分位数为直方图草图估算值
+    """
+    return format_summary_csv(aggregate_csv_streaming(csv_file_name, chunksize).summary_frame())
+
+
 system_prompt = """作为监控系统专家，仔细分析监控指标"""
 
 def create_bedrock_model(cache_tools: bool = False):
@@ -57,18 +152,38 @@ def create_bedrock_model(cache_tools: bool = False):
         cache_tools: 是否启用 tools prompt cache
     """
     if cache_tools:
-        return BedrockModel(
+        model = BedrockModel(
             model_id="global.anthropic.claude-sonnet-4-5-20250929-v1:0",
             region_name="ap-northeast-1",
             temperature=0.3,
             cache_tools="default"
         )
     else:
-        return BedrockModel(
+        model = BedrockModel(
             model_id="global.anthropic.claude-sonnet-4-5-20250929-v1:0",
             region_name="ap-northeast-1",
             temperature=0.3
         )
+    # BEDROCK_REPLAY_MODE=record/replay 时录制或回放模型调用
+    return wrap_bedrock_model(model)
+
+
+def attach_profiler(agent, profile_path: str = None):
+    """指定了 profile_path 时给 Agent 挂上性能剖析 hook"""
+    if not profile_path:
+        return None
+    profiler = ToolProfiler()
+    agent.hooks.add_hook(profiler)
+    return profiler
+
+
+def report_profile(profiler, profile_path: str = None):
+    """导出 Chrome trace 并打印耗时汇总"""
+    if profiler is None:
+        return
+    profiler.export_chrome_trace(profile_path)
+    print("\n------------------\n⏱️ 性能剖析（trace 已写入 " + profile_path + "，可用 chrome://tracing 或 ui.perfetto.dev 打开）:")
+    print(profiler.summary())
 
 
 def get_token_stats_from_trace(trace):
@@ -99,43 +214,65 @@ def get_token_stats_from_trace(trace):
     return stats
 
 
-def analyze_ec2_metrics_file(cache_tools: bool = False):
+def analyze_ec2_metrics_file(cache_tools: bool = False, raw_file: bool = False, chunksize: int = None,
+                             profile_path: str = None):
     """使用 Strands Agent 分析 EC2 性能数据
     
     Args:
         cache_tools: 是否启用 prompt cache
+        raw_file: 是否直接发送原始 CSV（默认发送本地预聚合后的实例摘要）
+        chunksize: 分块流式聚合的块大小；为空时按文件大小自动选择整体加载或流式聚合
+        profile_path: 性能剖析 trace 的输出路径，为空表示不剖析
     """
     
     print("=" * 70)
     print("Strands Agent File content 演示")
     print("分析 EC2 服务器性能数据")
     print(f"Prompt Cache: {'✅ 已启用' if cache_tools else '❌ 未启用'}")
+    print(f"文件内容: {'原始 CSV' if raw_file else '实例摘要（本地预聚合）'}")
     print("=" * 70)
     print()
 
-    # 创建 Strands Agent（自动包含 python_repl tool）
+    # 创建 Strands Agent；摘要模式下附带下钻工具，按需拉取明细
     agent = Agent(
         model=create_bedrock_model(cache_tools),
         system_prompt=system_prompt,
-        tools=[file_read, calculator],
+        tools=[file_read, calculator] if raw_file else [file_read, calculator, query_metrics_slice,
+                                                         detect_metric_anomalies],
         callback_handler=None
     )
+    profiler = attach_profiler(agent, profile_path)
 
     # 构建分析请求
-    csv_file_name = 'data/ec2_metrics.csv'
+    csv_file_name = METRICS_CSV
 
-    with open(csv_file_name, "rb") as fp:
-        csv_bytes = fp.read()
+    if raw_file:
+        with open(csv_file_name, "rb") as fp:
+            csv_bytes = fp.read()
+        document_name = "ec2_metrics"
+        data_note = ""
+    else:
+        # 本地把逐行数据聚合成每台实例一行的摘要，输入 token 不再随行数增长
+        if chunksize or should_stream(csv_file_name):
+            # 大文件分块读取，内存占用与文件大小无关
+            summary = aggregate_csv_streaming(csv_file_name, chunksize or DEFAULT_CHUNKSIZE).summary_frame()
+        else:
+            summary = summarize_metrics(_load_metrics_cached(csv_file_name))
+        csv_bytes = format_summary_csv(summary).encode("utf-8")
+        document_name = "ec2_metrics_summary"
+        data_note = "附件是按实例预聚合后的统计摘要（均值、最值、分位数、采样数），如需查看明细请使用 query_metrics_slice 工具。"
+        print(f"📉 原始数据 {os.path.getsize(csv_file_name)} 字节 -> 摘要 {len(csv_bytes)} 字节")
 
     user_prompt = f"""
 我有一份 EC2 服务器的性能监控数据（CSV 格式），请找出平均 CPU 使用率大于 75% 的机器; 2. 平均 CPU 使用率 Top3 的机器
+{data_note}
 """
     analysis_request = [
         {"text": user_prompt},
         {
             "document": {
                 "format": "csv",
-                "name": "ec2_metrics",
+                "name": document_name,
                 "source": {
                     "bytes": csv_bytes
                 }
@@ -155,30 +292,62 @@ def analyze_ec2_metrics_file(cache_tools: bool = False):
     print(trace)
     stats = get_token_stats_from_trace(trace)
     print("------------------\n 📊 Token 使用统计:" + json.dumps(stats, indent=4))
+    report_profile(profiler, profile_path)
 
 
 
-def analyze_ec2_metrics_repl(cache_tools: bool = False):
+def analyze_ec2_metrics_repl(cache_tools: bool = False, persistent_repl: bool = False, exec_cache: bool = False,
+                             profile_path: str = None, compact_results: bool = False, metrics_tools: bool = False):
     """使用 Strands Agent 分析 EC2 性能数据
     
     Args:
         cache_tools: 是否启用 prompt cache
+        persistent_repl: 是否使用常驻预热的 REPL 工作进程（预导入常用库、数据集常驻内存）
+        exec_cache: 是否在 python_repl 前加执行结果缓存
+        profile_path: 性能剖析 trace 的输出路径，为空表示不剖析
+        compact_results: 是否把过长的 python_repl 输出压缩为摘要 + 结果句柄
+        metrics_tools: 是否同时提供列式指标引擎工具（阈值过滤、Top-K 等一次工具调用即可回答）
     """
     
     print("=" * 70)
     print("Strands Agent Python REPL 演示")
     print("分析 EC2 服务器性能数据")
     print(f"Prompt Cache: {'✅ 已启用' if cache_tools else '❌ 未启用'}")
+    print(f"REPL: {'常驻工作进程' if persistent_repl else 'strands_tools python_repl'}")
+    print(f"执行缓存: {'✅ 已启用' if exec_cache else '❌ 未启用'}")
+    print(f"指标引擎工具: {'✅ 已启用' if metrics_tools else '❌ 未启用'}")
     print("=" * 70)
     print()
 
+    # 几种 REPL 工具的工具名都是 python_repl，代码日志 hook 不受影响
+    repl_tool = persistent_python_repl if persistent_repl else python_repl
+    cache = None
+    if exec_cache:
+        if persistent_repl:
+            worker = get_worker()
+            # 工作进程预置的变量不算 REPL 状态，背后的数据文件哈希计入缓存键
+            cache = ExecutionCache(known_names=worker.provided_names(),
+                                   known_files=[spec["path"] for spec in worker.datasets.values()])
+            repl_tool = make_cached_python_repl(cache, lambda code: persistent_python_repl(code=code))
+        else:
+            cache = ExecutionCache()
+            repl_tool = make_cached_python_repl(cache, run_python_repl)
+
     # 创建 Strands Agent（自动包含 python_repl tool）
     agent = Agent(
         model=create_bedrock_model(cache_tools),
         system_prompt=system_prompt,
-        tools=[python_repl, file_read, shell, calculator],
+        tools=[repl_tool, file_read, shell, calculator, summarize_metrics_file]
+              + (METRICS_TOOLS if metrics_tools else [])
+              + ([fetch_tool_result] if compact_results else []),
         callback_handler=None
     )
+    profiler = attach_profiler(agent, profile_path)
+    compactor = None
+    if compact_results:
+        # 超长输出只在对话里留摘要，完整内容按句柄取回，后续每轮的输入 token 不再被大表撑大
+        compactor = ToolResultCompactor()
+        agent.hooks.add_hook(compactor)
     agent.hooks.add_callback(AfterToolCallEvent, log_python_repl_code)
 
     # 构建分析请求
@@ -186,6 +355,14 @@ def analyze_ec2_metrics_repl(cache_tools: bool = False):
     analysis_request = f"""
 我有一份 EC2 服务器的性能监控数据（CSV 格式），存储在{csv_file_name}，请找出: 1.平均 CPU 使用率大于 75% 的机器; 2. 平均 CPU 使用率 Top3 的机器
 """
+    if should_stream(csv_file_name):
+        analysis_request += """该文件很大，请不要一次性读入内存：可以直接用 summarize_metrics_file 工具得到每台实例的摘要，
+或者在 python_repl 中用 pandas.read_csv(..., chunksize=...) 分块处理。
+"""
+    if persistent_repl:
+        analysis_request += describe_datasets() + "\n"
+    if metrics_tools:
+        analysis_request += f"{csv_file_name} 已加载到指标引擎中，阈值过滤、Top-K、分位数和时间桶聚合可以直接调用 metrics_* 工具，不需要编写 pandas 代码。\n"
     print("👤 用户请求:")
     print("-" * 70)
     print("分析 EC2 服务器性能数据...")
@@ -202,6 +379,126 @@ def analyze_ec2_metrics_repl(cache_tools: bool = False):
 
     stats = get_token_stats_from_trace(trace)
     print("\n------------------\n📊 Token 使用统计:" + json.dumps(stats, indent=2))
+    if cache is not None:
+        print("🗄️ 执行缓存统计:" + json.dumps(cache.stats))
+    if compactor is not None:
+        print("🗜️ 输出压缩统计:" + json.dumps(compactor.stats))
+    report_profile(profiler, profile_path)
+
+
+def analyze_ec2_metrics_tools(cache_tools: bool = False, profile_path: str = None):
+    """使用列式指标引擎工具分析 EC2 性能数据
+
+    CSV 只加载一次到 NumPy 数组，阈值过滤、Top-K、分位数、时间桶聚合都由工具直接完成，
+    不需要模型每次生成 pandas 代码
+
+    Args:
+        cache_tools: 是否启用 prompt cache
+        profile_path: 性能剖析 trace 的输出路径，为空表示不剖析
+    """
+
+    print("=" * 70)
+    print("Strands Agent 指标引擎工具演示")
+    print("分析 EC2 服务器性能数据")
+    print(f"Prompt Cache: {'✅ 已启用' if cache_tools else '❌ 未启用'}")
+    print("=" * 70)
+    print()
+
+    agent = Agent(
+        model=create_bedrock_model(cache_tools),
+        system_prompt=system_prompt,
+        tools=METRICS_TOOLS + [detect_metric_anomalies, query_metrics_slice, calculator],
+        callback_handler=None
+    )
+    profiler = attach_profiler(agent, profile_path)
+
+    analysis_request = """
+我有一份 EC2 服务器的性能监控数据，已加载到指标引擎中，请找出: 1.平均 CPU 使用率大于 75% 的机器; 2. 平均 CPU 使用率 Top3 的机器
+"""
+    print("👤 用户请求:")
+    print("-" * 70)
+    print("分析 EC2 服务器性能数据...")
+    print()
+
+    print("🤖 Strands Agent 开始工作...\n")
+
+    trace = agent(analysis_request)
+
+    print("\n------------------\n🤖 Strands Agent 结果:")
+    print(trace)
+
+    stats = get_token_stats_from_trace(trace)
+    print("\n------------------\n📊 Token 使用统计:" + json.dumps(stats, indent=2))
+    report_profile(profiler, profile_path)
+
+
+def expand_files(patterns):
+    """展开文件列表中的通配符，去重并保持顺序"""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        files += [f for f in matches if f not in files]
+    return files
+
+
+def analyze_ec2_metrics_fleet(files: list, cache_tools: bool = False, workers: int = None,
+                              chunksize: int = DEFAULT_CHUNKSIZE, profile_path: str = None):
+    """多文件（按区域/账号拆分的监控数据）map-reduce 分析
+
+    每个文件在进程池中流式聚合，主进程合并成全局的实例摘要，只有摘要发给 Agent；
+    分析耗时随 CPU 核数而不是文件数量扩展
+
+    Args:
+        files: 文件路径或通配符列表
+        cache_tools: 是否启用 prompt cache
+        workers: 进程数，默认 CPU 核数
+        chunksize: 每块读取的行数
+        profile_path: 性能剖析 trace 的输出路径，为空表示不剖析
+    """
+    csv_files = expand_files(files)
+    if not csv_files:
+        raise FileNotFoundError(f"没有匹配的文件: {' '.join(files)}")
+
+    print("=" * 70)
+    print("Strands Agent 多文件汇总分析演示")
+    print("分析 EC2 服务器性能数据")
+    print(f"Prompt Cache: {'✅ 已启用' if cache_tools else '❌ 未启用'}")
+    print(f"文件数: {len(csv_files)}，进程数: {workers or os.cpu_count()}")
+    print("=" * 70)
+    print()
+
+    merged, overviews = aggregate_files(csv_files, max_workers=workers, chunksize=chunksize)
+    summary_bytes = format_summary_csv(merged.summary_frame()).encode("utf-8")
+    overview_bytes = pd.DataFrame(overviews).to_csv(index=False).encode("utf-8")
+    raw_bytes = sum(os.path.getsize(f) for f in csv_files)
+    print(f"📉 {len(csv_files)} 个文件共 {raw_bytes} 字节、{merged.rows} 行 -> 摘要 {len(summary_bytes) + len(overview_bytes)} 字节")
+
+    agent = Agent(
+        model=create_bedrock_model(cache_tools),
+        system_prompt=system_prompt,
+        tools=[calculator],
+        callback_handler=None
+    )
+    profiler = attach_profiler(agent, profile_path)
+
+    user_prompt = """
+我有多份 EC2 服务器的性能监控数据（按区域/账号拆分），已在本地汇总为全局的实例摘要，请找出: 1.平均 CPU 使用率大于 75% 的机器; 2. 平均 CPU 使用率 Top3 的机器
+附件 fleet_summary 是合并后每台实例的统计摘要（均值、最值、分位数、采样数），file_overview 是每个文件的概况。
+"""
+    analysis_request = [
+        {"text": user_prompt},
+        {"document": {"format": "csv", "name": "fleet_summary", "source": {"bytes": summary_bytes}}},
+        {"document": {"format": "csv", "name": "file_overview", "source": {"bytes": overview_bytes}}}
+    ]
+
+    print("🤖 Strands Agent 开始工作...\n")
+
+    trace = agent(analysis_request)
+    print("\n------------------\n🤖 Strands Agent 结果:")
+    print(trace)
+    stats = get_token_stats_from_trace(trace)
+    print("------------------\n 📊 Token 使用统计:" + json.dumps(stats, indent=4))
+    report_profile(profiler, profile_path)
 
 
 if __name__ == "__main__":
@@ -211,9 +508,58 @@ if __name__ == "__main__":
     parser.add_argument(
         '--mode',
         type=str,
-        choices=['repl', 'file'],
+        choices=['repl', 'file', 'tools', 'fleet'],
         default='repl',
-        help='选择分析模式: repl (使用 Python REPL) 或 file (直接传递文件内容)，默认为 repl'
+        help='选择分析模式: repl (使用 Python REPL)、file (直接传递文件内容)、tools (列式指标引擎工具) 或 fleet (多文件汇总)，默认为 repl'
+    )
+    parser.add_argument(
+        '--files',
+        nargs='+',
+        default=['data/*.csv'],
+        help='fleet 模式下的文件列表，支持通配符，例如 "data/*/ec2_metrics.csv"'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='fleet 模式下的进程数，默认 CPU 核数'
+    )
+    parser.add_argument(
+        '--raw_file',
+        action='store_true',
+        help='file 模式下直接发送原始 CSV，而不是本地预聚合后的实例摘要'
+    )
+    parser.add_argument(
+        '--chunksize',
+        type=int,
+        default=None,
+        help='file/fleet 模式下按指定行数分块流式聚合（file 模式默认在文件超过 256MB 时自动启用）'
+    )
+    parser.add_argument(
+        '--persistent_repl',
+        action='store_true',
+        help='repl 模式下使用常驻预热的 Python 工作进程（预导入 pandas，数据集常驻内存）'
+    )
+    parser.add_argument(
+        '--exec_cache',
+        action='store_true',
+        help='repl 模式下缓存 python_repl 的执行结果，相同代码且输入文件未变化时不再执行'
+    )
+    parser.add_argument(
+        '--compact_results',
+        action='store_true',
+        help='repl 模式下把过长的 python_repl 输出压缩为摘要，完整内容通过 fetch_tool_result 按句柄取回'
+    )
+    parser.add_argument(
+        '--metrics_tools',
+        action='store_true',
+        help='repl 模式下同时提供列式指标引擎工具（metrics_threshold_filter、metrics_top_k 等）'
+    )
+    parser.add_argument(
+        '--profile',
+        type=str,
+        default=None,
+        help='记录模型/工具调用的性能剖析，并把 Chrome trace JSON 写入指定路径'
     )
     parser.add_argument(
         '--cache_tools',
@@ -225,9 +571,17 @@ if __name__ == "__main__":
 
     try:
         if args.mode == 'repl':
-            analyze_ec2_metrics_repl(cache_tools=args.cache_tools)
+            analyze_ec2_metrics_repl(cache_tools=args.cache_tools, persistent_repl=args.persistent_repl,
+                                     exec_cache=args.exec_cache, profile_path=args.profile,
+                                     compact_results=args.compact_results, metrics_tools=args.metrics_tools)
+        elif args.mode == 'tools':
+            analyze_ec2_metrics_tools(cache_tools=args.cache_tools, profile_path=args.profile)
+        elif args.mode == 'fleet':
+            analyze_ec2_metrics_fleet(args.files, cache_tools=args.cache_tools, workers=args.workers,
+                                      chunksize=args.chunksize or DEFAULT_CHUNKSIZE, profile_path=args.profile)
         else:
-            analyze_ec2_metrics_file(cache_tools=args.cache_tools)
+            analyze_ec2_metrics_file(cache_tools=args.cache_tools, raw_file=args.raw_file, chunksize=args.chunksize,
+                                     profile_path=args.profile)
     except Exception as e:
         print(f"❌ 错误: {e}")
         print("\n请确保：")
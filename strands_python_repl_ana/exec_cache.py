@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+python_repl 执行结果缓存
+同样的问题模型经常生成相同或只差空白/注释的 pandas 代码。缓存键由规范化后的代码和代码读取的文件内容哈希组成，
+命中时直接返回保存的输出并还原输出目录中生成的文件（如图表），不再执行代码；
+命中的代码如果会定义变量或修改状态，会记为待补执行，在下一次真正执行代码之前按顺序补执行，保证 REPL 状态与逐条执行一致；
+缓存条目保存在磁盘上，按最近使用时间做 LRU 淘汰，多次运行 demo 之间也能命中
+"""
+
+import ast
+import builtins
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from strands import tool
+
+from file_hashing import file_hash
+
+DEFAULT_CACHE_DIR = os.getenv("EXEC_CACHE_DIR", ".exec_cache")
+DEFAULT_MAX_ENTRIES = int(os.getenv("EXEC_CACHE_MAX_ENTRIES", "256"))
+# 只有这个目录下生成的文件会作为产物缓存，工作目录中的其他文件（如 repl_state/）不收集
+DEFAULT_OUTPUT_DIR = os.getenv("EXEC_CACHE_OUTPUT_DIR", "output")
+
+# 单个产物文件超过这个大小就不缓存这次执行
+MAX_ARTIFACT_BYTES = 10 * 1024 * 1024
+
+_BUILTIN_NAMES = set(dir(builtins))
+
+
+def normalize_code(code: str) -> str:
+    """去掉注释、空行和格式差异；无法解析时退化为逐行去空白"""
+    try:
+        return ast.unparse(ast.parse(code))
+    except SyntaxError:
+        return "\n".join(line.strip() for line in code.splitlines() if line.strip())
+
+
+def free_names(tree: ast.AST) -> set:
+    """代码中读取但没有在本段代码里定义的名字
+
+    非空说明代码依赖之前调用留下的 REPL 状态，这种代码的结果不能缓存
+    """
+    defined, loaded = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            (loaded if isinstance(node.ctx, ast.Load) else defined).add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(node.name)
+        elif isinstance(node, ast.arg):
+            defined.add(node.arg)
+        elif isinstance(node, ast.alias):
+            defined.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            defined.add(node.name)
+    return loaded - defined - _BUILTIN_NAMES
+
+
+def mutates_state(tree: ast.AST, known_names=()) -> bool:
+    """代码执行后是否可能改变 REPL 状态
+
+    顶层绑定名字（赋值、import、def/class）、给属性或下标赋值、del，或者调用预置变量的方法（如 inplace 操作），
+    都视为会改变状态；只有打印和表达式求值的代码命中缓存后不需要补执行
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+                             ast.Delete, ast.Global, ast.Nonlocal)):
+            return True
+        if isinstance(node, (ast.Name, ast.Attribute, ast.Subscript)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            return True
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and isinstance(node.func.value, ast.Name) and node.func.value.id in known_names):
+            return True
+    return False
+
+
+def referenced_files(tree: ast.AST) -> list:
+    """代码中以字符串常量出现、且确实存在的文件路径"""
+    paths = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and len(node.value) < 1024:
+            if "\n" not in node.value and os.path.isfile(node.value):
+                paths.add(os.path.abspath(node.value))
+    return sorted(paths)
+
+
+def _snapshot(root, skip):
+    """记录输出目录下所有文件的修改时间，用于找出执行生成的产物"""
+    files = {}
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames
+                       if not d.startswith(".") and d != "repl_state"
+                       and os.path.abspath(os.path.join(directory, d)) != skip]
+        for name in filenames:
+            path = os.path.join(directory, name)
+            try:
+                files[os.path.abspath(path)] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+    return files
+
+
+class ExecutionCache:
+    """磁盘上的执行结果缓存，每个条目一个目录：entry.json + 产物文件"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES, known_names=None,
+                 known_files=None, workdir=".", output_dir=DEFAULT_OUTPUT_DIR):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_entries: 最多保留的条目数，超出后淘汰最久未使用的
+            known_names: 执行环境预先提供的变量名（如常驻工作进程里的 pd、ec2_metrics），不视为依赖 REPL 状态
+            known_files: 这些预置变量背后的文件，内容哈希会计入缓存键
+            workdir: 代码执行时的工作目录，产物路径相对于它保存和还原
+            output_dir: 收集产物的目录（相对 workdir），只有这里生成的文件会随缓存条目保存
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_entries = max_entries
+        self.known_names = set(known_names or ())
+        self.known_files = [os.path.abspath(p) for p in (known_files or ())]
+        self.workdir = os.path.abspath(workdir)
+        self.output_dir = os.path.join(self.workdir, output_dir)
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "replayed": 0}
+        # 命中缓存但会改变状态、尚未真正执行的代码，按命中顺序排列
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _analyze(self, code: str):
+        """返回 (缓存键, 不可缓存的原因, 是否改变状态)；代码依赖 REPL 状态或无法解析时缓存键为 None"""
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return None, "语法错误", True
+        unresolved = free_names(tree) - self.known_names
+        if unresolved:
+            return None, f"依赖之前定义的变量: {', '.join(sorted(unresolved))}", True
+
+        # 输出目录里的文件是代码自己生成的产物，不算输入
+        output_dir = os.path.realpath(self.output_dir)
+        inputs = [p for p in referenced_files(tree) if os.path.commonpath([os.path.realpath(p), output_dir]) != output_dir]
+        files = sorted(set(inputs + [p for p in self.known_files if os.path.isfile(p)]))
+        payload = json.dumps({
+            "code": normalize_code(code),
+            "files": [[path, file_hash(path)] for path in files]
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest(), None, mutates_state(tree, self.known_names)
+
+    def cache_key(self, code: str):
+        """返回 (缓存键, 不可缓存的原因)；代码依赖 REPL 状态或无法解析时缓存键为 None"""
+        key, reason, _ = self._analyze(code)
+        return key, reason
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        entry_path = os.path.join(self._entry_dir(key), "entry.json")
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        # 更新修改时间，作为 LRU 的最近使用时间
+        os.utime(entry_path)
+        self._restore_artifacts(key, entry["artifacts"])
+        return entry
+
+    def _restore_artifacts(self, key, artifacts):
+        """把缓存的产物文件放回原位置（内容不同或文件不存在时）；不在输出目录下的产物不还原"""
+        output_dir = os.path.realpath(self.output_dir)
+        for artifact in artifacts:
+            target = os.path.join(self.workdir, artifact["path"])
+            if os.path.commonpath([os.path.realpath(target), output_dir]) != output_dir:
+                continue
+            if os.path.exists(target) and file_hash(target) == artifact["sha256"]:
+                continue
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            shutil.copyfile(os.path.join(self._entry_dir(key), artifact["stored_as"]), target)
+
+    def store(self, key, code, result, artifacts):
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}.{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        stored = []
+        for i, path in enumerate(artifacts):
+            name = f"artifact_{i}{os.path.splitext(path)[1]}"
+            shutil.copyfile(path, os.path.join(tmp_dir, name))
+            stored.append({"path": os.path.relpath(path, self.workdir), "stored_as": name,
+                           "sha256": file_hash(path)})
+        with open(os.path.join(tmp_dir, "entry.json"), "w", encoding="utf-8") as f:
+            json.dump({"code": code, "result": result, "artifacts": stored,
+                       "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, ensure_ascii=False)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name, "entry.json")
+            if os.path.exists(entry_path):
+                entries.append((os.path.getmtime(entry_path), name))
+        entries.sort()
+        for _, name in entries[:max(0, len(entries) - self.max_entries)]:
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            with self._lock:
+                self.stats["evictions"] += 1
+
+    def _replay_pending(self, execute):
+        """按命中顺序补执行之前命中缓存、会改变状态的代码，输出丢弃"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for code in pending:
+            execute(code)
+            with self._lock:
+                self.stats["replayed"] += 1
+
+    def run(self, code: str, execute) -> dict:
+        """命中缓存时直接返回保存的结果，否则调用 execute(code) 执行并在成功时写入缓存
+
+        命中的代码会定义变量或修改状态时，记为待补执行；任何代码真正执行之前先按顺序补执行这些代码，
+        之后的调用看到的 REPL 状态与每段代码都实际执行过一样
+
+        Args:
+            code: 要执行的代码
+            execute: 实际执行代码的函数，返回 {"status", "content"} 形式的工具结果
+
+        Returns:
+            工具结果
+        """
+        key, reason, mutates = self._analyze(code)
+        if key is None:
+            with self._lock:
+                self.stats["bypassed"] += 1
+            self._replay_pending(execute)
+            return execute(code)
+
+        entry = self.lookup(key)
+        if entry is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+                if mutates:
+                    self._pending.append(code)
+            return entry["result"]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        self._replay_pending(execute)
+        before = _snapshot(self.output_dir, self.cache_dir)
+        result = execute(code)
+        if result.get("status") != "success":
+            return result
+
+        after = _snapshot(self.output_dir, self.cache_dir)
+        artifacts = [path for path, mtime in after.items() if before.get(path) != mtime]
+        if any(os.path.getsize(path) > MAX_ARTIFACT_BYTES for path in artifacts):
+            return result
+        self.store(key, code, {"status": result["status"], "content": result["content"]}, artifacts)
+        return result
+
+
+def run_python_repl(code: str) -> dict:
+    """通过 strands_tools 的 python_repl 执行代码（非交互模式，便于捕获输出）"""
+    from strands_tools import python_repl
+
+    result = python_repl.python_repl({"toolUseId": "exec_cache", "input": {"code": code, "interactive": False}})
+    return {"status": result["status"], "content": result["content"]}
+
+
+def make_cached_python_repl(cache: ExecutionCache, execute=run_python_repl):
+    """创建带执行缓存的 python_repl 工具，工具名保持为 python_repl"""
+
+    @tool(name="python_repl")
+    def cached_python_repl(code: str) -> dict:
+        """执行 Python 代码并返回输出；相同代码在输入文件未变化时直接返回缓存的结果
+
+        Args:
+            code: 要执行的 Python 代码
+
+        Returns:
+            执行的标准输出和错误信息
+        """
+        return cache.run(code, execute)
+
+    return cached_python_repl
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+文件内容哈希
+本地文件的 SHA-256（执行缓存的键、上传前的比对）和沙箱内文件的 SHA-256（上传跳过、下载同步）都在这里计算，
+上传、下载和执行缓存共用，互相之间不再依赖
+"""
+
+import hashlib
+import json
+import os
+
+from sandbox_stream import invoke_and_collect
+
+_hash_cache = {}
+
+
+def file_hash(path: str) -> str:
+    """文件内容的 SHA-256，按 (路径, 修改时间, 大小) 缓存，避免每次都重读大文件"""
+    stat = os.stat(path)
+    signature = (path, stat.st_mtime_ns, stat.st_size)
+    cached = _hash_cache.get(signature)
+    if cached is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        cached = digest.hexdigest()
+        _hash_cache[signature] = cached
+    return cached
+
+
+# 在沙箱内计算文件哈希；包在函数里执行后删除，不在内核里留下变量
+_HASH_CODE = """
+def _sandbox_file_hashes(paths):
+    import hashlib, json, os
+    hashes = {{}}
+    for path in paths:
+        try:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            hashes[path] = {{"sha256": digest.hexdigest(), "size": os.path.getsize(path)}}
+        except OSError:
+            hashes[path] = None
+    print(json.dumps(hashes))
+_sandbox_file_hashes({paths!r})
+del _sandbox_file_hashes
+"""
+
+
+def remote_file_hashes(code_client, paths) -> dict:
+    """一次 executeCode 取回沙箱内文件的 SHA-256 和大小，不存在的文件为 None；探测失败返回空字典"""
+    if not paths:
+        return {}
+    result = invoke_and_collect(code_client, "executeCode", {
+        "code": _HASH_CODE.format(paths=list(paths)),
+        "language": "python",
+        "clearContext": False
+    })
+    stdout = (result.get("structuredContent") or {}).get("stdout", "").strip()
+    if result.get("isError") or not stdout:
+        return {}
+    try:
+        return json.loads(stdout.splitlines()[-1])
+    except json.JSONDecodeError:
+        return {}
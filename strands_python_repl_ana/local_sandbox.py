@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+本地 CodeInterpreter 兼容沙箱
+所有 executeCode 都要经过远程 AgentCore 服务，每次调用都有网络延迟，离线也无法测试。
+LocalCodeInterpreter 提供与 CodeInterpreter 相同的 invoke(method, arguments) 接口和结果结构
+（executeCode、writeFiles、readFiles、listFiles、removeFiles），代码在 repl_worker 的常驻工作进程中执行：
+变量跨调用保留，有超时和内存上限，当前目录是每个会话独立的临时目录。
+文件接口的路径限制在该目录内，但执行的代码本身不受限制，可以访问本机任意路径，不能当作隔离沙箱使用。
+create_code_interpreter 按 CODE_INTERPRETER_BACKEND 环境变量选择本地或远程实现
+"""
+
+import base64
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from repl_worker import ReplWorker, DEFAULT_PRELOAD, DEFAULT_TIMEOUT_SECONDS, DEFAULT_MEMORY_LIMIT_MB
+
+BACKEND = os.getenv("CODE_INTERPRETER_BACKEND", "agentcore")
+LOCAL_IDENTIFIER = "local.codeInterpreter.v1"
+DEFAULT_SESSION_TIMEOUT = 900
+
+# readFiles 以文本返回的类型，其余以 blob（bytes）返回
+_TEXT_MIME_TYPES = ("application/json", "application/xml", "application/javascript")
+
+
+def _result(content, is_error=False, structured=None) -> dict:
+    """包装成与远程服务相同的响应：{"stream": [{"result": {...}}]}"""
+    result = {"content": content, "isError": is_error}
+    if structured is not None:
+        result["structuredContent"] = structured
+    return {"stream": [{"result": result}]}
+
+
+def _error(message: str) -> dict:
+    return _result([{"type": "text", "text": message}], is_error=True)
+
+
+def _mime_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class LocalCodeInterpreter:
+    """与 bedrock_agentcore CodeInterpreter 接口兼容的本地实现"""
+
+    def __init__(self, region: str = None, workdir_root: str = None, preload=DEFAULT_PRELOAD,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB):
+        self.region = region
+        self.workdir_root = workdir_root
+        self.preload = preload
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.identifier = None
+        self.session_id = None
+        self.workdir = None
+        self._worker = None
+        self._active_at = None
+        self._session_timeout = DEFAULT_SESSION_TIMEOUT
+
+    def start(self, identifier: str = None, name: str = None,
+              session_timeout_seconds: int = DEFAULT_SESSION_TIMEOUT) -> str:
+        self.workdir = tempfile.mkdtemp(prefix="sandbox-", dir=self.workdir_root)
+        self._worker = ReplWorker(datasets={}, preload=self.preload, timeout=self.timeout,
+                                  memory_limit_mb=self.memory_limit_mb, workdir=self.workdir)
+        self.identifier = LOCAL_IDENTIFIER
+        self.session_id = name or f"local-{uuid.uuid4().hex[:12]}"
+        self._active_at = time.time()
+        self._session_timeout = session_timeout_seconds
+        return self.session_id
+
+    def stop(self) -> bool:
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker = None
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        self.identifier = None
+        self.session_id = None
+        self.workdir = None
+        return True
+
+    def get_session(self, interpreter_id: str = None, session_id: str = None) -> dict:
+        if not self.session_id:
+            raise ValueError("Interpreter ID and Session ID must be provided or available from current session")
+        # 与远程服务一样，无活动超过超时时间后会话终止
+        expired = time.time() - self._active_at > self._session_timeout
+        return {
+            "codeInterpreterIdentifier": self.identifier,
+            "sessionId": self.session_id,
+            "status": "TERMINATED" if expired else "READY",
+            "sessionTimeoutSeconds": self._session_timeout,
+        }
+
+    def _resolve(self, path: str) -> str:
+        """沙箱内的相对路径转为本地路径，不允许绝对路径和跳出工作目录"""
+        if path.startswith("/"):
+            raise ValueError(f"Path must be relative, not absolute. Got: {path}")
+        full = os.path.realpath(os.path.join(self.workdir, path))
+        if os.path.commonpath([full, os.path.realpath(self.workdir)]) != os.path.realpath(self.workdir):
+            raise ValueError(f"Path escapes the sandbox: {path}")
+        return full
+
+    def invoke(self, method: str, params: dict = None) -> dict:
+        if not self.session_id:
+            self.start()
+        self._active_at = time.time()
+        handler = {
+            "executeCode": self._execute_code,
+            "writeFiles": self._write_files,
+            "readFiles": self._read_files,
+            "listFiles": self._list_files,
+            "removeFiles": self._remove_files,
+        }.get(method)
+        if handler is None:
+            return _error(f"Unsupported method in local sandbox: {method}")
+        try:
+            return handler(params or {})
+        except ValueError as e:
+            return _error(str(e))
+
+    def _execute_code(self, params):
+        if params.get("language", "python") != "python":
+            return _error(f"Local sandbox only supports python, got: {params.get('language')}")
+        result = self._worker.execute(params.get("code", ""), reset_state=bool(params.get("clearContext")))
+        stderr = result["stderr"]
+        if result["error"]:
+            stderr = f"{stderr}{result['error']}"
+        text = result["stdout"] if not result["error"] else f"{result['stdout']}{result['error']}"
+        return _result([{"type": "text", "text": text}], is_error=bool(result["error"]), structured={
+            "stdout": result["stdout"],
+            "stderr": stderr,
+            "exitCode": 1 if result["error"] else 0,
+            "executionTime": result["elapsed"],
+        })
+
+    def _write_files(self, params):
+        written = []
+        for item in params.get("content", []):
+            full = self._resolve(item["path"])
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            if "blob" in item:
+                blob = item["blob"]
+                data = base64.b64decode(blob) if isinstance(blob, str) else blob
+            else:
+                data = item.get("text", "").encode("utf-8")
+            with open(full, "wb") as f:
+                f.write(data)
+            written.append(item["path"])
+        return _result([{"type": "text", "text": f"Successfully wrote {len(written)} file(s): {', '.join(written)}"}])
+
+    def _read_files(self, params):
+        content, missing = [], []
+        for path in params.get("paths", []):
+            full = self._resolve(path)
+            if not os.path.isfile(full):
+                missing.append(path)
+                continue
+            mime = _mime_type(path)
+            resource = {"uri": f"file://{full}", "mimeType": mime}
+            with open(full, "rb") as f:
+                data = f.read()
+            if mime.startswith("text/") or mime in _TEXT_MIME_TYPES:
+                resource["text"] = data.decode("utf-8", errors="replace")
+            else:
+                resource["blob"] = data
+            content.append({"type": "resource", "resource": resource})
+        if missing:
+            content.append({"type": "text", "text": f"File not found: {', '.join(missing)}"})
+        return _result(content, is_error=bool(missing))
+
+    def _list_files(self, params):
+        directory = self._resolve(params.get("path", "") or ".")
+        if not os.path.isdir(directory):
+            return _error(f"Directory not found: {params.get('path')}")
+        content = []
+        for name in sorted(os.listdir(directory)):
+            full = os.path.join(directory, name)
+            is_dir = os.path.isdir(full)
+            content.append({
+                "type": "resource_link",
+                "name": name,
+                "uri": f"file://{full}",
+                "description": "Directory" if is_dir else "File",
+                "mimeType": "" if is_dir else _mime_type(name),
+            })
+        return _result(content)
+
+    def _remove_files(self, params):
+        for path in params.get("paths", []):
+            full = self._resolve(path)
+            if os.path.isdir(full):
+                shutil.rmtree(full)
+            elif os.path.exists(full):
+                os.remove(full)
+        return _result([{"type": "text", "text": "Successfully removed files"}])
+
+    def clear_context(self) -> dict:
+        return self.invoke("executeCode", {"code": "# Context cleared", "language": "python", "clearContext": True})
+
+    def execute_code(self, code: str, language: str = "python", clear_context: bool = False) -> dict:
+        return self.invoke("executeCode", {"code": code, "language": language, "clearContext": clear_context})
+
+    def upload_file(self, path: str, content, description: str = "") -> dict:
+        entry = {"path": path, "blob": content} if isinstance(content, bytes) else {"path": path, "text": content}
+        return self.invoke("writeFiles", {"content": [entry]})
+
+
+def create_code_interpreter(region: str):
+    """CODE_INTERPRETER_BACKEND=local 时返回本地沙箱，否则返回远程 CodeInterpreter"""
+    if BACKEND == "local":
+        return LocalCodeInterpreter(region)
+    from bedrock_agentcore.tools.code_interpreter_client import CodeInterpreter
+
+    return CodeInterpreter(region)
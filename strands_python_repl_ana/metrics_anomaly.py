@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+EC2 监控指标的向量化异常检测
+在列式指标引擎的数组上，对所有实例同时运行三种检测器，没有逐实例的 Python 循环：
+- rolling_zscore：与同一实例之前 window 个采样点的均值/标准差比较（前缀和计算滑动窗口）
+- ewma：与同一实例的指数加权均值/标准差比较（pandas 分组 ewm，Cython 实现）
+- seasonal：减去同一实例按一天内时段（默认每小时）的均值画像后，看残差偏离
+连续的异常采样点合并为异常窗口，按峰值得分排序返回
+"""
+
+import numpy as np
+import pandas as pd
+
+from metrics_engine import MetricsEngine, METRIC_COLUMNS
+
+DETECTORS = ("rolling_zscore", "ewma", "seasonal")
+
+DEFAULT_WINDOW = 24
+DEFAULT_THRESHOLD = 3.0
+DEFAULT_EWMA_ALPHA = 0.1
+DEFAULT_SEASON_SECONDS = 86400
+DEFAULT_SEASON_BUCKET_SECONDS = 3600
+
+# 标准差下限（百分点）：几乎不变的序列上，微小波动不应被判为异常
+DEFAULT_MIN_STD = 1.0
+
+
+class SortedSeries:
+    """按 (实例, 时间) 排序后的数组，以及每行在各自实例序列里的位置"""
+
+    def __init__(self, engine: MetricsEngine):
+        self.order = np.lexsort((engine.timestamps.astype(np.int64), engine.codes))
+        self.codes = engine.codes[self.order]
+        self.seconds = engine.timestamps.astype(np.int64)[self.order]
+        self.group_count = len(engine.instances)
+        # 每个实例在排序数组中的起始下标
+        self.first = np.searchsorted(self.codes, np.arange(self.group_count))
+        self.group_start = self.first[self.codes]
+
+    def values(self, engine: MetricsEngine, metric: str) -> np.ndarray:
+        return engine.metrics[metric][self.order]
+
+
+def rolling_zscore(series: SortedSeries, values: np.ndarray, window: int = DEFAULT_WINDOW,
+                   min_std: float = DEFAULT_MIN_STD) -> np.ndarray:
+    """与之前 window 个点（不含当前点）比较的 z 分数；历史点不足 window/2 时为 NaN"""
+    n = len(values)
+    # 先减去实例均值，降低平方前缀和的数值误差
+    counts = np.bincount(series.codes, minlength=series.group_count)
+    group_mean = np.bincount(series.codes, weights=values, minlength=series.group_count) / np.maximum(counts, 1)
+    centered = values - group_mean[series.codes]
+
+    prefix = np.concatenate(([0.0], np.cumsum(centered)))
+    prefix_sq = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    rows = np.arange(n)
+    lo = np.maximum(rows - window, series.group_start)
+    history = rows - lo
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (prefix[rows] - prefix[lo]) / history
+        variance = (prefix_sq[rows] - prefix_sq[lo]) / history - mean * mean
+        std = np.maximum(np.sqrt(np.maximum(variance, 0.0)), min_std)
+        score = (centered - mean) / std
+    score[history < max(window // 2, 3)] = np.nan
+    return score
+
+
+def ewma_score(series: SortedSeries, values: np.ndarray, alpha: float = DEFAULT_EWMA_ALPHA,
+               min_std: float = DEFAULT_MIN_STD, min_periods: int = 10) -> np.ndarray:
+    """与截至上一个点的指数加权均值/标准差比较"""
+    grouped = pd.Series(values).groupby(series.codes)
+    ewm = grouped.ewm(alpha=alpha, min_periods=min_periods)
+    mean = ewm.mean().droplevel(0).sort_index().to_numpy()
+    std = ewm.std().droplevel(0).sort_index().to_numpy()
+
+    # 用上一个点的统计量，当前点本身不参与基线；每个实例的第一个点没有基线
+    previous_mean = np.concatenate(([np.nan], mean[:-1]))
+    previous_std = np.concatenate(([np.nan], std[:-1]))
+    first_rows = np.arange(len(values)) == series.group_start
+    previous_mean[first_rows] = np.nan
+
+    with np.errstate(invalid="ignore"):
+        return (values - previous_mean) / np.maximum(previous_std, min_std)
+
+
+def seasonal_residual(series: SortedSeries, values: np.ndarray, season_seconds: int = DEFAULT_SEASON_SECONDS,
+                      bucket_seconds: int = DEFAULT_SEASON_BUCKET_SECONDS,
+                      min_std: float = DEFAULT_MIN_STD) -> np.ndarray:
+    """减去 (实例, 时段) 均值画像后的残差，再除以该实例残差的标准差"""
+    slots = season_seconds // bucket_seconds
+    slot = (series.seconds % season_seconds) // bucket_seconds
+    keys = series.codes * slots + slot
+    size = series.group_count * slots
+
+    key_counts = np.bincount(keys, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        profile = np.bincount(keys, weights=values, minlength=size) / key_counts
+    residual = values - profile[keys]
+
+    counts = np.bincount(series.codes, minlength=series.group_count)
+    residual_var = np.bincount(series.codes, weights=residual * residual, minlength=series.group_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        residual_std = np.maximum(np.sqrt(residual_var / counts), min_std)
+        score = residual / residual_std[series.codes]
+    # 时段里只有一个点时残差恒为 0，没有参考意义
+    score[key_counts[keys] < 2] = np.nan
+    return score
+
+
+def anomaly_windows(series: SortedSeries, engine: MetricsEngine, metric: str, scores: dict,
+                    threshold: float, min_detectors: int = 1, merge_gap: int = 1, instance_code=None,
+                    top_n: int = 20):
+    """把异常采样点合并为窗口，只为峰值得分最高的 top_n 个窗口生成明细
+
+    Args:
+        scores: {检测器名: 得分数组}
+        threshold: |得分| 超过该值视为该检测器报警
+        min_detectors: 至少多少个检测器同时报警才算异常点
+        merge_gap: 同一实例相隔不超过这么多个采样点的异常点合并为一个窗口
+        instance_code: 只看某个实例（实例下标）
+    """
+    if min_detectors < 1:
+        raise ValueError(f"min_detectors 至少为 1，收到 {min_detectors}")
+    names = list(scores)
+    stacked = np.nan_to_num(np.abs(np.vstack([scores[name] for name in names])))
+    fired = stacked > threshold
+    point_mask = fired.sum(axis=0) >= min_detectors
+    if instance_code is not None:
+        point_mask &= series.codes == instance_code
+    flagged = np.nonzero(point_mask)[0]
+    if len(flagged) == 0:
+        return []
+
+    # 换实例或间隔过大的位置切开，得到每个窗口在 flagged 中的起止下标
+    breaks = (np.diff(series.codes[flagged]) != 0) | (np.diff(flagged) > merge_gap + 1)
+    starts = np.concatenate(([0], np.nonzero(breaks)[0] + 1))
+    ends = np.concatenate((starts[1:], [len(flagged)]))
+
+    peak = stacked.max(axis=0)[flagged]
+    window_peak = np.maximum.reduceat(peak, starts)
+    selected = np.argsort(-window_peak, kind="stable")[:top_n]
+
+    values = series.values(engine, metric)
+    windows = []
+    for w in selected:
+        rows = flagged[starts[w]:ends[w]]
+        top = rows[np.argmax(peak[starts[w]:ends[w]])]
+        windows.append({
+            "instance_id": str(engine.instances[series.codes[rows[0]]]),
+            "metric": metric,
+            "start": _format_time(series.seconds[rows[0]]),
+            "end": _format_time(series.seconds[rows[-1]]),
+            "points": int(len(rows)),
+            "peak_time": _format_time(series.seconds[top]),
+            "peak_value": round(float(values[top]), 2),
+            "peak_score": round(float(window_peak[w]), 2),
+            "detectors": [name for i, name in enumerate(names) if fired[i, rows].any()]
+        })
+    return windows
+
+
+def _format_time(seconds):
+    return str(np.datetime64(int(seconds), "s")).replace("T", " ")
+
+
+def detect_anomalies(engine: MetricsEngine, metrics=None, detectors=None, window: int = DEFAULT_WINDOW,
+                     threshold: float = DEFAULT_THRESHOLD, min_detectors: int = 1, instance_id: str = "",
+                     top_n: int = 20):
+    """对所有实例运行检测器，返回按峰值得分降序排列的异常窗口"""
+    metrics = metrics or METRIC_COLUMNS
+    detectors = detectors or DETECTORS
+    if min_detectors < 1:
+        raise ValueError(f"min_detectors 至少为 1，收到 {min_detectors}")
+    for metric in metrics:
+        if metric not in engine.metrics:
+            raise ValueError(f"未知指标: {metric}，可选 {', '.join(METRIC_COLUMNS)}")
+    for name in detectors:
+        if name not in DETECTORS:
+            raise ValueError(f"未知检测器: {name}，可选 {', '.join(DETECTORS)}")
+    instance_code = None
+    if instance_id:
+        matches = np.nonzero(engine.instances == instance_id)[0]
+        if len(matches) == 0:
+            raise ValueError(f"未找到实例: {instance_id}")
+        instance_code = int(matches[0])
+
+    series = SortedSeries(engine)
+    windows = []
+    for metric in metrics:
+        values = series.values(engine, metric)
+        scores = {}
+        if "rolling_zscore" in detectors:
+            scores["rolling_zscore"] = rolling_zscore(series, values, window)
+        if "ewma" in detectors:
+            scores["ewma"] = ewma_score(series, values)
+        if "seasonal" in detectors:
+            scores["seasonal"] = seasonal_residual(series, values)
+        windows += anomaly_windows(series, engine, metric, scores, threshold, min(min_detectors, len(scores)),
+                                   instance_code=instance_code, top_n=top_n)
+
+    windows.sort(key=lambda w: (-w["peak_score"], -w["points"]))
+    for rank, w in enumerate(windows[:top_n], start=1):
+        w["rank"] = rank
+    return windows[:top_n]
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+列式 EC2 监控指标引擎
+CSV 只解析一次，按列加载为 NumPy 数组，所有查询都是对整列的向量化运算；
+通过 Strands @tool 暴露给 Agent，"平均 CPU > 75%"、"CPU Top3" 之类的问题一次工具调用即可完成
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from strands import tool
+
+METRIC_COLUMNS = ["cpu_usage", "memory_usage", "disk_usage"]
+
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+BUCKET_SECONDS = {
+    "1min": 60,
+    "5min": 300,
+    "15min": 900,
+    "1h": 3600,
+    "6h": 21600,
+    "1d": 86400,
+}
+
+
+def _quantile(percentile) -> float:
+    """百分位数转为 0-1 之间的分位数，超出 0-100 时抛出 ValueError"""
+    percentile = float(percentile)
+    if not 0 <= percentile <= 100:
+        raise ValueError(f"分位数必须在 0 到 100 之间: {percentile:g}")
+    return percentile / 100
+
+
+class MetricsEngine:
+    """按列存放的监控数据，instance_id 编码为整数以便 bincount 分组"""
+
+    def __init__(self, timestamps, instance_ids, metrics):
+        # instances: 去重后的实例 ID；codes: 每行对应的实例下标
+        self.instances, self.codes = np.unique(instance_ids, return_inverse=True)
+        self.timestamps = timestamps.astype("datetime64[s]")
+        self.metrics = {name: np.asarray(values, dtype=np.float64) for name, values in metrics.items()}
+        self.counts = np.bincount(self.codes, minlength=len(self.instances))
+
+    @classmethod
+    def from_csv(cls, csv_file_name: str) -> "MetricsEngine":
+        df = pd.read_csv(
+            csv_file_name,
+            usecols=["timestamp", "instance_id"] + METRIC_COLUMNS,
+            parse_dates=["timestamp"],
+            dtype={"instance_id": str, **{c: np.float64 for c in METRIC_COLUMNS}}
+        )
+        return cls(
+            df["timestamp"].to_numpy(),
+            df["instance_id"].to_numpy(),
+            {name: df[name].to_numpy() for name in METRIC_COLUMNS}
+        )
+
+    @property
+    def row_count(self) -> int:
+        return len(self.codes)
+
+    def _column(self, metric: str) -> np.ndarray:
+        if metric not in self.metrics:
+            raise ValueError(f"未知指标: {metric}，可选 {', '.join(METRIC_COLUMNS)}")
+        return self.metrics[metric]
+
+    def _instance_mask(self, instance_id: str):
+        if not instance_id:
+            return None
+        matches = np.nonzero(self.instances == instance_id)[0]
+        if len(matches) == 0:
+            raise ValueError(f"未找到实例: {instance_id}")
+        return self.codes == matches[0]
+
+    @staticmethod
+    def _group_quantiles(values, codes, group_count, quantiles):
+        """对每个分组同时计算多个分位数（线性插值，与 numpy/pandas 默认一致）"""
+        order = np.lexsort((values, codes))
+        sorted_values = values[order]
+        counts = np.bincount(codes, minlength=group_count)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        result = np.full((group_count, len(quantiles)), np.nan)
+        present = counts > 0
+        for i, q in enumerate(quantiles):
+            position = starts[present] + q * (counts[present] - 1)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            weight = position - lower
+            result[present, i] = sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+        return result
+
+    def aggregate(self, metric: str, aggregation: str = "mean", codes=None, group_count=None,
+                  mask=None) -> np.ndarray:
+        """按分组聚合一个指标，默认按实例分组
+
+        aggregation 支持 mean, min, max, sum, count, std 以及 p50/p95 这样的分位数
+        """
+        values = self._column(metric)
+        codes = self.codes if codes is None else codes
+        group_count = len(self.instances) if group_count is None else group_count
+        if mask is not None:
+            values, codes = values[mask], codes[mask]
+
+        counts = np.bincount(codes, minlength=group_count).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if aggregation == "count":
+                return counts
+            if aggregation == "sum":
+                return np.bincount(codes, weights=values, minlength=group_count)
+            if aggregation == "mean":
+                return np.bincount(codes, weights=values, minlength=group_count) / counts
+            if aggregation == "std":
+                mean = np.bincount(codes, weights=values, minlength=group_count) / counts
+                square_mean = np.bincount(codes, weights=values * values, minlength=group_count) / counts
+                return np.sqrt(np.maximum(square_mean - mean * mean, 0.0))
+            if aggregation in ("min", "max"):
+                result = np.full(group_count, np.inf if aggregation == "min" else -np.inf)
+                (np.minimum if aggregation == "min" else np.maximum).at(result, codes, values)
+                result[counts == 0] = np.nan
+                return result
+        if aggregation.startswith("p") and aggregation[1:].replace(".", "", 1).isdigit():
+            quantile = _quantile(float(aggregation[1:]))
+            return self._group_quantiles(values, codes, group_count, [quantile])[:, 0]
+        raise ValueError(f"不支持的聚合方式: {aggregation}")
+
+    def threshold_filter(self, metric: str, operator: str, value: float, aggregation: str = "mean"):
+        """返回聚合值满足阈值条件的实例"""
+        if operator not in OPERATORS:
+            raise ValueError(f"不支持的比较运算符: {operator}")
+        aggregated = self.aggregate(metric, aggregation)
+        selected = np.nonzero(OPERATORS[operator](aggregated, value))[0]
+        selected = selected[np.argsort(-aggregated[selected])]
+        return [
+            {"instance_id": str(self.instances[i]), aggregation: round(float(aggregated[i]), 4),
+             "samples": int(self.counts[i])}
+            for i in selected
+        ]
+
+    def top_k(self, metric: str, k: int = 3, aggregation: str = "mean", ascending: bool = False):
+        """按聚合值排序取前 k 个实例"""
+        aggregated = self.aggregate(metric, aggregation)
+        order = np.argsort(aggregated if ascending else -aggregated, kind="stable")
+        order = order[~np.isnan(aggregated[order])][:k]
+        return [
+            {"rank": rank + 1, "instance_id": str(self.instances[i]),
+             aggregation: round(float(aggregated[i]), 4), "samples": int(self.counts[i])}
+            for rank, i in enumerate(order)
+        ]
+
+    def percentiles(self, metric: str, percentiles=(50, 90, 95, 99), instance_id: str = ""):
+        """每个实例（或指定实例）的分位数"""
+        values = self._column(metric)
+        quantiles = [_quantile(p) for p in percentiles]
+        table = self._group_quantiles(values, self.codes, len(self.instances), quantiles)
+        indices = range(len(self.instances))
+        if instance_id:
+            mask = self._instance_mask(instance_id)
+            indices = [int(self.codes[mask][0])]
+        return [
+            {"instance_id": str(self.instances[i]),
+             **{f"p{p:g}": round(float(table[i, j]), 4) for j, p in enumerate(percentiles)}}
+            for i in indices
+        ]
+
+    def group_by_time(self, metric: str, bucket: str = "1h", aggregation: str = "mean",
+                      instance_id: str = "", per_instance: bool = False):
+        """按时间桶聚合，可选按实例拆分"""
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"不支持的时间桶: {bucket}，可选 {', '.join(BUCKET_SECONDS)}")
+        mask = self._instance_mask(instance_id)
+        seconds = self.timestamps.astype(np.int64)
+        bucket_starts = seconds - seconds % BUCKET_SECONDS[bucket]
+        if per_instance:
+            keys = np.stack([bucket_starts, self.codes], axis=1)
+        else:
+            keys = bucket_starts[:, None]
+        if mask is not None:
+            keys = keys[mask]
+
+        unique_keys, group_codes = np.unique(keys, axis=0, return_inverse=True)
+        # aggregate() 需要逐行的分组编号，被过滤掉的行由 mask 排除
+        row_codes = np.zeros(self.row_count, dtype=np.int64)
+        if mask is None:
+            row_codes[:] = group_codes.ravel()
+        else:
+            row_codes[mask] = group_codes.ravel()
+        values = self.aggregate(metric, aggregation, codes=row_codes,
+                                group_count=len(unique_keys), mask=mask)
+        rows = []
+        for key, value in zip(unique_keys, values):
+            row = {"bucket_start": str(np.datetime64(int(key[0]), "s")).replace("T", " ")}
+            if per_instance:
+                row["instance_id"] = str(self.instances[key[1]])
+            row[aggregation] = round(float(value), 4)
+            rows.append(row)
+        return rows
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+METRICS_CSV = "data/ec2_metrics.csv"
+
+
+def get_engine(csv_file_name: str = None) -> MetricsEngine:
+    """按文件路径缓存引擎，文件修改时间变化后重新加载"""
+    csv_file_name = csv_file_name or METRICS_CSV
+    mtime = os.path.getmtime(csv_file_name)
+    with _engines_lock:
+        cached = _engines.get(csv_file_name)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, MetricsEngine.from_csv(csv_file_name))
+            _engines[csv_file_name] = cached
+        return cached[1]
+
+
+def _run(query):
+    # 参数错误、空的选择范围都作为错误信息返回给模型，而不是让工具调用抛异常
+    try:
+        return json.dumps(query(), ensure_ascii=False)
+    except (ValueError, IndexError, KeyError, TypeError) as e:
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+
+def create_metrics_tools(csv_file_name: str = None) -> list:
+    """创建绑定到指定 CSV 的指标工具，csv_file_name 为空时使用 METRICS_CSV"""
+
+    @tool
+    def metrics_threshold_filter(metric: str, operator: str, value: float, aggregation: str = "mean") -> str:
+        """找出聚合后的指标满足阈值条件的 EC2 实例，例如平均 CPU 使用率大于 75%
+
+        Args:
+            metric: 指标列，可选 cpu_usage, memory_usage, disk_usage
+            operator: 比较运算符，可选 >, >=, <, <=, ==
+            value: 阈值（百分比）
+            aggregation: 聚合方式，可选 mean, min, max, std, count 或分位数如 p95，默认 mean
+
+        Returns:
+            JSON 列表，每项包含 instance_id、聚合值和采样数，按聚合值降序
+        """
+        return _run(lambda: get_engine(csv_file_name).threshold_filter(metric, operator, value, aggregation))
+
+
+    @tool
+    def metrics_top_k(metric: str, k: int = 3, aggregation: str = "mean", ascending: bool = False) -> str:
+        """按聚合后的指标对 EC2 实例排序并取前 k 个，例如平均 CPU 使用率 Top3
+
+        Args:
+            metric: 指标列，可选 cpu_usage, memory_usage, disk_usage
+            k: 返回的实例数量，默认 3
+            aggregation: 聚合方式，可选 mean, min, max, std, count 或分位数如 p95，默认 mean
+            ascending: 为 true 时取最小的 k 个
+
+        Returns:
+            JSON 列表，每项包含 rank、instance_id、聚合值和采样数
+        """
+        return _run(lambda: get_engine(csv_file_name).top_k(metric, k, aggregation, ascending))
+
+
+    @tool
+    def metrics_percentiles(metric: str, percentiles: list = None, instance_id: str = "") -> str:
+        """计算每个 EC2 实例某个指标的分位数
+
+        Args:
+            metric: 指标列，可选 cpu_usage, memory_usage, disk_usage
+            percentiles: 分位数列表，默认 [50, 90, 95, 99]
+            instance_id: 只看某个实例，为空表示所有实例
+
+        Returns:
+            JSON 列表，每项包含 instance_id 和各分位数
+        """
+        return _run(lambda: get_engine(csv_file_name).percentiles(metric, tuple(percentiles or (50, 90, 95, 99)), instance_id))
+
+
+    @tool
+    def metrics_time_buckets(metric: str, bucket: str = "1h", aggregation: str = "mean",
+                             instance_id: str = "", per_instance: bool = False) -> str:
+        """按时间桶聚合某个指标，用于查看趋势
+
+        Args:
+            metric: 指标列，可选 cpu_usage, memory_usage, disk_usage
+            bucket: 时间桶大小，可选 1min, 5min, 15min, 1h, 6h, 1d，默认 1h
+            aggregation: 聚合方式，可选 mean, min, max, std, count 或分位数如 p95，默认 mean
+            instance_id: 只看某个实例，为空表示所有实例
+            per_instance: 为 true 时按实例分别聚合
+
+        Returns:
+            JSON 列表，每项包含 bucket_start、（可选）instance_id 和聚合值
+        """
+        return _run(lambda: get_engine(csv_file_name).group_by_time(metric, bucket, aggregation, instance_id, per_instance))
+
+    return [metrics_threshold_filter, metrics_top_k, metrics_percentiles, metrics_time_buckets]
+
+
+METRICS_TOOLS = create_metrics_tools()
+metrics_threshold_filter, metrics_top_k, metrics_percentiles, metrics_time_buckets = METRICS_TOOLS
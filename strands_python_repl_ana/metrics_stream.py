@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+大文件监控数据的分块流式聚合
+按块读取 CSV，每块用向量化运算更新每台实例的增量统计：
+- 样本数、均值、方差：Welford/Chan 合并公式，数值稳定且可合并
+- 分位数：固定分桶直方图草图，两个草图相加即可合并
+内存只与实例数量和分桶数有关，与文件行数无关
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metrics_summary import METRIC_COLUMNS, DEFAULT_PERCENTILES
+
+DEFAULT_CHUNKSIZE = 200_000
+
+# 使用率指标的取值范围是 0-100%，0.1% 一个分桶；样本足够多时分位数误差在一个分桶左右
+SKETCH_RANGE = (0.0, 100.0)
+SKETCH_BINS = 1000
+
+# 超过这个大小的文件默认走流式聚合
+STREAMING_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+
+class StreamingMetricsAggregator:
+    """每台实例、每个指标的可合并增量统计"""
+
+    def __init__(self, metrics=METRIC_COLUMNS, sketch_range=SKETCH_RANGE, sketch_bins=SKETCH_BINS):
+        self.metrics = list(metrics)
+        self.sketch_range = sketch_range
+        self.sketch_bins = sketch_bins
+        self.bin_width = (sketch_range[1] - sketch_range[0]) / sketch_bins
+
+        self.instance_index = {}
+        self.instances = []
+        self.rows = 0
+        self.first_seen = np.empty(0, dtype=np.int64)
+        self.last_seen = np.empty(0, dtype=np.int64)
+        self.count = {m: np.empty(0, dtype=np.int64) for m in self.metrics}
+        self.mean = {m: np.empty(0) for m in self.metrics}
+        self.m2 = {m: np.empty(0) for m in self.metrics}
+        self.min = {m: np.empty(0) for m in self.metrics}
+        self.max = {m: np.empty(0) for m in self.metrics}
+        self.sketch = {m: np.empty((0, sketch_bins), dtype=np.int64) for m in self.metrics}
+
+    def _grow(self, new_count):
+        """为新出现的实例扩展所有状态数组"""
+        extra = new_count - len(self.first_seen)
+        if extra <= 0:
+            return
+        self.first_seen = np.concatenate([self.first_seen, np.full(extra, np.iinfo(np.int64).max)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(extra, np.iinfo(np.int64).min)])
+        for m in self.metrics:
+            self.count[m] = np.concatenate([self.count[m], np.zeros(extra, dtype=np.int64)])
+            self.mean[m] = np.concatenate([self.mean[m], np.zeros(extra)])
+            self.m2[m] = np.concatenate([self.m2[m], np.zeros(extra)])
+            self.min[m] = np.concatenate([self.min[m], np.full(extra, np.inf)])
+            self.max[m] = np.concatenate([self.max[m], np.full(extra, -np.inf)])
+            self.sketch[m] = np.vstack([self.sketch[m], np.zeros((extra, self.sketch_bins), dtype=np.int64)])
+
+    def _slots(self, instance_ids):
+        """把实例 ID 映射为全局下标，只对块内去重后的 ID 做字典查找"""
+        unique_ids, inverse = np.unique(instance_ids, return_inverse=True)
+        slots = np.empty(len(unique_ids), dtype=np.int64)
+        for i, instance_id in enumerate(unique_ids):
+            slot = self.instance_index.get(instance_id)
+            if slot is None:
+                slot = len(self.instance_index)
+                self.instance_index[instance_id] = slot
+                self.instances.append(instance_id)
+            slots[i] = slot
+        self._grow(len(self.instances))
+        return slots[inverse.ravel()]
+
+    def _merge_moments(self, metric, count, mean, m2):
+        """Chan 并行合并公式，对所有实例一次性向量化合并"""
+        total = self.count[metric] + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean[metric]
+            merged_mean = self.mean[metric] + delta * np.where(total > 0, count / total, 0.0)
+            merged_m2 = self.m2[metric] + m2 + delta * delta * np.where(
+                total > 0, self.count[metric] * count / total, 0.0)
+        self.mean[metric] = np.where(total > 0, merged_mean, 0.0)
+        self.m2[metric] = np.where(total > 0, merged_m2, 0.0)
+        self.count[metric] = total
+
+    def update(self, chunk: pd.DataFrame):
+        """用一个数据块更新统计"""
+        if chunk.empty:
+            return
+        codes = self._slots(chunk["instance_id"].to_numpy())
+        slot_count = len(self.instances)
+        self.rows += len(chunk)
+
+        seconds = pd.to_datetime(chunk["timestamp"]).to_numpy().astype("datetime64[s]").astype(np.int64)
+        np.minimum.at(self.first_seen, codes, seconds)
+        np.maximum.at(self.last_seen, codes, seconds)
+
+        lo, hi = self.sketch_range
+        for m in self.metrics:
+            values = chunk[m].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            values, value_codes = values[valid], codes[valid]
+
+            count = np.bincount(value_codes, minlength=slot_count)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.bincount(value_codes, weights=values, minlength=slot_count) / count
+            mean = np.nan_to_num(mean)
+            deviation = values - mean[value_codes]
+            m2 = np.bincount(value_codes, weights=deviation * deviation, minlength=slot_count)
+            self._merge_moments(m, count, mean, m2)
+
+            np.minimum.at(self.min[m], value_codes, values)
+            np.maximum.at(self.max[m], value_codes, values)
+
+            bins = np.floor((np.clip(values, lo, hi) - lo) / self.bin_width + 1e-9).astype(np.int64)
+            bins = np.minimum(bins, self.sketch_bins - 1)
+            flat = np.bincount(value_codes * self.sketch_bins + bins, minlength=slot_count * self.sketch_bins)
+            self.sketch[m] += flat.reshape(slot_count, self.sketch_bins)
+
+    def merge(self, other: "StreamingMetricsAggregator") -> "StreamingMetricsAggregator":
+        """合并另一个聚合器（例如另一个文件或另一个进程的结果）"""
+        if other.sketch_range != self.sketch_range or other.sketch_bins != self.sketch_bins:
+            raise ValueError("分位数草图的范围或分桶数不一致，无法合并")
+        codes = self._slots(np.asarray(other.instances, dtype=object)) if other.instances else np.empty(0, np.int64)
+        slot_count = len(self.instances)
+        self.rows += other.rows
+
+        def scatter(values, fill):
+            result = np.full(slot_count, fill, dtype=np.asarray(values).dtype)
+            result[codes] = values
+            return result
+
+        self.first_seen = np.minimum(self.first_seen, scatter(other.first_seen, np.iinfo(np.int64).max))
+        self.last_seen = np.maximum(self.last_seen, scatter(other.last_seen, np.iinfo(np.int64).min))
+        for m in self.metrics:
+            self._merge_moments(m, scatter(other.count[m], 0), scatter(other.mean[m], 0.0),
+                                scatter(other.m2[m], 0.0))
+            self.min[m] = np.minimum(self.min[m], scatter(other.min[m], np.inf))
+            self.max[m] = np.maximum(self.max[m], scatter(other.max[m], -np.inf))
+            self.sketch[m][codes] += other.sketch[m]
+        return self
+
+    def quantiles(self, metric: str, percentiles=DEFAULT_PERCENTILES) -> np.ndarray:
+        """从直方图草图估算分位数，结果形状为 (实例数, 分位数个数)"""
+        sketch = self.sketch[metric]
+        counts = self.count[metric]
+        cumulative = np.cumsum(sketch, axis=1)
+        result = np.full((len(self.instances), len(percentiles)), np.nan)
+        present = counts > 0
+
+        for j, p in enumerate(percentiles):
+            # 目标秩（从 0 开始），与 numpy 线性插值的定义对齐
+            rank = p / 100 * (counts - 1)
+            bins = np.argmax(cumulative > rank[:, None], axis=1)
+            rows = np.arange(len(self.instances))
+            before = cumulative[rows, bins] - sketch[rows, bins]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                offset = (rank - before + 0.5) / sketch[rows, bins]
+            estimate = self.sketch_range[0] + (bins + offset) * self.bin_width
+            estimate = np.clip(estimate, self.min[metric], self.max[metric])
+            result[present, j] = estimate[present]
+        return result
+
+    def summary_frame(self, percentiles=DEFAULT_PERCENTILES) -> pd.DataFrame:
+        """输出与 metrics_summary.summarize_metrics 相同列的摘要表"""
+        columns = {}
+        for m in self.metrics:
+            present = self.count[m] > 0
+            columns[f"{m}_mean"] = np.where(present, self.mean[m], np.nan)
+            columns[f"{m}_min"] = np.where(present, self.min[m], np.nan)
+            columns[f"{m}_max"] = np.where(present, self.max[m], np.nan)
+            quantiles = self.quantiles(m, percentiles)
+            for j, p in enumerate(percentiles):
+                columns[f"{m}_p{p}"] = quantiles[:, j]
+        columns["samples"] = np.max([self.count[m] for m in self.metrics], axis=0) if self.instances else []
+        columns["first_seen"] = pd.to_datetime(self.first_seen, unit="s").astype(str)
+        columns["last_seen"] = pd.to_datetime(self.last_seen, unit="s").astype(str)
+
+        summary = pd.DataFrame(columns, index=pd.Index(self.instances, name="instance_id"))
+        return summary.sort_index()
+
+    def std(self, metric: str) -> np.ndarray:
+        """总体标准差"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2[metric] / self.count[metric])
+
+
+def iter_metric_chunks(csv_file_name: str, chunksize: int = DEFAULT_CHUNKSIZE):
+    """分块读取监控 CSV，只解析需要的列"""
+    return pd.read_csv(
+        csv_file_name,
+        usecols=["timestamp", "instance_id"] + METRIC_COLUMNS,
+        dtype={"instance_id": str, **{c: np.float64 for c in METRIC_COLUMNS}},
+        chunksize=chunksize
+    )
+
+
+def aggregate_csv_streaming(csv_file_name: str, chunksize: int = DEFAULT_CHUNKSIZE) -> StreamingMetricsAggregator:
+    """流式聚合整个文件，内存占用与文件大小无关"""
+    aggregator = StreamingMetricsAggregator()
+    for chunk in iter_metric_chunks(csv_file_name, chunksize):
+        aggregator.update(chunk)
+    return aggregator
+
+
+def stream_metrics_slice(csv_file_name: str, instance_id: str = "", start_time: str = "", end_time: str = "",
+                         columns=None, limit: int = 50, chunksize: int = DEFAULT_CHUNKSIZE) -> pd.DataFrame:
+    """分块扫描文件截取明细，凑够 limit 行后立即停止读取"""
+    selected = ["timestamp", "instance_id"] + [c for c in (columns or METRIC_COLUMNS) if c in METRIC_COLUMNS]
+    parts = []
+    remaining = limit
+    for chunk in iter_metric_chunks(csv_file_name, chunksize):
+        mask = pd.Series(True, index=chunk.index)
+        if instance_id:
+            mask &= chunk["instance_id"] == instance_id
+        if start_time or end_time:
+            timestamps = pd.to_datetime(chunk["timestamp"])
+            if start_time:
+                mask &= timestamps >= pd.Timestamp(start_time)
+            if end_time:
+                mask &= timestamps <= pd.Timestamp(end_time)
+        part = chunk.loc[mask, selected].head(remaining)
+        parts.append(part)
+        remaining -= len(part)
+        if remaining <= 0:
+            break
+    return pd.concat(parts) if parts else pd.DataFrame(columns=selected)
+
+
+def should_stream(csv_file_name: str) -> bool:
+    """文件超过阈值时走流式聚合"""
+    return os.path.getsize(csv_file_name) > STREAMING_THRESHOLD_BYTES
+
+
+def _aggregate_file(task):
+    """进程池任务：聚合单个文件，返回聚合器和文件概况"""
+    csv_file_name, chunksize = task
+    aggregator = aggregate_csv_streaming(csv_file_name, chunksize)
+    overview = {
+        "file": csv_file_name,
+        "rows": aggregator.rows,
+        "instances": len(aggregator.instances),
+        "first_seen": str(pd.to_datetime(aggregator.first_seen.min(), unit="s")) if aggregator.instances else "",
+        "last_seen": str(pd.to_datetime(aggregator.last_seen.max(), unit="s")) if aggregator.instances else "",
+    }
+    for m in aggregator.metrics:
+        count = aggregator.count[m].sum()
+        overview[f"{m}_mean"] = round(float((aggregator.mean[m] * aggregator.count[m]).sum() / count), 2) if count else None
+    return aggregator, overview
+
+
+def aggregate_files(csv_file_names, max_workers: int = None, chunksize: int = DEFAULT_CHUNKSIZE):
+    """多文件 map-reduce：进程池里逐文件流式聚合，再在主进程合并为全局结果
+
+    Args:
+        csv_file_names: 文件路径列表
+        max_workers: 进程数，默认 CPU 核数
+        chunksize: 每块读取的行数
+
+    Returns:
+        (合并后的聚合器, 每个文件的概况列表)
+    """
+    merged = StreamingMetricsAggregator()
+    overviews = []
+    tasks = [(name, chunksize) for name in csv_file_names]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks)) or 1
+    if max_workers == 1:
+        results = map(_aggregate_file, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        results = executor.map(_aggregate_file, tasks)
+    try:
+        # 结果按文件顺序依次合并，主进程只保留一个合并结果
+        for aggregator, overview in results:
+            merged.merge(aggregator)
+            overviews.append(overview)
+    finally:
+        if max_workers > 1:
+            executor.shutdown()
+    return merged, overviews
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+EC2 监控数据本地预聚合
+把原始 CSV 压缩成每台实例的统计摘要（均值、最大值、分位数、采样数），
+让大模型只看摘要而不是逐行数据
+"""
+
+import pandas as pd
+
+METRIC_COLUMNS = ["cpu_usage", "memory_usage", "disk_usage"]
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+def load_metrics(csv_file_name: str) -> pd.DataFrame:
+    """读取监控 CSV，并把 timestamp 解析为时间类型"""
+    return pd.read_csv(csv_file_name, parse_dates=["timestamp"])
+
+
+def summarize_metrics(df: pd.DataFrame, percentiles=DEFAULT_PERCENTILES) -> pd.DataFrame:
+    """按实例聚合每个指标
+
+    Args:
+        df: 包含 timestamp, instance_id 和指标列的原始数据
+        percentiles: 需要计算的分位数
+
+    Returns:
+        以 instance_id 为索引的摘要表，列名形如 cpu_usage_mean、cpu_usage_p95
+    """
+    grouped = df.groupby("instance_id")[METRIC_COLUMNS]
+
+    # mean/min/max/count 走 pandas 的向量化聚合，分位数一次性算出
+    summary = grouped.agg(["mean", "min", "max", "count"])
+    summary.columns = [f"{metric}_{stat}" for metric, stat in summary.columns]
+
+    quantiles = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    quantiles.columns = [f"{metric}_p{round(q * 100)}" for metric, q in quantiles.columns]
+
+    summary = summary.join(quantiles)
+    ordered = []
+    for metric in METRIC_COLUMNS:
+        ordered += [f"{metric}_mean", f"{metric}_min", f"{metric}_max"]
+        ordered += [f"{metric}_p{p}" for p in percentiles]
+    # 同一实例各指标采样数相同（除非有缺失值），只保留一列
+    summary["samples"] = summary[[f"{metric}_count" for metric in METRIC_COLUMNS]].max(axis=1)
+    summary = summary[ordered + ["samples"]]
+
+    time_range = df.groupby("instance_id")["timestamp"].agg(["min", "max"])
+    summary["first_seen"] = time_range["min"].astype(str)
+    summary["last_seen"] = time_range["max"].astype(str)
+
+    return summary.sort_index()
+
+
+def format_summary_csv(summary: pd.DataFrame, decimals: int = 2) -> str:
+    """把摘要表格式化成紧凑的 CSV 文本，用于发送给大模型"""
+    return summary.round(decimals).to_csv()
+
+
+def get_metrics_slice(df: pd.DataFrame, instance_id: str = "", start_time: str = "", end_time: str = "",
+                      columns=None, limit: int = 50) -> pd.DataFrame:
+    """按实例和时间范围截取原始数据，用于下钻查看明细"""
+    mask = pd.Series(True, index=df.index)
+    if instance_id:
+        mask &= df["instance_id"] == instance_id
+    if start_time:
+        mask &= df["timestamp"] >= pd.Timestamp(start_time)
+    if end_time:
+        mask &= df["timestamp"] <= pd.Timestamp(end_time)
+
+    selected = ["timestamp", "instance_id"] + [c for c in (columns or METRIC_COLUMNS) if c in METRIC_COLUMNS]
+    return df.loc[mask, selected].head(limit)
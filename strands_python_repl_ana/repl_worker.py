@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+常驻预热的 Python REPL 工作进程
+- 启动时预先导入 pandas/numpy 等常用库，后续调用不再重复导入
+- 注册的数据集常驻内存，以变量名直接可用；文件修改时间变化后自动重新加载
+- 每次执行有超时，工作进程有内存上限；超时或崩溃后自动重启
+通过 persistent_python_repl 工具（工具名仍为 python_repl）替换 strands_tools 的 python_repl
+"""
+
+import ast
+import atexit
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from multiprocessing.connection import Connection
+
+from strands import tool
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不限制内存
+    resource = None
+
+DEFAULT_PRELOAD = ("numpy as np", "pandas as pd", "json", "math", "statistics", "datetime")
+
+DEFAULT_DATASETS = {
+    "ec2_metrics": {"path": "data/ec2_metrics.csv", "parse_dates": ["timestamp"]},
+}
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("REPL_WORKER_TIMEOUT", "60"))
+DEFAULT_MEMORY_LIMIT_MB = int(os.getenv("REPL_WORKER_MEMORY_MB", "2048"))
+# 等待工作进程完成预导入和数据集加载的最长时间
+DEFAULT_START_TIMEOUT_SECONDS = float(os.getenv("REPL_WORKER_START_TIMEOUT", "120"))
+
+# 单次输出的最大字符数，避免把超长输出塞回给模型
+MAX_OUTPUT_CHARS = 20000
+
+def _normalize_datasets(datasets):
+    """数据集配置统一为 {name: {"path": 绝对路径, **read_kwargs}}"""
+    normalized = {}
+    for name, spec in (datasets or {}).items():
+        spec = {"path": spec} if isinstance(spec, str) else dict(spec)
+        spec["path"] = os.path.abspath(spec["path"])
+        normalized[name] = spec
+    return normalized
+
+
+def _read_dataset(spec):
+    import pandas as pd
+
+    options = {k: v for k, v in spec.items() if k != "path"}
+    path = spec["path"]
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, **options)
+    if path.endswith(".json"):
+        return pd.read_json(path, **options)
+    return pd.read_csv(path, **options)
+
+
+def _fresh_namespace(preload):
+    namespace = {"__name__": "__main__"}
+    for statement in preload:
+        exec(f"import {statement}", namespace)
+    return namespace
+
+
+def _refresh_datasets(namespace, datasets, loaded):
+    """按修改时间检查数据集，变化或首次使用时重新读取并绑定到同名变量"""
+    status = {}
+    for name, spec in datasets.items():
+        try:
+            mtime = os.path.getmtime(spec["path"])
+        except OSError:
+            status[name] = "missing"
+            continue
+        cached = loaded.get(name)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, _read_dataset(spec))
+            loaded[name] = cached
+            status[name] = "loaded"
+        else:
+            status[name] = "cached"
+        namespace[name] = cached[1]
+    return status
+
+
+def _execute(code, namespace):
+    """执行代码；最后一条语句是表达式时像交互式解释器一样打印其值"""
+    tree = ast.parse(code, mode="exec")
+    last_expression = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last_expression = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, "<python_repl>", "exec"), namespace)
+    if last_expression is not None:
+        value = eval(compile(last_expression, "<python_repl>", "eval"), namespace)
+        if value is not None:
+            print(repr(value))
+
+
+def _format_error(error):
+    """只保留用户代码的调用栈，去掉工作进程自身的帧"""
+    frames = [f for f in traceback.extract_tb(error.__traceback__) if f.filename == "<python_repl>"]
+    lines = traceback.format_list(frames) + traceback.format_exception_only(type(error), error)
+    return "Traceback (most recent call last):\n" + "".join(lines) if frames else "".join(lines)
+
+
+def _worker_main(conn, preload, datasets, memory_limit_mb, workdir=None):
+    """工作进程主循环：接收代码、执行、返回输出"""
+    if workdir:
+        os.chdir(workdir)
+    if resource is not None and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    namespace = _fresh_namespace(preload)
+    loaded = {}
+    # 预热阶段就把数据集读进来，第一次调用不再付出加载成本
+    conn.send({"ready": True, "datasets": _refresh_datasets(namespace, datasets, loaded)})
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request.get("op") == "close":
+            break
+        if request.get("reset_state"):
+            namespace = _fresh_namespace(preload)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        started = time.perf_counter()
+        error = None
+        try:
+            dataset_status = _refresh_datasets(namespace, datasets, loaded)
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                _execute(request["code"], namespace)
+        except MemoryError:
+            error = f"MemoryError: 超过工作进程内存上限 {memory_limit_mb}MB"
+            dataset_status = {}
+        except BaseException as e:
+            error = _format_error(e)
+            dataset_status = {}
+        conn.send({
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+            "error": error,
+            "datasets": dataset_status,
+            "elapsed": round(time.perf_counter() - started, 4)
+        })
+
+
+class ReplWorker:
+    """父进程侧的工作进程句柄，负责启动、超时处理和崩溃重启"""
+
+    def __init__(self, datasets=None, preload=DEFAULT_PRELOAD, timeout=DEFAULT_TIMEOUT_SECONDS,
+                 memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, workdir=None, start_timeout=DEFAULT_START_TIMEOUT_SECONDS):
+        self.datasets = _normalize_datasets(DEFAULT_DATASETS if datasets is None else datasets)
+        self.preload = tuple(preload)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.workdir = workdir
+        self.start_timeout = start_timeout
+        self.stats = {"executions": 0, "timeouts": 0, "restarts": 0}
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self.start()
+
+    def start(self):
+        # 不用 fork：Agent 所在进程里有线程，fork 出来的子进程可能继承到被锁住的锁；
+        # 也不用 multiprocessing 的 spawn：它会在子进程里重新执行主脚本，而 agentcore 演示是没有 __main__ 保护的扁平脚本。
+        # 直接以本文件为入口启动新的解释器，通过继承的 socket 与父进程通信
+        parent_sock, child_sock = socket.socketpair()
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), str(child_sock.fileno())],
+                pass_fds=(child_sock.fileno(),)
+            )
+        finally:
+            child_sock.close()
+        self._conn = Connection(parent_sock.detach())
+        # 预加载阶段崩溃或卡住时不能让调用方一直等下去
+        try:
+            self._conn.send({"preload": self.preload, "datasets": self.datasets,
+                             "memory_limit_mb": self.memory_limit_mb, "workdir": self.workdir})
+            if not self._conn.poll(self.start_timeout):
+                raise TimeoutError(f"等待超过 {self.start_timeout} 秒")
+            ready = self._conn.recv()
+        except (EOFError, OSError, TimeoutError) as e:
+            self._abort()
+            raise RuntimeError(f"REPL 工作进程启动失败（{str(e) or '预加载阶段进程退出'}）") from e
+        self.dataset_status = ready["datasets"]
+
+    def _abort(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._conn.close()
+        self._process = None
+
+    def provided_names(self) -> set:
+        """工作进程预先提供的变量名：预导入的模块别名和数据集变量"""
+        names = {statement.split(" as ")[-1].split(".")[0] for statement in self.preload}
+        return names | set(self.datasets)
+
+    def stop(self):
+        if self._process is None:
+            return
+        try:
+            self._conn.send({"op": "close"})
+        except (OSError, BrokenPipeError):
+            pass
+        try:
+            self._process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._conn.close()
+        self._process = None
+
+    def restart(self):
+        self.stats["restarts"] += 1
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self.start()
+
+    def execute(self, code: str, reset_state: bool = False, timeout: float = None) -> dict:
+        """在工作进程中执行代码，返回 stdout/stderr/error/elapsed"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self.stats["executions"] += 1
+            if self._process is None or self._process.poll() is not None:
+                self.restart()
+            self._conn.send({"code": code, "reset_state": reset_state})
+            if not self._conn.poll(timeout):
+                # 无法中断正在执行的代码，只能杀掉进程重启，内存中的变量随之丢失
+                self.stats["timeouts"] += 1
+                self.restart()
+                return {"stdout": "", "stderr": "", "datasets": {}, "elapsed": timeout,
+                        "error": f"执行超时（{timeout} 秒），工作进程已重启，之前定义的变量已丢失"}
+            try:
+                return self._conn.recv()
+            except EOFError:
+                self.restart()
+                return {"stdout": "", "stderr": "", "datasets": {}, "elapsed": None,
+                        "error": "工作进程异常退出（可能超过内存上限），已重启，之前定义的变量已丢失"}
+
+
+def format_result(result: dict) -> str:
+    """把执行结果拼成返回给模型的文本"""
+    parts = [result["stdout"]]
+    if result["stderr"]:
+        parts.append(f"[stderr]\n{result['stderr']}")
+    if result["error"]:
+        parts.append(f"[error]\n{result['error']}")
+    text = "\n".join(p for p in parts if p).strip() or "(无输出)"
+    if len(text) > MAX_OUTPUT_CHARS:
+        text = text[:MAX_OUTPUT_CHARS] + f"\n... 输出过长，已截断（共 {len(text)} 字符）"
+    return text
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> ReplWorker:
+    """进程内共享一个工作进程，首次使用时启动"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ReplWorker()
+            atexit.register(_worker.stop)
+        return _worker
+
+
+def describe_datasets(worker: ReplWorker = None) -> str:
+    """生成数据集说明，放进提示词让模型直接使用预加载的变量"""
+    worker = worker or get_worker()
+    lines = [f"- `{name}`: pandas DataFrame，来自 {os.path.relpath(spec['path'])}"
+             for name, spec in worker.datasets.items()]
+    return "python_repl 中已预先导入 pandas as pd、numpy as np，并预加载了以下数据集（直接使用变量，不要重新读取文件）：\n" + "\n".join(lines)
+
+
+@tool(name="python_repl")
+def persistent_python_repl(code: str, reset_state: bool = False) -> dict:
+    """在常驻的 Python 进程中执行代码，变量在多次调用之间保留
+
+    已预先导入 pandas as pd、numpy as np，注册的数据集以同名 DataFrame 变量常驻内存，
+    源文件修改后自动重新加载。最后一行是表达式时会打印其值。
+
+    Args:
+        code: 要执行的 Python 代码
+        reset_state: 为 true 时先清空之前定义的变量（数据集仍然可用）
+
+    Returns:
+        执行的标准输出、标准错误和异常信息
+    """
+    result = get_worker().execute(code, reset_state=reset_state)
+    return {
+        "status": "error" if result["error"] else "success",
+        "content": [{"text": format_result(result)}]
+    }
+
+
+if __name__ == "__main__":
+    # 工作进程入口：argv[1] 是父进程传下来的 socket 描述符，第一条消息是启动参数
+    worker_conn = Connection(int(sys.argv[1]))
+    _worker_main(worker_conn, **worker_conn.recv())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+工具输出压缩
+python_repl / execute_python 打印大表时，完整文本会进入对话历史，之后每一轮都要重复付费。
+ToolResultCompactor 在 AfterToolCallEvent 中把超过阈值的输出替换为摘要（形状、开头和结尾若干行），
+完整文本存入本地结果仓库并给出句柄；Agent 需要明细时用 fetch_tool_result 按句柄取指定的行
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+from strands import tool
+from strands.hooks import HookProvider, HookRegistry, AfterToolCallEvent
+
+DEFAULT_STORE_DIR = os.getenv("TOOL_RESULT_DIR", ".tool_results")
+DEFAULT_MAX_CHARS = int(os.getenv("TOOL_RESULT_MAX_CHARS", "4000"))
+DEFAULT_HEAD_LINES = 10
+DEFAULT_TAIL_LINES = 5
+
+# fetch_tool_result 单次最多返回的行数
+MAX_FETCH_LINES = 200
+
+COMPACTED_TOOLS = ("python_repl", "execute_python")
+
+# pandas 打印被截断的 DataFrame 时末尾的 "[1000 rows x 5 columns]"
+_SHAPE_PATTERN = re.compile(r"\[(\d+) rows x (\d+) columns\]")
+
+
+class ResultStore:
+    """按内容哈希保存完整输出的本地仓库"""
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, handle):
+        if not re.fullmatch(r"res-[0-9a-f]{12}", handle):
+            raise ValueError(f"无效的结果句柄: {handle}")
+        return os.path.join(self.store_dir, f"{handle}.txt")
+
+    def put(self, text: str) -> str:
+        handle = "res-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        path = self._path(handle)
+        with self._lock:
+            if not os.path.exists(path):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+        return handle
+
+    def get(self, handle: str) -> str:
+        path = self._path(handle)
+        if not os.path.exists(path):
+            raise ValueError(f"结果句柄不存在: {handle}")
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def fetch(self, handle: str, start_line: int = 0, end_line: int = 50, pattern: str = "") -> str:
+        """按行号区间或正则取出部分内容，每行带行号"""
+        lines = self.get(handle).splitlines()
+        if pattern:
+            regex = re.compile(pattern)
+            selected = [(i, line) for i, line in enumerate(lines) if regex.search(line)]
+        else:
+            start_line = max(start_line, 0)
+            end_line = min(max(end_line, start_line), len(lines))
+            selected = list(enumerate(lines))[start_line:end_line]
+        truncated = len(selected) > MAX_FETCH_LINES
+        body = "\n".join(f"{i}: {line}" for i, line in selected[:MAX_FETCH_LINES])
+        header = f"[{handle}] 共 {len(lines)} 行，返回 {min(len(selected), MAX_FETCH_LINES)} 行"
+        if truncated:
+            header += f"（匹配 {len(selected)} 行，已截断，请缩小范围）"
+        return header + "\n" + body
+
+
+def summarize_output(text: str, handle: str, head_lines: int = DEFAULT_HEAD_LINES,
+                     tail_lines: int = DEFAULT_TAIL_LINES) -> str:
+    """生成压缩后的摘要：形状、开头和结尾若干行、取回方式"""
+    lines = text.splitlines()
+    shape = _SHAPE_PATTERN.findall(text)
+    description = f"共 {len(lines)} 行 {len(text)} 字符"
+    if shape:
+        rows, columns = shape[-1]
+        description += f"，表格形状 {rows} 行 x {columns} 列"
+
+    parts = [f"[输出过长已压缩，完整内容保存在结果句柄 {handle}，{description}]"]
+    if len(lines) <= head_lines + tail_lines:
+        # 行数不多但单行很长，按字符截取
+        parts.append(text[:DEFAULT_MAX_CHARS // 2])
+        parts.append("...")
+    else:
+        parts += lines[:head_lines]
+        parts.append(f"... 省略第 {head_lines} 到 {len(lines) - tail_lines - 1} 行 ...")
+        parts += lines[-tail_lines:]
+    parts.append(f"[如需查看其他部分，调用 fetch_tool_result(handle=\"{handle}\", start_line=..., end_line=...) "
+                 f"或 fetch_tool_result(handle=\"{handle}\", pattern=\"正则\")]")
+    return "\n".join(parts)
+
+
+class ToolResultCompactor(HookProvider):
+    """把超过阈值的工具输出替换为摘要 + 结果句柄"""
+
+    def __init__(self, store: ResultStore = None, max_chars: int = DEFAULT_MAX_CHARS,
+                 tool_names=COMPACTED_TOOLS):
+        self.store = store or get_result_store()
+        self.max_chars = max_chars
+        self.tool_names = set(tool_names)
+        self.stats = {"compacted": 0, "chars_before": 0, "chars_after": 0}
+
+    def register_hooks(self, registry: HookRegistry, **kwargs) -> None:
+        registry.add_callback(AfterToolCallEvent, self._on_tool_end)
+
+    def compact_text(self, text: str) -> str:
+        if not self.max_chars or len(text) <= self.max_chars:
+            return text
+        handle = self.store.put(text)
+        summary = summarize_output(text, handle)
+        self.stats["compacted"] += 1
+        self.stats["chars_before"] += len(text)
+        self.stats["chars_after"] += len(summary)
+        return summary
+
+    def _compact_sandbox_json(self, text: str):
+        """execute_python 返回的是 CodeInterpreter 结果的 JSON，只压缩其中的 stdout/文本，保留结构"""
+        try:
+            result = json.loads(text)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        if not isinstance(result, dict) or "content" not in result:
+            return None
+        structured = result.get("structuredContent")
+        stdout = structured.get("stdout") if isinstance(structured, dict) else None
+        compacted = self.compact_text(stdout) if stdout else None
+        for item in result.get("content", []):
+            if isinstance(item, dict) and item.get("type") == "text" and item.get("text"):
+                # content[0].text 通常与 stdout 相同，复用同一个句柄的摘要
+                item["text"] = compacted if item["text"] == stdout else self.compact_text(item["text"])
+        if compacted is not None:
+            result["structuredContent"]["stdout"] = compacted
+        return json.dumps(result, ensure_ascii=False)
+
+    def _on_tool_end(self, event: AfterToolCallEvent):
+        if event.tool_use.get("name") not in self.tool_names or event.result is None:
+            return
+        content = []
+        for block in event.result.get("content", []):
+            text = block.get("text") if isinstance(block, dict) else None
+            if text is not None and len(text) > self.max_chars:
+                block = {**block, "text": self._compact_sandbox_json(text) or self.compact_text(text)}
+            content.append(block)
+        event.result = {**event.result, "content": content}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store() -> ResultStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore()
+        return _store
+
+
+@tool
+def fetch_tool_result(handle: str, start_line: int = 0, end_line: int = 50, pattern: str = "") -> str:
+    """按句柄取回被压缩的工具输出的一部分
+
+    Args:
+        handle: 压缩摘要中给出的结果句柄，形如 res-0123456789ab
+        start_line: 起始行号（从 0 开始，含）
+        end_line: 结束行号（不含），单次最多返回 200 行
+        pattern: 正则表达式；指定时返回所有匹配的行，忽略行号区间
+
+    Returns:
+        带行号的文本片段
+    """
+    try:
+        return get_result_store().fetch(handle, start_line, end_line, pattern)
+    except (ValueError, re.error) as e:
+        return f"错误: {e}"
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+沙箱会话预加载数据集
+演示中针对同一个 data.csv 的每个问题，模型都会在沙箱里重新 read_csv 一遍。
+bootstrap_session 在会话租用后先把注册的数据集送进沙箱（stage_file，内容未变化时不重复上传），
+再用一次 executeCode（clearContext 为 False）读成同名 DataFrame 变量常驻内核；
+describe_sandbox_datasets 生成变量说明放进系统提示词，后续问题直接使用变量，少一次解析和工具往返
+"""
+
+import json
+import os
+
+from sandbox_stream import invoke_and_collect
+from sandbox_upload import stage_file
+
+# {变量名: {"path": 本地路径, "remote_path": 沙箱内路径（默认同名文件）, 其余为 pandas 读取参数}}
+DEFAULT_SANDBOX_DATASETS = {
+    "data": {"path": "data/data.csv", "remote_path": "data.csv"},
+}
+
+# 在沙箱内执行：读取数据集绑定到全局变量，打印每个变量的形状和列类型；辅助函数执行后删除
+_BOOTSTRAP_CODE = """
+import numpy as np
+import pandas as pd
+
+def _sandbox_bootstrap(specs):
+    import json
+    summary = {{}}
+    for name, spec in specs.items():
+        path, options = spec["remote_path"], spec["read_kwargs"]
+        if path.endswith(".parquet"):
+            frame = pd.read_parquet(path, **options)
+        elif path.endswith(".json"):
+            frame = pd.read_json(path, **options)
+        else:
+            frame = pd.read_csv(path, **options)
+        globals()[name] = frame
+        summary[name] = {{"rows": len(frame), "columns": {{str(c): str(t) for c, t in frame.dtypes.items()}}}}
+    print(json.dumps(summary))
+_sandbox_bootstrap({specs!r})
+del _sandbox_bootstrap
+"""
+
+
+def _normalize(datasets):
+    specs = {}
+    for name, spec in datasets.items():
+        spec = {"path": spec} if isinstance(spec, str) else dict(spec)
+        path = spec.pop("path")
+        remote_path = spec.pop("remote_path", os.path.basename(path))
+        specs[name] = {"path": path, "remote_path": remote_path, "read_kwargs": spec}
+    return specs
+
+
+def bootstrap_session(code_client, datasets=None) -> dict:
+    """把注册的数据集上传并加载为沙箱内核中的同名 DataFrame
+
+    会话归还到池中时会 clear_context，因此每次租用后都要调用一次；文件已在沙箱中时只付出解析成本。
+    上传校验失败时抛出 RuntimeError，不会把内容不对的文件读进内核
+
+    Returns:
+        {变量名: {"remote_path", "rows", "columns": {列名: dtype}, "upload": stage_file 报告}}
+    """
+    specs = _normalize(DEFAULT_SANDBOX_DATASETS if datasets is None else datasets)
+    uploads = {name: stage_file(code_client, spec["path"], spec["remote_path"]) for name, spec in specs.items()}
+    unverified = [name for name, report in uploads.items() if not report["verified"]]
+    if unverified:
+        raise RuntimeError(f"沙箱数据集上传校验失败: {', '.join(unverified)}")
+    code = _BOOTSTRAP_CODE.format(specs={
+        name: {"remote_path": spec["remote_path"], "read_kwargs": spec["read_kwargs"]} for name, spec in specs.items()
+    })
+    result = invoke_and_collect(code_client, "executeCode", {
+        "code": code,
+        "language": "python",
+        "clearContext": False
+    })
+    stdout = (result.get("structuredContent") or {}).get("stdout", "").strip()
+    if result.get("isError") or not stdout:
+        text = "\n".join(item.get("text", "") for item in result.get("content", []) if item.get("type") == "text")
+        raise RuntimeError(f"沙箱数据集预加载失败: {text}")
+    summary = json.loads(stdout.splitlines()[-1])
+    return {
+        name: {"remote_path": specs[name]["remote_path"], **info, "upload": uploads[name]}
+        for name, info in summary.items()
+    }
+
+
+def describe_sandbox_datasets(loaded: dict) -> str:
+    """生成系统提示词中的变量说明"""
+    lines = []
+    for name, info in loaded.items():
+        columns = ", ".join(f"{column} ({dtype})" for column, dtype in info["columns"].items())
+        lines.append(f"- `{name}`: pandas DataFrame loaded from '{info['remote_path']}', "
+                     f"{info['rows']} rows; columns: {columns}")
+    return ("PRELOADED VARIABLES: the sandbox already has pandas as pd, numpy as np and the following DataFrames "
+            "in memory. Use these variables directly instead of re-reading the files:\n" + "\n".join(lines))
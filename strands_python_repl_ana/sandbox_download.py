@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+CodeInterpreter 沙箱批量下载
+原来每个文件一次 readFiles、串行下载。download_files 先用一次 executeCode 在沙箱内计算所有文件的 SHA-256，
+与本地清单对比后只下载有变化的文件；需要下载的路径按批合并到一次 readFiles 调用，多个批次并行执行，
+blob 分段解码后写入临时文件，校验哈希一致后才替换目标文件；单个批次失败只影响该批次的文件
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from file_hashing import remote_file_hashes
+from sandbox_stream import invoke_and_collect
+
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_MAX_WORKERS = 4
+MANIFEST_NAME = ".sandbox_manifest.json"
+# 分段解码时每段的 base64 字符数，必须是 4 的倍数
+_DECODE_CHARS = 4 * 64 * 1024
+_WRITE_BYTES = 1024 * 1024
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    # 所有路径都被拒绝或都已失败时 local_dir 可能还没有创建
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class HashMismatchError(ValueError):
+    """下载内容的 SHA-256 与沙箱内探测到的不一致"""
+
+
+def _write_resource(resource: dict, local_path: str, expected_sha256: str = None) -> dict:
+    """把 readFiles 返回的资源写入磁盘，返回写入的字节数和 SHA-256
+
+    blob 可能已由 botocore 解码为 bytes，也可能是 base64 字符串；字符串按段解码，不在内存里拼出完整文件。
+    内容先写入 .part 临时文件，哈希与 expected_sha256 一致（或未给出）后才替换目标文件，
+    不一致时删除临时文件并抛出 HashMismatchError，原有的本地文件保持不变
+    """
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    tmp = local_path + ".part"
+    with open(tmp, "wb") as f:
+        if "blob" in resource:
+            blob = resource["blob"]
+            if isinstance(blob, str):
+                pieces = (base64.b64decode(blob[i:i + _DECODE_CHARS]) for i in range(0, len(blob), _DECODE_CHARS))
+            else:
+                pieces = (blob[i:i + _WRITE_BYTES] for i in range(0, len(blob), _WRITE_BYTES))
+        else:
+            data = resource.get("text", "").encode("utf-8")
+            pieces = (data[i:i + _WRITE_BYTES] for i in range(0, len(data), _WRITE_BYTES))
+        for piece in pieces:
+            digest.update(piece)
+            size += len(piece)
+            f.write(piece)
+    if expected_sha256 and digest.hexdigest() != expected_sha256:
+        os.remove(tmp)
+        raise HashMismatchError(f"哈希不一致: 期望 {expected_sha256}，实际 {digest.hexdigest()}")
+    os.replace(tmp, local_path)
+    return {"size": size, "sha256": digest.hexdigest()}
+
+
+def _resource_path(resource: dict, requested) -> str:
+    """readFiles 用 uri 标识文件（file:///path 或相对路径），映射回请求的路径"""
+    uri = resource.get("uri", "")
+    for path in requested:
+        if uri == path or uri.endswith("/" + path.lstrip("/")):
+            return path
+    return None
+
+
+def local_target(local_dir: str, prefix: str, path: str) -> str:
+    """沙箱路径对应的本地保存路径；绝对路径或跳出 local_dir 的路径抛出 ValueError"""
+    normalized = os.path.normpath(path)
+    if os.path.isabs(path) or normalized == ".." or normalized.startswith(".." + os.sep):
+        raise ValueError(f"沙箱路径必须是不跳出工作目录的相对路径: {path}")
+    root = os.path.realpath(local_dir)
+    full = os.path.realpath(os.path.join(root, prefix + normalized))
+    if os.path.commonpath([full, root]) != root:
+        raise ValueError(f"本地路径跳出了保存目录: {prefix + path}")
+    return full
+
+
+def download_files(code_client, paths, local_dir: str = ".", prefix: str = "",
+                   batch_size: int = DEFAULT_BATCH_SIZE, max_workers: int = DEFAULT_MAX_WORKERS,
+                   manifest_path: str = None, verbose: bool = True) -> dict:
+    """批量下载沙箱文件，只下载与本地清单不同的文件
+
+    Args:
+        code_client: CodeInterpreter 客户端
+        paths: 沙箱内的文件路径列表
+        local_dir: 本地保存目录
+        prefix: 本地文件名前缀，例如 "downloaded_"
+        batch_size: 每次 readFiles 请求的路径数
+        max_workers: 并行批次数
+        manifest_path: 清单文件路径，默认 local_dir 下的 .sandbox_manifest.json
+        verbose: 是否打印每个文件的处理结果
+
+    Returns:
+        同步报告：下载/跳过/失败的文件、字节数、耗时、MB/s
+    """
+    started = time.perf_counter()
+    manifest_path = manifest_path or os.path.join(local_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    report = {"fetched": [], "skipped": [], "failed": [], "bytes": 0}
+
+    # 不安全的路径不下载，避免写到 local_dir 之外
+    local_paths = {}
+    for path in paths:
+        try:
+            local_paths[path] = local_target(local_dir, prefix, path)
+        except ValueError as e:
+            report["failed"].append({"path": path, "error": str(e)})
+    paths = [path for path in paths if path in local_paths]
+    remote = remote_file_hashes(code_client, paths)
+
+    to_fetch = []
+    for path in paths:
+        info = remote.get(path)
+        entry = manifest.get(path)
+        if remote and info is None:
+            report["failed"].append({"path": path, "error": "沙箱中不存在该文件"})
+        elif (info and entry and entry["sha256"] == info["sha256"]
+              and os.path.exists(local_paths[path]) and os.path.getsize(local_paths[path]) == info["size"]):
+            report["skipped"].append(path)
+        else:
+            to_fetch.append(path)
+
+    lock = threading.Lock()
+
+    def fetch_batch(batch):
+        result = invoke_and_collect(code_client, "readFiles", {"paths": batch})
+        received = set()
+        for item in result.get("content", []):
+            resource = item.get("resource")
+            if item.get("type") != "resource" or not resource:
+                continue
+            path = _resource_path(resource, batch)
+            if path is None:
+                continue
+            received.add(path)
+            try:
+                written = _write_resource(resource, local_paths[path], (remote.get(path) or {}).get("sha256"))
+            except (HashMismatchError, OSError) as e:
+                with lock:
+                    report["failed"].append({"path": path, "error": str(e)})
+                continue
+            with lock:
+                manifest[path] = {"sha256": written["sha256"], "size": written["size"],
+                                  "local_path": local_paths[path]}
+                report["fetched"].append(path)
+                report["bytes"] += written["size"]
+        with lock:
+            for path in batch:
+                if path not in received:
+                    report["failed"].append({"path": path, "error": "readFiles 未返回该文件"})
+
+    def run_batch(batch):
+        # 一个批次失败（网络错误等）只记录这一批的文件，不影响其他批次
+        try:
+            fetch_batch(batch)
+        except Exception as e:
+            with lock:
+                done = set(report["fetched"]) | {failure["path"] for failure in report["failed"]}
+                for path in batch:
+                    if path not in done:
+                        report["failed"].append({"path": path, "error": f"readFiles 失败: {e}"})
+
+    batches = [to_fetch[i:i + batch_size] for i in range(0, len(to_fetch), batch_size)]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(run_batch, batches))
+    finally:
+        # 已成功的文件总是写回清单
+        save_manifest(manifest_path, manifest)
+
+    seconds = time.perf_counter() - started
+    report["batches"] = len(batches)
+    report["seconds"] = round(seconds, 3)
+    report["mb_per_s"] = round(report["bytes"] / 1024 / 1024 / seconds, 2) if seconds else None
+    if verbose:
+        for path in report["fetched"]:
+            print(f"📥 下载: {path} -> {local_paths[path]}")
+        for path in report["skipped"]:
+            print(f"⏭️  未变化，跳过: {path}")
+        for failure in report["failed"]:
+            print(f"❌ 下载失败: {failure['path']}（{failure['error']}）")
+    return report
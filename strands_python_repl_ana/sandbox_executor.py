@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+沙箱工具调用并发执行
+模型在同一轮里发出多个互相独立的 execute_python 调用时，它们都打到同一个 code_client 上，
+沙箱只能一个接一个地执行，这一轮的耗时是所有调用之和。
+SandboxToolExecutor 在 Strands 的 ConcurrentToolExecutor 基础上，把模型标记为 independent 的调用分配到不同的会话：
+第一个调用使用主会话，其余从会话池租用额外会话（租用时执行 bootstrap 预加载数据集，整个运行期间复用），
+结果仍按调用顺序汇总，这一轮的耗时接近最慢的一个调用。
+各会话的变量互不相通，执行器记录每个变量由哪个会话定义，之后读取这些变量的调用固定发到定义它的会话；
+未标记的调用都在主会话（或其依赖变量所在的会话）上执行
+"""
+
+import ast
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from strands.tools.executors import ConcurrentToolExecutor
+
+from exec_cache import free_names
+
+# invocation_state 中保存本轮分配结果的键：{toolUseId: (client, asyncio.Lock, 不可用的变量名)}
+SESSIONS_KEY = "sandbox_sessions"
+
+SANDBOX_TOOLS = ("execute_python",)
+
+# 工具参数中表示“可以放到其他会话并行执行”的字段
+INDEPENDENT_FLAG = "independent"
+
+
+def bound_names(tree: ast.AST) -> set:
+    """代码中赋值或 def/class 绑定的名字，执行后这些变量只留在执行它的会话里
+
+    import 不计入：重新导入的成本很低，预加载时各会话也都已导入 pd/np，按导入名固定会话只会让调用无谓地集中
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+    return names
+
+
+def _parse(tool_use):
+    try:
+        return ast.parse(tool_use["input"].get("code", ""))
+    except SyntaxError:
+        return None
+
+
+class SandboxToolExecutor(ConcurrentToolExecutor):
+    """把同一轮中的多个沙箱工具调用分配到不同的会话上并发执行"""
+
+    def __init__(self, pool, primary, bootstrap=None, tool_names=SANDBOX_TOOLS, max_sessions: int = None):
+        """
+        Args:
+            pool: SandboxSessionPool，额外会话从这里租用
+            primary: 主会话（Agent 原本使用的 code_client）
+            bootstrap: 可选 bootstrap(client)，新租到的会话在使用前调用一次，例如预加载数据集
+            tool_names: 需要分配会话的工具名
+            max_sessions: 最多同时使用的会话数（含主会话），默认不限制，受池中空闲会话数约束
+        """
+        super().__init__()
+        self.pool = pool
+        self.primary = primary
+        self.bootstrap = bootstrap
+        self.tool_names = set(tool_names)
+        self.max_sessions = max_sessions
+        self._extra = []
+        # {变量名: 定义它的会话}
+        self._owners = {}
+        self.stats = {"parallel_turns": 0, "max_parallel": 1, "extra_sessions": 0, "pinned_calls": 0,
+                      "bootstrap_failures": 0}
+        # 最近一次 bootstrap 失败的异常，退回串行执行时用于排查
+        self.last_bootstrap_error = None
+        self._stats_lock = threading.Lock()
+
+    def _lease_one(self):
+        try:
+            # 池里没有空闲会话时不等待，多出来的调用与已有会话共享
+            client = self.pool.acquire(timeout=0)
+        except TimeoutError:
+            return None
+        try:
+            if self.bootstrap is not None:
+                self.bootstrap(client)
+        except Exception as e:
+            # 这个会话不参与并发，本轮多出来的调用共享已有会话；记录原因，否则只能看到并发度下降
+            with self._stats_lock:
+                self.stats["bootstrap_failures"] += 1
+                self.last_bootstrap_error = e
+            print(f"⚠️  额外会话预加载失败，已归还会话池: {type(e).__name__}: {e}")
+            self.pool.release(client)
+            return None
+        return client
+
+    def _ensure_sessions(self, count: int):
+        """保证除主会话外至少有 count 个额外会话，新会话并行租用和预加载"""
+        if self.max_sessions is not None:
+            count = min(count, self.max_sessions - 1)
+        missing = count - len(self._extra)
+        if missing <= 0:
+            return
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            leased = [client for client in executor.map(lambda _: self._lease_one(), range(missing)) if client]
+        self._extra.extend(leased)
+        self.stats["extra_sessions"] = len(self._extra)
+
+    def _route(self, tree):
+        """按调用读取的变量找到持有它们的会话；变量分散在多个会话时选持有最多的，其余变量名作为不可用返回"""
+        needed = free_names(tree) if tree is not None else set()
+        holders = {}
+        for name in needed:
+            if name in self._owners:
+                holders.setdefault(id(self._owners[name]), []).append(name)
+        if not holders:
+            return None, []
+        owner_id = max(holders, key=lambda key: len(holders[key]))
+        unavailable = sorted(name for key, names in holders.items() if key != owner_id for name in names)
+        owner = next(client for client in [self.primary] + self._extra if id(client) == owner_id)
+        return owner, unavailable
+
+    def _plan(self, sandbox_uses):
+        """返回 [(tool_use, tree, client 或 None, unavailable)]，client 为 None 的是可以分散执行的独立调用"""
+        plan = []
+        for tool_use in sandbox_uses:
+            tree = _parse(tool_use)
+            client, unavailable = self._route(tree)
+            if client is not None and client is not self.primary:
+                self.stats["pinned_calls"] += 1
+            elif tool_use["input"].get(INDEPENDENT_FLAG) is not True:
+                client = self.primary
+            plan.append((tool_use, tree, client, unavailable))
+        return plan
+
+    async def _execute(self, agent, tool_uses, tool_results, cycle_trace, cycle_span, invocation_state,
+                       structured_output_context=None):
+        sandbox_uses = [tool_use for tool_use in tool_uses if tool_use["name"] in self.tool_names]
+        plan = self._plan(sandbox_uses)
+
+        # 独立调用优先放到本轮还空闲的会话上，不够时从会话池补租
+        busy = {id(client) for _, _, client, _ in plan if client is not None}
+        independent = [index for index, (_, _, client, _) in enumerate(plan) if client is None]
+        if independent:
+            idle = [client for client in [self.primary] + self._extra if id(client) not in busy]
+            if len(idle) < len(independent):
+                await asyncio.to_thread(self._ensure_sessions, len(self._extra) + len(independent) - len(idle))
+                idle = [client for client in [self.primary] + self._extra if id(client) not in busy]
+            # 会话不够时轮流分配，同一会话上的调用由锁串行执行
+            targets = idle or [self.primary] + self._extra
+            for position, index in enumerate(independent):
+                tool_use, tree, _, unavailable = plan[index]
+                plan[index] = (tool_use, tree, targets[position % len(targets)], unavailable)
+
+        used = {id(client) for _, _, client, _ in plan}
+        if len(used) > 1:
+            self.stats["parallel_turns"] += 1
+        self.stats["max_parallel"] = max(self.stats["max_parallel"], len(used))
+
+        locks = {id(client): asyncio.Lock() for client in [self.primary] + self._extra}
+        assignments = {}
+        for tool_use, tree, client, unavailable in plan:
+            assignments[tool_use["toolUseId"]] = (client, locks[id(client)], unavailable)
+            # 本次调用定义的变量之后只在这个会话里存在
+            for name in bound_names(tree) if tree is not None else ():
+                self._owners[name] = client
+        invocation_state[SESSIONS_KEY] = assignments
+        try:
+            async for event in super()._execute(agent, tool_uses, tool_results, cycle_trace, cycle_span,
+                                                invocation_state, structured_output_context):
+                yield event
+        finally:
+            invocation_state.pop(SESSIONS_KEY, None)
+
+    def release(self):
+        """运行结束后把额外会话还给会话池"""
+        for client in self._extra:
+            self.pool.release(client)
+        self._extra = []
+        self._owners = {}
+
+
+def unavailable_names(tool_context) -> list:
+    """本次调用读取、但定义在其他会话里的变量名；非空时这些变量在分配到的会话中不存在"""
+    if tool_context is None:
+        return []
+    assignment = tool_context.invocation_state.get(SESSIONS_KEY, {}).get(tool_context.tool_use["toolUseId"])
+    return assignment[2] if assignment else []
+
+
+@asynccontextmanager
+async def sandbox_session(tool_context, default_client):
+    """在工具内取得分配给本次调用的会话；没有经过 SandboxToolExecutor 时使用 default_client"""
+    if tool_context is None:
+        yield default_client
+        return
+    assignments = tool_context.invocation_state.get(SESSIONS_KEY, {})
+    client, lock, _ = assignments.get(tool_context.tool_use["toolUseId"], (default_client, None, []))
+    if lock is None:
+        yield client
+        return
+    async with lock:
+        yield client
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+CodeInterpreter invoke 结果的流式消费
+invoke 返回的 response["stream"] 可能包含多个事件，长时间运行的代码会分段输出 stdout/stderr，
+只取第一个事件会丢掉后面的输出，而且在代码跑完之前没有任何反馈。
+consume_invoke_stream 逐个处理事件：stdout/stderr 片段一到就转发给回调（控制台、Agent 回调），
+同时增量合并出与单事件结果同样结构的最终结果
+"""
+
+import asyncio
+import sys
+import threading
+
+
+def print_output(stream: str, text: str):
+    """把沙箱输出片段原样写到本地控制台"""
+    target = sys.stderr if stream == "stderr" else sys.stdout
+    target.write(text)
+    target.flush()
+
+
+class SandboxResultBuilder:
+    """把多个 result 事件合并成一个结果：文本和 stdout/stderr 拼接，其他字段以最后一次为准"""
+
+    def __init__(self):
+        self.result = {"isError": False, "content": []}
+        self._text = []
+        self._stdout = []
+        self._stderr = []
+        self.events = 0
+
+    def add_result(self, result: dict, on_output=None):
+        self.events += 1
+        for key, value in result.items():
+            if key not in ("content", "structuredContent", "isError"):
+                self.result[key] = value
+        self.result["isError"] = self.result["isError"] or bool(result.get("isError"))
+        for item in result.get("content", []):
+            if item.get("type") == "text":
+                self._text.append(item.get("text", ""))
+            else:
+                self.result["content"].append(item)
+        structured = result.get("structuredContent")
+        if structured:
+            merged = self.result.setdefault("structuredContent", {})
+            for key, value in structured.items():
+                if key == "stdout":
+                    self._stdout.append(value)
+                elif key == "stderr":
+                    self._stderr.append(value)
+                else:
+                    merged[key] = value
+            if on_output is not None:
+                if structured.get("stdout"):
+                    on_output("stdout", structured["stdout"])
+                if structured.get("stderr"):
+                    on_output("stderr", structured["stderr"])
+
+    def add_exception(self, name: str, detail):
+        """流中的异常事件（如 throttlingException）记为错误结果"""
+        self.events += 1
+        self.result["isError"] = True
+        message = detail.get("message", "") if isinstance(detail, dict) else str(detail)
+        self._text.append(f"{name}: {message}")
+
+    def build(self) -> dict:
+        result = dict(self.result)
+        if self._text:
+            result["content"] = [{"type": "text", "text": "".join(self._text)}] + result["content"]
+        if "structuredContent" in result:
+            result["structuredContent"] = {
+                **result["structuredContent"],
+                "stdout": "".join(self._stdout),
+                "stderr": "".join(self._stderr),
+            }
+        return result
+
+
+def consume_invoke_stream(response, on_output=None) -> dict:
+    """消费 invoke 返回的全部事件，返回合并后的结果
+
+    Args:
+        response: code_client.invoke 的返回值
+        on_output: 可选回调 on_output(stream, text)，stream 为 "stdout" 或 "stderr"，每个片段到达时调用
+    """
+    builder = SandboxResultBuilder()
+    for event in response["stream"]:
+        for name, payload in event.items():
+            if name == "result":
+                builder.add_result(payload, on_output)
+            else:
+                builder.add_exception(name, payload)
+    return builder.build()
+
+
+def invoke_and_collect(code_client, method: str, arguments: dict, on_output=None) -> dict:
+    """调用沙箱方法并消费完整的事件流"""
+    return consume_invoke_stream(code_client.invoke(method, arguments), on_output)
+
+
+async def stream_invoke(code_client, method: str, arguments: dict, on_output=None):
+    """异步版本：在线程中读取事件流，逐个产出输出片段，最后产出合并结果
+
+    Yields:
+        {"stream": "stdout"|"stderr", "text": ...} 形式的片段，最后一个是 {"result": 合并结果}
+    """
+    loop = asyncio.get_running_loop()
+    fragments = asyncio.Queue()
+    done = object()
+
+    def forward(stream, text):
+        if on_output is not None:
+            on_output(stream, text)
+        loop.call_soon_threadsafe(fragments.put_nowait, {"stream": stream, "text": text})
+
+    outcome = {}
+
+    def consume():
+        try:
+            outcome["result"] = invoke_and_collect(code_client, method, arguments, forward)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            loop.call_soon_threadsafe(fragments.put_nowait, done)
+
+    threading.Thread(target=consume, name=f"sandbox-{method}", daemon=True).start()
+    while True:
+        fragment = await fragments.get()
+        if fragment is done:
+            break
+        yield fragment
+    if "error" in outcome:
+        raise outcome["error"]
+    yield {"result": outcome["result"]}
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+CodeInterpreter 沙箱分块并行上传
+把整个文件读成字符串、用一个 writeFiles 文本条目上传，大文件很慢，二进制文件也传不了。
+upload_file 把文件切成固定大小的块，逐块压缩后作为 blob（botocore 负责 base64 编码）
+用多个线程并行调用 writeFiles 写入沙箱临时目录，最后在沙箱内用 executeCode 按顺序解压拼接、
+校验 SHA-256，并报告吞吐（MB/s）。
+stage_file 在上传前用一次 executeCode 探测沙箱内文件的哈希，内容相同就不重复上传；本地清单只作记录
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from file_hashing import file_hash, remote_file_hashes
+from sandbox_stream import invoke_and_collect
+
+DEFAULT_CHUNK_BYTES = int(os.getenv("SANDBOX_UPLOAD_CHUNK_MB", "4")) * 1024 * 1024
+DEFAULT_MAX_WORKERS = int(os.getenv("SANDBOX_UPLOAD_WORKERS", "4"))
+# 压缩级别 1 已经能把 CSV 压到 1/4 左右，更高级别的收益抵不上 CPU 时间
+COMPRESS_LEVEL = 1
+# 单块 writeFiles 失败时的重试次数
+CHUNK_RETRIES = 2
+
+UPLOAD_ROOT = ".upload"
+
+# 记录每个会话已持有哪些文件：{session_id: {"updated_at": ..., "files": {remote_path: sha256}}}
+STAGING_MANIFEST = os.getenv("SANDBOX_STAGING_MANIFEST", ".sandbox_staging.json")
+# 超过这个时间没有更新的会话记录视为已过期并清理（会话最长 8 小时）
+STAGING_RETENTION_SECONDS = 8 * 3600
+# 多个会话并行 bootstrap 时会同时调用 stage_file，清单的读-改-写需要串行
+_staging_lock = threading.Lock()
+
+# 在沙箱内执行的拼接脚本：.z 块解压，.raw 块原样写入，校验通过后才替换目标文件
+_ASSEMBLE_CODE = """
+import hashlib, json, os, shutil, zlib
+_parts_dir, _target, _expected = {parts_dir!r}, {target!r}, {sha256!r}
+_digest = hashlib.sha256()
+_size = 0
+_tmp = _target + ".uploading"
+if os.path.dirname(_target):
+    os.makedirs(os.path.dirname(_target), exist_ok=True)
+with open(_tmp, "wb") as _out:
+    for _name in sorted(os.listdir(_parts_dir)):
+        with open(os.path.join(_parts_dir, _name), "rb") as _f:
+            _data = _f.read()
+        if _name.endswith(".z"):
+            _data = zlib.decompress(_data)
+        _digest.update(_data)
+        _size += len(_data)
+        _out.write(_data)
+shutil.rmtree(_parts_dir, ignore_errors=True)
+_ok = _digest.hexdigest() == _expected
+if _ok:
+    os.replace(_tmp, _target)
+else:
+    os.remove(_tmp)
+print(json.dumps({{"verified": _ok, "sha256": _digest.hexdigest(), "bytes": _size}}))
+"""
+
+
+def _result_error(result: dict) -> str:
+    if not result.get("isError"):
+        return ""
+    texts = [item.get("text", "") for item in result.get("content", []) if item.get("type") == "text"]
+    return "\n".join(texts) or json.dumps(result, default=str)
+
+
+def _iter_chunks(local_path, chunk_bytes, digest):
+    """逐块读取文件，同时累计整个文件的 SHA-256"""
+    with open(local_path, "rb") as f:
+        index = 0
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            digest.update(data)
+            yield index, data
+            index += 1
+
+
+def _remove_parts(code_client, parts_dir):
+    """上传中途失败时删除沙箱内已写入的分块；清理失败不掩盖原来的错误"""
+    try:
+        invoke_and_collect(code_client, "executeCode", {
+            "code": f"import shutil\nshutil.rmtree({parts_dir!r}, ignore_errors=True)",
+            "language": "python",
+            "clearContext": False
+        })
+    except Exception:
+        pass
+
+
+def _encode_chunk(data: bytes):
+    """压缩后更小就用压缩块，否则（图片、压缩包等）原样上传"""
+    compressed = zlib.compress(data, COMPRESS_LEVEL)
+    if len(compressed) < len(data):
+        return compressed, ".z"
+    return data, ".raw"
+
+
+def upload_file(code_client, local_path: str, remote_path: str = None,
+                chunk_bytes: int = DEFAULT_CHUNK_BYTES, max_workers: int = DEFAULT_MAX_WORKERS) -> dict:
+    """把本地文件分块压缩、并行上传到沙箱，并在沙箱内拼接校验
+
+    Args:
+        code_client: 已启动会话的 CodeInterpreter
+        local_path: 本地文件路径
+        remote_path: 沙箱内的相对路径，默认与本地文件同名
+        chunk_bytes: 每块的原始字节数
+        max_workers: 并行 writeFiles 的线程数
+
+    Returns:
+        上传报告：字节数、传输字节数、块数、耗时、MB/s、SHA-256、是否校验通过
+
+    Raises:
+        RuntimeError: 分块写入或拼接失败，或沙箱内文件的 SHA-256 与本地不一致；沙箱内的临时分块会被删除
+    """
+    remote_path = remote_path or os.path.basename(local_path)
+    if remote_path.startswith("/"):
+        raise ValueError(f"沙箱路径必须是相对路径: {remote_path}")
+
+    parts_dir = f"{UPLOAD_ROOT}/{uuid.uuid4().hex[:12]}"
+    digest = hashlib.sha256()
+    stats = {"chunks": 0, "wire_bytes": 0}
+    stats_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def write_chunk(index, data):
+        payload, suffix = _encode_chunk(data)
+        entry = {"path": f"{parts_dir}/part-{index:06d}{suffix}", "blob": payload}
+        for attempt in range(CHUNK_RETRIES + 1):
+            try:
+                error = _result_error(invoke_and_collect(code_client, "writeFiles", {"content": [entry]}))
+            except Exception as e:  # 网络抖动等，重试
+                error = str(e)
+            if not error:
+                break
+            if attempt == CHUNK_RETRIES:
+                raise RuntimeError(f"上传第 {index} 块失败: {error}")
+        with stats_lock:
+            stats["chunks"] += 1
+            stats["wire_bytes"] += len(payload)
+
+    # 拼接脚本会自己删除分块目录；在那之前失败时由 finally 清理
+    parts_removed = False
+    try:
+        # 限制在途块数，避免整个文件同时驻留内存
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for index, data in _iter_chunks(local_path, chunk_bytes, digest):
+                if len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(write_chunk, index, data))
+            for future in pending:
+                future.result()
+
+        size = os.path.getsize(local_path)
+        if size == 0:
+            # 空文件没有任何块，直接写入
+            error = _result_error(invoke_and_collect(code_client, "writeFiles", {
+                "content": [{"path": remote_path, "text": ""}]
+            }))
+            if error:
+                raise RuntimeError(f"写入空文件失败: {error}")
+            parts_removed = True
+            verified = {"verified": True, "sha256": digest.hexdigest(), "bytes": 0}
+        else:
+            code = _ASSEMBLE_CODE.format(parts_dir=parts_dir, target=remote_path, sha256=digest.hexdigest())
+            result = invoke_and_collect(code_client, "executeCode", {
+                "code": code,
+                "language": "python",
+                "clearContext": False
+            })
+            error = _result_error(result)
+            if error:
+                raise RuntimeError(f"沙箱内拼接失败: {error}")
+            lines = (result.get("structuredContent") or {}).get("stdout", "").strip().splitlines()
+            if not lines:
+                raise RuntimeError(f"沙箱内拼接没有输出校验结果: {remote_path}")
+            verified = json.loads(lines[-1])
+            parts_removed = True
+    finally:
+        if not parts_removed:
+            _remove_parts(code_client, parts_dir)
+
+    if not (verified["verified"] and verified["sha256"] == digest.hexdigest()):
+        raise RuntimeError(f"上传校验失败: {local_path} -> {remote_path}，"
+                           f"本地 SHA-256 {digest.hexdigest()}，沙箱内 {verified['sha256']}")
+
+    seconds = time.perf_counter() - started
+    return {
+        "local_path": local_path,
+        "remote_path": remote_path,
+        "bytes": size,
+        "wire_bytes": stats["wire_bytes"],
+        "chunks": stats["chunks"],
+        "seconds": round(seconds, 3),
+        "mb_per_s": round(size / 1024 / 1024 / seconds, 2) if seconds else None,
+        "sha256": digest.hexdigest(),
+        "verified": True,
+    }
+
+
+def format_upload_report(report: dict) -> str:
+    if report.get("action") == "probe":
+        return (f"{report['local_path']} -> {report['remote_path']}: 沙箱中已有相同内容（哈希探测），跳过上传，"
+                f"耗时 {report['seconds']:.2f} s")
+    ratio = report["wire_bytes"] / report["bytes"] if report["bytes"] else 1
+    return (f"{report['local_path']} -> {report['remote_path']}: {report['bytes'] / 1024 / 1024:.2f} MB，"
+            f"{report['chunks']} 块，传输 {report['wire_bytes'] / 1024 / 1024:.2f} MB（压缩比 {ratio:.2f}），"
+            f"耗时 {report['seconds']:.2f} s，{report['mb_per_s']} MB/s，"
+            f"校验{'通过' if report['verified'] else '失败'}")
+
+
+def _load_staging(manifest_path):
+    # 清单只是记录，不存在或损坏时当作空清单
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict):
+        return {}
+    cutoff = time.time() - STAGING_RETENTION_SECONDS
+    return {session: entry for session, entry in manifest.items()
+            if isinstance(entry, dict) and entry.get("updated_at", 0) >= cutoff}
+
+
+def _save_staging(manifest_path, manifest):
+    # 每次写入使用独立的临时文件，再原子替换
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(manifest_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, manifest_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def stage_file(code_client, local_path: str, remote_path: str = None,
+               manifest_path: str = STAGING_MANIFEST, **upload_kwargs) -> dict:
+    """只在沙箱内容与本地不同时上传
+
+    总是用一次 executeCode 探测沙箱内文件的哈希：沙箱里的代码可能已经改写了文件，本地清单只是上次上传的记录，
+    不能代替探测。哈希一致则跳过，否则调用 upload_file 上传。结果写回清单
+
+    Returns:
+        upload_file 的报告，额外的 "action" 字段为 "probe"（探测一致，跳过上传）或 "upload"，
+        "manifest_hit" 表示清单记录与本地哈希是否一致（仅供参考）
+    """
+    remote_path = remote_path or os.path.basename(local_path)
+    local_hash = file_hash(local_path)
+    session_id = code_client.session_id or ""
+    with _staging_lock:
+        recorded = _load_staging(manifest_path).get(session_id, {}).get("files", {})
+    started = time.perf_counter()
+
+    manifest_hit = recorded.get(remote_path) == local_hash
+    if (remote_file_hashes(code_client, [remote_path]).get(remote_path) or {}).get("sha256") == local_hash:
+        action = "probe"
+    else:
+        action = "upload"
+
+    if action == "upload":
+        report = upload_file(code_client, local_path, remote_path, **upload_kwargs)
+    else:
+        seconds = time.perf_counter() - started
+        report = {
+            "local_path": local_path,
+            "remote_path": remote_path,
+            "bytes": os.path.getsize(local_path),
+            "wire_bytes": 0,
+            "chunks": 0,
+            "seconds": round(seconds, 3),
+            "mb_per_s": None,
+            "sha256": local_hash,
+            "verified": True,
+        }
+    # 上传期间其他线程可能已经写过清单，重新读取后再合并本次记录
+    with _staging_lock:
+        manifest = _load_staging(manifest_path)
+        session = manifest.setdefault(session_id, {"files": {}})
+        session.setdefault("files", {})[remote_path] = local_hash
+        session["updated_at"] = time.time()
+        _save_staging(manifest_path, manifest)
+    return {**report, "action": action, "manifest_hit": manifest_hit}
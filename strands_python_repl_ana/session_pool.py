@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+CodeInterpreter 会话池
+每个进程在导入时 start() 一个会话，启动延迟落在用户请求上，长时间分析还可能中途超时。
+SandboxSessionPool 预先启动 N 个热会话，后台线程定期用 get_session 做健康检查，
+在会话到期前主动换新；出租中的会话由后台线程用只读的 listFiles 保活（会话在无活动超过超时时间后终止）。
+Agent 运行时租用一个会话，结束后 clear_context 重置再放回池中。
+CODE_INTERPRETER_BACKEND=local 时池中是本地沙箱（见 local_sandbox.py）
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from bedrock_agentcore.tools.code_interpreter_client import CodeInterpreter, DEFAULT_IDENTIFIER
+
+from local_sandbox import create_code_interpreter
+
+DEFAULT_REGION = os.getenv("CODE_INTERPRETER_REGION", "ap-northeast-1")
+DEFAULT_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+DEFAULT_SESSION_TIMEOUT = int(os.getenv("SANDBOX_SESSION_TIMEOUT", "1200"))
+# 剩余寿命不足这个秒数的会话不再原样出租，先换新；应不短于一次运行的预计时长，默认为超时时间的一半
+DEFAULT_RENEW_MARGIN = int(os.getenv("SANDBOX_RENEW_MARGIN", "0")) or None
+DEFAULT_KEEPALIVE_INTERVAL = 60
+
+
+class PooledSession:
+    """池中的一个会话：CodeInterpreter 客户端和它最近一次活动的时间"""
+
+    def __init__(self, client: CodeInterpreter, timeout_seconds: int):
+        self.client = client
+        self.timeout_seconds = timeout_seconds
+        # None 表示会话没有在运行（尚未启动或换新失败）
+        self.active_at = None
+        # 后台已启动替代会话，这个会话不再出租：空闲时由后台停止，出租中的在归还时停止
+        self.retired = False
+        # 后台正在为它启动替代会话，acquire 优先选择其他空闲会话
+        self.replacing = False
+
+    def touch(self):
+        self.active_at = time.monotonic()
+
+    def remaining_seconds(self) -> float:
+        if self.active_at is None:
+            return 0
+        return self.active_at + self.timeout_seconds - time.monotonic()
+
+
+class SandboxSessionPool:
+    """预热、保活并出租 CodeInterpreter 会话"""
+
+    def __init__(self, region: str = DEFAULT_REGION, size: int = DEFAULT_POOL_SIZE,
+                 session_timeout_seconds: int = DEFAULT_SESSION_TIMEOUT,
+                 renew_margin_seconds: int = DEFAULT_RENEW_MARGIN,
+                 keepalive_interval: float = DEFAULT_KEEPALIVE_INTERVAL,
+                 identifier: str = DEFAULT_IDENTIFIER, client_factory=None):
+        self.region = region
+        self.size = size
+        self.session_timeout_seconds = session_timeout_seconds
+        self.renew_margin_seconds = min(renew_margin_seconds or session_timeout_seconds // 2,
+                                        session_timeout_seconds)
+        self.keepalive_interval = keepalive_interval
+        self.identifier = identifier
+        self.client_factory = client_factory or (lambda: create_code_interpreter(self.region))
+        self._idle = queue.Queue()
+        self._leased = {}
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._keepalive_thread = None
+        self.stats = {"started": 0, "renewed": 0, "renew_failures": 0, "leases": 0, "resets": 0,
+                      "keepalive_pings": 0, "lease_wait_seconds": 0.0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _start_session(self, session: PooledSession):
+        session.client.start(identifier=self.identifier, session_timeout_seconds=session.timeout_seconds)
+        session.touch()
+        self._count("started")
+
+    def start(self):
+        """并行启动 size 个会话并开始后台保活"""
+        sessions = [PooledSession(self.client_factory(), self.session_timeout_seconds) for _ in range(self.size)]
+        with ThreadPoolExecutor(max_workers=max(self.size, 1)) as executor:
+            list(executor.map(self._start_session, sessions))
+        with self._lock:
+            self._sessions.extend(sessions)
+        for session in sessions:
+            self._idle.put(session)
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="sandbox-keepalive", daemon=True)
+        self._keepalive_thread.start()
+        return self
+
+    @staticmethod
+    def _is_ready(session: PooledSession) -> bool:
+        try:
+            return session.client.get_session().get("status") == "READY"
+        except Exception:
+            return False
+
+    def is_healthy(self, session: PooledSession) -> bool:
+        """会话仍为 READY 且剩余寿命足够"""
+        return session.remaining_seconds() >= self.renew_margin_seconds and self._is_ready(session)
+
+    def renew(self, session: PooledSession):
+        """停掉旧会话并在同一个客户端上启动新会话（只在没有运行中代码时调用：租出前或归还时）
+
+        启动失败时会话标记为未运行（剩余寿命为 0），下次租用或后台检查时再试
+        """
+        session.active_at = None
+        try:
+            session.client.stop()
+        except Exception:
+            # 旧会话可能已经过期，停止失败不影响换新
+            session.client.session_id = None
+        try:
+            self._start_session(session)
+        except Exception:
+            self._count("renew_failures")
+            raise
+        self._count("renewed")
+
+    def _ping(self, session: PooledSession):
+        """用只读的 listFiles 产生一次活动，推迟会话的空闲超时；不碰 Python 上下文，可与运行中的代码并发"""
+        try:
+            session.client.invoke("listFiles", {"path": ""})
+        except Exception:
+            return
+        session.touch()
+        self._count("keepalive_pings")
+
+    def _replace(self, old: PooledSession):
+        """在队列之外启动一个新会话替代不健康的空闲会话，启动期间旧会话仍可出租，acquire 不会被换新阻塞"""
+        old.replacing = True
+        replacement = PooledSession(self.client_factory(), self.session_timeout_seconds)
+        try:
+            self._start_session(replacement)
+        except Exception:
+            # 保留原会话，下一轮再试
+            old.replacing = False
+            self._count("renew_failures")
+            return
+        with self._lock:
+            old.retired = True
+            self._sessions.remove(old)
+            self._sessions.append(replacement)
+            idle = id(old.client) not in self._leased
+        self._idle.put(replacement)
+        self._count("renewed")
+        if idle:
+            # 旧会话还留在队列里，acquire 取到时会跳过
+            self._stop_quietly(old)
+
+    def _keepalive_loop(self):
+        while not self._closed.wait(self.keepalive_interval):
+            with self._lock:
+                leased = list(self._leased.values())
+                idle = [s for s in self._sessions if id(s.client) not in self._leased]
+            for session in idle:
+                if self._closed.is_set():
+                    return
+                ready = self._is_ready(session)
+                if ready and session.remaining_seconds() >= self.renew_margin_seconds:
+                    continue
+                if not ready:
+                    # 已终止的会话不能原样出租：替代会话就绪前被租用时，由 acquire 当场换新
+                    session.active_at = None
+                self._replace(session)
+            # 出租中的会话不能换新（会丢掉运行中的状态），只保活
+            for session in leased:
+                self._ping(session)
+
+    def acquire(self, timeout: float = None) -> CodeInterpreter:
+        """租用一个会话，池中没有空闲会话时阻塞等待
+
+        剩余寿命不足 renew_margin_seconds 的会话先换新再出租；换新失败时会话放回池中并抛出 RuntimeError
+        """
+        if self._closed.is_set():
+            raise RuntimeError("会话池已关闭")
+        waited = time.perf_counter()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # 正在被后台替换的会话先放一边，没有其他空闲会话时才使用（需要时在下面当场换新）
+        skipped = []
+        try:
+            while True:
+                fallback = False
+                try:
+                    if skipped:
+                        session = self._idle.get_nowait()
+                    else:
+                        session = self._idle.get(
+                            timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    if not skipped:
+                        raise TimeoutError(f"{timeout} 秒内没有空闲的沙箱会话") from None
+                    session, fallback = skipped.pop(0), True
+                with self._lock:
+                    if session.retired:
+                        # 已被后台替换的旧会话
+                        continue
+                    if session.replacing and not fallback:
+                        skipped.append(session)
+                        continue
+                    self._leased[id(session.client)] = session
+                break
+        finally:
+            for other in skipped:
+                self._idle.put(other)
+        self._count("lease_wait_seconds", time.perf_counter() - waited)
+        if session.remaining_seconds() < self.renew_margin_seconds:
+            try:
+                self.renew(session)
+            except Exception as e:
+                # 放回池中，池不会因为一次换新失败而永久变小
+                with self._lock:
+                    self._leased.pop(id(session.client), None)
+                self._idle.put(session)
+                raise RuntimeError(f"沙箱会话换新失败: {e}") from e
+        self._count("leases")
+        return session.client
+
+    def release(self, client: CodeInterpreter, reset: bool = True):
+        """归还会话：清空 Python 上下文后放回池中，清空失败则换新；不会抛出异常"""
+        with self._lock:
+            session = self._leased.pop(id(client), None)
+        if session is None:
+            # 不是从这个池租出的会话，或者已经归还过
+            return
+        if self._closed.is_set() or session.retired:
+            self._stop_quietly(session)
+            return
+        try:
+            if reset:
+                client.clear_context()
+                self._count("resets")
+                session.touch()
+        except Exception:
+            try:
+                self.renew(session)
+            except Exception:
+                # 换新失败的会话剩余寿命为 0，下次租用或后台检查时再换新
+                pass
+        self._idle.put(session)
+
+    @contextmanager
+    def lease(self, timeout: float = None):
+        client = self.acquire(timeout)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    @staticmethod
+    def _stop_quietly(session: PooledSession):
+        try:
+            session.client.stop()
+        except Exception:
+            pass
+
+    def close(self):
+        """停止保活线程并关闭所有会话"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join(timeout=5)
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            self._stop_quietly(session)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> SandboxSessionPool:
+    """进程内共享的会话池，首次调用时启动，进程退出时关闭"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxSessionPool().start()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,186 @@
+"""LocalCodeInterpreter 测试：按 CodeInterpreter 的 invoke 接口驱动本地沙箱，并复用它测试 stage_file / download_files 的往返"""
+
+import json
+import os
+import threading
+
+import pytest
+
+from local_sandbox import LocalCodeInterpreter
+from sandbox_download import download_files
+from sandbox_upload import stage_file
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    # 测试不需要 pandas，少预导入几个库可以让工作进程更快启动
+    client = LocalCodeInterpreter(workdir_root=str(tmp_path), preload=("json",), timeout=30)
+    client.start()
+    yield client
+    client.stop()
+
+
+def result_of(response):
+    """检查响应保持 {"stream": [{"result": ...}]} 结构，返回 result"""
+    assert set(response) == {"stream"}
+    assert len(response["stream"]) == 1
+    result = response["stream"][0]["result"]
+    assert isinstance(result["content"], list)
+    assert isinstance(result["isError"], bool)
+    return result
+
+
+def text_of(result):
+    return "".join(item.get("text", "") for item in result["content"])
+
+
+def test_execute_code_keeps_state(sandbox):
+    result = result_of(sandbox.invoke("executeCode", {"code": "x = 41", "language": "python"}))
+    assert result["isError"] is False
+
+    result = result_of(sandbox.invoke("executeCode", {"code": "print(x + 1)", "language": "python"}))
+    assert result["structuredContent"]["stdout"].strip() == "42"
+    assert result["structuredContent"]["exitCode"] == 0
+    assert text_of(result).strip() == "42"
+
+
+def test_clear_context_and_errors(sandbox):
+    sandbox.invoke("executeCode", {"code": "y = 1"})
+    result_of(sandbox.invoke("executeCode", {"code": "", "clearContext": True}))
+
+    result = result_of(sandbox.invoke("executeCode", {"code": "print(y)"}))
+    assert result["isError"] is True
+    assert result["structuredContent"]["exitCode"] == 1
+    assert "NameError" in result["structuredContent"]["stderr"]
+
+
+def test_write_read_and_list_files(sandbox):
+    result = result_of(sandbox.invoke("writeFiles", {"content": [
+        {"path": "notes.txt", "text": "hello"},
+        {"path": "data/config.json", "text": json.dumps({"a": 1})},
+        {"path": "data/raw.bin", "blob": b"\x00\x01\x02"},
+    ]}))
+    assert result["isError"] is False
+
+    # 代码和文件接口看到的是同一个工作目录
+    result = result_of(sandbox.invoke("executeCode", {"code": "print(open('notes.txt').read())"}))
+    assert result["structuredContent"]["stdout"].strip() == "hello"
+
+    result = result_of(sandbox.invoke("readFiles", {"paths": ["notes.txt", "data/config.json", "data/raw.bin"]}))
+    resources = [item["resource"] for item in result["content"]]
+    assert [item["type"] for item in result["content"]] == ["resource"] * 3
+    assert resources[0]["text"] == "hello"
+    assert json.loads(resources[1]["text"]) == {"a": 1}
+    assert resources[2]["blob"] == b"\x00\x01\x02"
+
+    result = result_of(sandbox.invoke("listFiles", {"path": ""}))
+    entries = {item["name"]: item["description"] for item in result["content"]}
+    assert entries == {"data": "Directory", "notes.txt": "File"}
+    result = result_of(sandbox.invoke("listFiles", {"path": "data"}))
+    assert [item["name"] for item in result["content"]] == ["config.json", "raw.bin"]
+
+
+def test_read_missing_file(sandbox):
+    result = result_of(sandbox.invoke("readFiles", {"paths": ["missing.txt"]}))
+    assert result["isError"] is True
+    assert "missing.txt" in text_of(result)
+
+
+def test_remove_files(sandbox):
+    sandbox.invoke("writeFiles", {"content": [{"path": "tmp/a.txt", "text": "a"}]})
+    result_of(sandbox.invoke("removeFiles", {"paths": ["tmp"]}))
+    assert result_of(sandbox.invoke("listFiles", {"path": ""}))["content"] == []
+
+
+@pytest.mark.parametrize("path", ["../outside.txt", "data/../../outside.txt", "/etc/passwd"])
+def test_paths_outside_sandbox_are_rejected(sandbox, path):
+    with pytest.raises(ValueError):
+        sandbox._resolve(path)
+
+    for method, params in [("writeFiles", {"content": [{"path": path, "text": "x"}]}),
+                           ("readFiles", {"paths": [path]}),
+                           ("listFiles", {"path": path})]:
+        result = result_of(sandbox.invoke(method, params))
+        assert result["isError"] is True
+    assert not os.path.exists(os.path.join(os.path.dirname(sandbox.workdir), "outside.txt"))
+
+
+def test_unsupported_method(sandbox):
+    result = result_of(sandbox.invoke("startCommandExecution", {}))
+    assert result["isError"] is True
+
+
+def test_stage_and_download_round_trip(sandbox, tmp_path):
+    source = tmp_path / "metrics.csv"
+    source.write_text("instance_id,cpu\n" + "".join(f"i-{i:04d},{i % 100}\n" for i in range(300)))
+    assert 2048 < source.stat().st_size <= 3072
+    manifest = str(tmp_path / "staging.json")
+
+    # 小分块让上传走多块并行写入和沙箱内拼接
+    report = stage_file(sandbox, str(source), "inputs/metrics.csv", manifest_path=manifest, chunk_bytes=1024)
+    assert report["action"] == "upload"
+    assert report["verified"] is True
+    assert report["chunks"] == 3
+
+    report = stage_file(sandbox, str(source), "inputs/metrics.csv", manifest_path=manifest)
+    assert report["action"] == "probe"
+    assert report["manifest_hit"] is True
+
+    local_dir = tmp_path / "downloads"
+    report = download_files(sandbox, ["inputs/metrics.csv"], str(local_dir), prefix="downloaded_", verbose=False)
+    assert report["fetched"] == ["inputs/metrics.csv"] and report["failed"] == []
+    assert (local_dir / "downloaded_inputs" / "metrics.csv").read_bytes() == source.read_bytes()
+
+    report = download_files(sandbox, ["inputs/metrics.csv"], str(local_dir), prefix="downloaded_", verbose=False)
+    assert report["skipped"] == ["inputs/metrics.csv"]
+
+
+def test_binary_round_trip(sandbox, tmp_path):
+    source = tmp_path / "model.bin"
+    source.write_bytes(os.urandom(5000))
+    manifest = str(tmp_path / "staging.json")
+
+    assert stage_file(sandbox, str(source), manifest_path=manifest, chunk_bytes=2048)["verified"] is True
+
+    local_dir = tmp_path / "downloads"
+    report = download_files(sandbox, ["model.bin"], str(local_dir), verbose=False)
+    assert report["fetched"] == ["model.bin"]
+    assert (local_dir / "model.bin").read_bytes() == source.read_bytes()
+
+
+def test_download_rejects_paths_outside_local_dir(sandbox, tmp_path):
+    local_dir = tmp_path / "downloads"
+    report = download_files(sandbox, ["../escape.txt", "/abs/escape.txt"], str(local_dir), verbose=False)
+    assert sorted(failure["path"] for failure in report["failed"]) == ["../escape.txt", "/abs/escape.txt"]
+    assert report["fetched"] == []
+    assert not (tmp_path / "escape.txt").exists()
+
+
+def test_parallel_staging_keeps_every_session(tmp_path):
+    """多个会话并行 bootstrap 时 stage_file 同时写清单，不能失败也不能丢记录"""
+    source = tmp_path / "data.csv"
+    source.write_text("a,b\n1,2\n")
+    manifest = str(tmp_path / "staging.json")
+    clients = [LocalCodeInterpreter(workdir_root=str(tmp_path), preload=()) for _ in range(4)]
+    errors = []
+
+    def stage(client):
+        try:
+            client.start()
+            stage_file(client, str(source), manifest_path=manifest)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=stage, args=(client,)) for client in clients]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        with open(manifest, encoding="utf-8") as f:
+            recorded = json.load(f)
+        assert set(recorded) == {client.session_id for client in clients}
+    finally:
+        for client in clients:
+            client.stop()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Agent 工具调用性能剖析
+通过 Strands hooks 记录每次模型调用和工具调用的起止时间：
+- 每个工具的耗时、输入/输出载荷大小
+- 每个事件循环周期（一次模型调用）的 token 和模型思考时间
+结果可以导出为 Chrome trace-event JSON（chrome://tracing 或 https://ui.perfetto.dev 打开），
+并打印文本汇总，看清 Agent 的墙钟时间花在哪里
+"""
+
+import json
+import threading
+import time
+
+from strands.hooks import (
+    HookProvider,
+    HookRegistry,
+    BeforeInvocationEvent,
+    AfterInvocationEvent,
+    BeforeModelCallEvent,
+    AfterModelCallEvent,
+    BeforeToolCallEvent,
+    AfterToolCallEvent,
+)
+
+# trace 里的线程编号：模型调用和工具调用分两行显示
+MODEL_TRACK = 1
+TOOL_TRACK = 2
+
+
+def _payload_size(value) -> int:
+    """载荷序列化为 JSON 后的字节数"""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class ToolProfiler(HookProvider):
+    """记录模型调用和工具调用的时间线"""
+
+    def __init__(self):
+        self.spans = []
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._invocation_start = None
+        self._model_start = None
+        self._usage_before = None
+        self._unsettled_model_span = None
+        self._tool_starts = {}
+        self.cycles = 0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs) -> None:
+        registry.add_callback(BeforeInvocationEvent, self._on_invocation_start)
+        registry.add_callback(AfterInvocationEvent, self._on_invocation_end)
+        registry.add_callback(BeforeModelCallEvent, self._on_model_start)
+        registry.add_callback(AfterModelCallEvent, self._on_model_end)
+        registry.add_callback(BeforeToolCallEvent, self._on_tool_start)
+        registry.add_callback(AfterToolCallEvent, self._on_tool_end)
+
+    def _now_us(self) -> float:
+        return (time.perf_counter_ns() - self._origin) / 1000
+
+    def _add_span(self, name, category, track, start_us, args):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round(start_us, 1),
+                "dur": round(self._now_us() - start_us, 1),
+                "pid": 1,
+                "tid": track,
+                "args": args
+            })
+
+    def _on_invocation_start(self, event: BeforeInvocationEvent):
+        self._invocation_start = self._now_us()
+
+    def _settle_tokens(self, agent):
+        """把上一次模型调用的 token 记到对应的周期上
+
+        Strands 在 AfterModelCallEvent 之后才累计 usage，所以要等到下一个事件再取差值
+        """
+        span = self._unsettled_model_span
+        if span is None:
+            return
+        usage = agent.event_loop_metrics.accumulated_usage
+        before = self._usage_before or {}
+        span["args"]["input_tokens"] = usage.get("inputTokens", 0) - before.get("inputTokens", 0)
+        span["args"]["output_tokens"] = usage.get("outputTokens", 0) - before.get("outputTokens", 0)
+        self._unsettled_model_span = None
+
+    def _on_invocation_end(self, event: AfterInvocationEvent):
+        self._settle_tokens(event.agent)
+        if self._invocation_start is not None:
+            self._add_span("agent invocation", "invocation", 0, self._invocation_start, {"cycles": self.cycles})
+            self._invocation_start = None
+
+    def _on_model_start(self, event: BeforeModelCallEvent):
+        self._settle_tokens(event.agent)
+        self._model_start = self._now_us()
+        self._usage_before = dict(event.agent.event_loop_metrics.accumulated_usage)
+
+    def _on_model_end(self, event: AfterModelCallEvent):
+        if self._model_start is None:
+            return
+        self.cycles += 1
+        args = {
+            "cycle": self.cycles,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "stop_reason": event.stop_response.stop_reason if event.stop_response else "error",
+        }
+        self._add_span(f"model cycle {self.cycles}", "model", MODEL_TRACK, self._model_start, args)
+        self._unsettled_model_span = self.spans[-1]
+        self._model_start = None
+
+    def _on_tool_start(self, event: BeforeToolCallEvent):
+        self._settle_tokens(event.agent)
+        with self._lock:
+            self._tool_starts[event.tool_use["toolUseId"]] = self._now_us()
+
+    def _on_tool_end(self, event: AfterToolCallEvent):
+        with self._lock:
+            start = self._tool_starts.pop(event.tool_use["toolUseId"], None)
+        if start is None:
+            return
+        args = {
+            "tool_use_id": event.tool_use["toolUseId"],
+            "input_bytes": _payload_size(event.tool_use.get("input", {})),
+            "output_bytes": _payload_size(event.result.get("content", [])),
+            "status": event.result.get("status"),
+        }
+        self._add_span(event.tool_use["name"], "tool", TOOL_TRACK, start, args)
+
+    def chrome_trace(self) -> dict:
+        """Chrome trace-event 格式（JSON Object Format）"""
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+            for tid, name in ((0, "agent"), (MODEL_TRACK, "model"), (TOOL_TRACK, "tools"))
+        ]
+        return {"traceEvents": metadata + sorted(self.spans, key=lambda s: s["ts"]), "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+        return path
+
+    def summary(self) -> str:
+        """按模型/工具汇总耗时、载荷和 token 的文本报告"""
+        invocations = [s for s in self.spans if s["cat"] == "invocation"]
+        models = [s for s in self.spans if s["cat"] == "model"]
+        tools = [s for s in self.spans if s["cat"] == "tool"]
+        wall_ms = sum(s["dur"] for s in invocations) / 1000
+        model_ms = sum(s["dur"] for s in models) / 1000
+        tool_ms = sum(s["dur"] for s in tools) / 1000
+
+        def share(ms):
+            return f"{ms / wall_ms * 100:.1f}%" if wall_ms else "-"
+
+        lines = [
+            f"总耗时 {wall_ms:.1f} ms：模型 {model_ms:.1f} ms ({share(model_ms)})，"
+            f"工具 {tool_ms:.1f} ms ({share(tool_ms)})，其他 {max(wall_ms - model_ms - tool_ms, 0):.1f} ms",
+            "",
+            f"{'周期':<6}{'模型耗时(ms)':>14}{'输入token':>12}{'输出token':>12}  停止原因",
+        ]
+        for s in models:
+            a = s["args"]
+            lines.append(f"{a['cycle']:<6}{s['dur'] / 1000:>14.1f}{a['input_tokens']:>12}{a['output_tokens']:>12}  "
+                         f"{a['stop_reason']}")
+
+        lines += ["", f"{'工具':<28}{'次数':>6}{'总耗时(ms)':>12}{'平均(ms)':>10}{'最大(ms)':>10}"
+                      f"{'输入字节':>10}{'输出字节':>10}"]
+        by_tool = {}
+        for s in tools:
+            by_tool.setdefault(s["name"], []).append(s)
+        for name, spans in sorted(by_tool.items(), key=lambda item: -sum(s["dur"] for s in item[1])):
+            durations = [s["dur"] / 1000 for s in spans]
+            lines.append(
+                f"{name:<28}{len(spans):>6}{sum(durations):>12.1f}{sum(durations) / len(spans):>10.1f}"
+                f"{max(durations):>10.1f}{sum(s['args']['input_bytes'] for s in spans):>10}"
+                f"{sum(s['args']['output_bytes'] for s in spans):>10}"
+            )
+        return "\n".join(lines)
@@ -1,45 +1,69 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from strands import Agent
 from strands.agent.conversation_manager import (
     NullConversationManager,
     SlidingWindowConversationManager,
     SummarizingConversationManager
 )
-from strands.models import BedrockModel
+from strands.models import BedrockModel, CacheConfig
 import os
+import sys
+import json
+import queue
+import threading
 from datetime import datetime
+from pathlib import Path
+
+from pricing import calculate_cost
+from simulator import simulate_configurations, create_responder, CONFIGURATIONS
+from preflight import preflight, resolve_budget
+from sweep import run_sweep, resolve_max_workers, BACKENDS
+
+# Shared record/replay wrapper lives at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bedrock_replay import wrap_bedrock_model
 
 app = Flask(__name__)
 
 # Store results for comparison
 results_store = []
 
-def create_agent(manager_type, use_cache=True):
-    """Create an agent with specified conversation manager and cache settings."""
+def create_agent(manager_type, use_cache=True, window_size=2, summary_ratio=0.3,
+                 preserve_recent_messages=2, model=None, quiet=False, callback_handler=None):
+    """Create an agent with specified conversation manager and cache settings.
+    
+    Pass a model to replace Bedrock (e.g. FakeModel), quiet=True to disable
+    the default stdout callback handler, or a callback_handler of your own.
+    """
     
     # Create conversation manager based on type
     if manager_type == "null":
         manager = NullConversationManager()
     elif manager_type == "sliding":
-        manager = SlidingWindowConversationManager(window_size=2)
+        manager = SlidingWindowConversationManager(window_size=window_size)
     elif manager_type == "summarizing":
         manager = SummarizingConversationManager(
-            summary_ratio=0.3,
-            preserve_recent_messages=2
+            summary_ratio=summary_ratio,
+            preserve_recent_messages=preserve_recent_messages
         )
     else:
         raise ValueError(f"Unknown manager type: {manager_type}")
     
-    bedrock_model = BedrockModel(
-        model_id="global.anthropic.claude-sonnet-4-5-20250929-v1:0",
-        temperature=0.3,
-    )
+    if model is None:
+        # use_cache places cache points on the system prompt, tools and conversation history
+        cache_settings = {"cache_config": CacheConfig(strategy="auto")} if use_cache else {}
+        model = wrap_bedrock_model(BedrockModel(
+            model_id="global.anthropic.claude-sonnet-4-5-20250929-v1:0",
+            temperature=0.3,
+            **cache_settings
+        ))
     
     # Create agent with Bedrock configuration
     agent = Agent(
         name=f"TokenOptimizer-{manager_type}",
-        model=bedrock_model,
-        conversation_manager=manager
+        model=model,
+        conversation_manager=manager,
+        **({"callback_handler": callback_handler} if callback_handler or quiet else {})
     )
     
     return agent
@@ -63,14 +87,123 @@ def get_token_stats_from_trace(trace):
         stats["output_tokens"] = accumulated_usage.get("outputTokens", 0)
         stats["total_tokens"] = accumulated_usage.get("totalTokens", 0)
         
-        # Check for cache tokens in the usage details
-        if "cacheCreationInputTokens" in accumulated_usage:
+        # Check for cache tokens in the usage details (Strands reports writes as cacheWriteInputTokens)
+        if "cacheWriteInputTokens" in accumulated_usage:
+            stats["cache_creation_tokens"] = accumulated_usage.get("cacheWriteInputTokens", 0)
+        elif "cacheCreationInputTokens" in accumulated_usage:
             stats["cache_creation_tokens"] = accumulated_usage.get("cacheCreationInputTokens", 0)
         if "cacheReadInputTokens" in accumulated_usage:
             stats["cache_read_tokens"] = accumulated_usage.get("cacheReadInputTokens", 0)
     
     return stats
 
+def get_response_text(trace):
+    """Extract the assistant text from a trace result."""
+    if hasattr(trace, 'text'):
+        return trace.text
+    elif hasattr(trace, 'output_text'):
+        return trace.output_text
+    return str(trace)
+
+def run_conversation(agent, messages, on_turn=None, cancelled=None):
+    """Send each message to the agent and accumulate per-turn token stats.
+    
+    The agent's metrics accumulate over its lifetime, so each turn's stats are
+    the difference from the previous turn's totals. If given, on_turn is
+    called with the assistant conversation entry and the running stats after
+    every turn. If the cancelled event is set, the remaining turns are skipped.
+    
+    Returns a (responses, conversation, stats) tuple.
+    """
+    responses = []
+    conversation = []
+    accumulated_stats = {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_creation_tokens": 0,
+        "cache_read_tokens": 0,
+        "total_tokens": 0
+    }
+    previous_totals = dict(accumulated_stats)
+    
+    for msg in messages:
+        if cancelled is not None and cancelled.is_set():
+            break
+        
+        # Add user message to conversation
+        conversation.append({
+            "role": "user",
+            "content": msg
+        })
+        
+        trace = agent(msg)
+        response_text = get_response_text(trace)
+        responses.append(response_text)
+        
+        # Get token statistics for this specific response
+        totals = get_token_stats_from_trace(trace)
+        trace_stats = {key: totals[key] - previous_totals[key] for key in totals}
+        previous_totals = totals
+        
+        # Add assistant response with token info
+        conversation.append({
+            "role": "assistant",
+            "content": response_text,
+            "tokens": trace_stats,
+            "cost": calculate_cost(trace_stats)["total"]
+        })
+        
+        # Accumulate token statistics
+        for key in accumulated_stats:
+            accumulated_stats[key] += trace_stats[key]
+        
+        if on_turn:
+            on_turn(conversation[-1], accumulated_stats)
+    
+    return responses, conversation, accumulated_stats
+
+def build_test_result(manager_type, use_cache, messages, responses, conversation, stats):
+    """Build the summary object returned by /test."""
+    return {
+        "manager_type": manager_type,
+        "use_cache": use_cache,
+        "timestamp": datetime.now().isoformat(),
+        "stats": stats,
+        "cost": calculate_cost(stats),
+        "responses": responses,
+        "conversation": conversation,
+        "message_count": len(messages)
+    }
+
+def check_budget(data, messages, configurations):
+    """Run the pre-flight projection and apply the request's budget policy.
+    
+    Returns a (messages, projection, error_response) tuple; messages is
+    truncated under the "truncate" policy and error_response is set when the
+    request is rejected.
+    """
+    try:
+        budget = resolve_budget(data.get('budget'))
+        projection = preflight(messages, configurations, budget)
+    except (TypeError, ValueError) as e:
+        return messages, None, (jsonify({"error": str(e)}), 400)
+    
+    if projection["within_budget"]:
+        return messages, projection, None
+    
+    if budget["policy"] == "truncate" and projection["allowed_messages"] > 0:
+        projection["truncated"] = True
+        return messages[:projection["allowed_messages"]], projection, None
+    
+    return messages, projection, (jsonify({
+        "error": "Projected token usage exceeds the request budget",
+        "preflight": projection
+    }), 400)
+
+def format_sse(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -86,88 +219,21 @@ def test_configuration():
     if not messages:
         return jsonify({"error": "No messages provided"}), 400
     
+    messages, projection, error = check_budget(
+        data, messages, [{"manager_type": manager_type, "use_cache": use_cache}]
+    )
+    if error:
+        return error
+    
     try:
         # Create agent
         agent = create_agent(manager_type, use_cache)
         
         # Process messages and accumulate stats
-        responses = []
-        conversation = []
-        accumulated_stats = {
-            "input_tokens": 0,
-            "output_tokens": 0,
-            "cache_creation_tokens": 0,
-            "cache_read_tokens": 0,
-            "total_tokens": 0
-        }
+        responses, conversation, stats = run_conversation(agent, messages)
         
-        for msg in messages:
-            # Add user message to conversation
-            conversation.append({
-                "role": "user",
-                "content": msg
-            })
-            
-            trace = agent(msg)
-            
-            # Extract text from trace object
-            response_text = ""
-            if hasattr(trace, 'text'):
-                response_text = trace.text
-            elif hasattr(trace, 'output_text'):
-                response_text = trace.output_text
-            else:
-                response_text = str(trace)
-            
-            responses.append(response_text)
-            
-            # Get token statistics for this specific response
-            trace_stats = get_token_stats_from_trace(trace)
-            
-            # Calculate cost for this response
-            msg_input_cost = trace_stats["input_tokens"] * 0.003 / 1000
-            msg_output_cost = trace_stats["output_tokens"] * 0.015 / 1000
-            msg_cache_write_cost = trace_stats["cache_creation_tokens"] * 0.00375 / 1000
-            msg_cache_read_cost = trace_stats["cache_read_tokens"] * 0.0003 / 1000
-            msg_total_cost = msg_input_cost + msg_output_cost + msg_cache_write_cost + msg_cache_read_cost
-            
-            # Add assistant response with token info
-            conversation.append({
-                "role": "assistant",
-                "content": response_text,
-                "tokens": trace_stats,
-                "cost": round(msg_total_cost, 6)
-            })
-            
-            # Accumulate token statistics
-            for key in accumulated_stats:
-                accumulated_stats[key] += trace_stats[key]
-        
-        stats = accumulated_stats
-        
-        # Calculate estimated cost (Claude 3.5 Sonnet pricing)
-        input_cost = stats["input_tokens"] * 0.003 / 1000
-        output_cost = stats["output_tokens"] * 0.015 / 1000
-        cache_write_cost = stats["cache_creation_tokens"] * 0.00375 / 1000
-        cache_read_cost = stats["cache_read_tokens"] * 0.0003 / 1000
-        total_cost = input_cost + output_cost + cache_write_cost + cache_read_cost
-        
-        result = {
-            "manager_type": manager_type,
-            "use_cache": use_cache,
-            "timestamp": datetime.now().isoformat(),
-            "stats": stats,
-            "cost": {
-                "input": round(input_cost, 6),
-                "output": round(output_cost, 6),
-                "cache_write": round(cache_write_cost, 6),
-                "cache_read": round(cache_read_cost, 6),
-                "total": round(total_cost, 6)
-            },
-            "responses": responses,
-            "conversation": conversation,
-            "message_count": len(messages)
-        }
+        result = build_test_result(manager_type, use_cache, messages, responses, conversation, stats)
+        result["preflight"] = projection
         
         # Store result
         results_store.append(result)
@@ -178,6 +244,84 @@ def test_configuration():
         import traceback
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
+@app.route('/test/stream', methods=['POST'])
+def test_configuration_stream():
+    """Test a configuration and stream each turn as server-sent events.
+    
+    Emits "turn_start", "delta" (assistant text chunks) and "turn" (token
+    stats and running cost) events while the agent works, and finishes with a
+    "summary" event carrying the same object /test returns, or an "error".
+    """
+    data = request.json
+    manager_type = data.get('manager_type', 'null')
+    use_cache = data.get('use_cache', True)
+    messages = data.get('messages', [])
+    
+    if not messages:
+        return jsonify({"error": "No messages provided"}), 400
+    
+    messages, projection, error = check_budget(
+        data, messages, [{"manager_type": manager_type, "use_cache": use_cache}]
+    )
+    if error:
+        return error
+    
+    events = queue.Queue()
+    state = {"turn": 1}
+    # Set when the client disconnects so the worker stops before the next turn
+    cancelled = threading.Event()
+    
+    def on_event(**kwargs):
+        if "data" in kwargs:
+            events.put(("delta", {"turn": state["turn"], "text": kwargs["data"]}))
+    
+    def on_turn(entry, running_stats):
+        events.put(("turn", {
+            "turn": state["turn"],
+            "content": entry["content"],
+            "tokens": entry["tokens"],
+            "cost": entry["cost"],
+            "running_stats": dict(running_stats),
+            "running_cost": calculate_cost(running_stats)["total"]
+        }))
+        state["turn"] += 1
+        if state["turn"] <= len(messages):
+            events.put(("turn_start", {"turn": state["turn"], "message": messages[state["turn"] - 1]}))
+    
+    def worker():
+        try:
+            agent = create_agent(manager_type, use_cache, callback_handler=on_event)
+            events.put(("turn_start", {"turn": 1, "message": messages[0]}))
+            responses, conversation, stats = run_conversation(agent, messages, on_turn=on_turn,
+                                                              cancelled=cancelled)
+            if cancelled.is_set():
+                return
+            result = build_test_result(manager_type, use_cache, messages, responses, conversation, stats)
+            result["preflight"] = projection
+            results_store.append(result)
+            events.put(("summary", result))
+        except Exception as e:
+            import traceback
+            events.put(("error", {"error": str(e), "traceback": traceback.format_exc()}))
+    
+    def generate():
+        threading.Thread(target=worker, daemon=True).start()
+        try:
+            while True:
+                event, payload = events.get()
+                yield format_sse(event, payload)
+                if event in ("summary", "error"):
+                    break
+        finally:
+            # Runs on normal completion and when the closed generator gets GeneratorExit
+            cancelled.set()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/compare', methods=['POST'])
 def compare_configurations():
     """Compare multiple configurations side by side."""
@@ -187,14 +331,11 @@ def compare_configurations():
     if not messages:
         return jsonify({"error": "No messages provided"}), 400
     
-    configurations = [
-        {"manager_type": "null", "use_cache": False},
-        {"manager_type": "null", "use_cache": True},
-        {"manager_type": "sliding", "use_cache": False},
-        {"manager_type": "sliding", "use_cache": True},
-        {"manager_type": "summarizing", "use_cache": False},
-        {"manager_type": "summarizing", "use_cache": True},
-    ]
+    configurations = CONFIGURATIONS
+    
+    messages, projection, error = check_budget(data, messages, configurations)
+    if error:
+        return error
     
     results = []
     
@@ -203,70 +344,14 @@ def compare_configurations():
             agent = create_agent(config["manager_type"], config["use_cache"])
             
             # Process messages and accumulate stats
-            conversation = []
-            accumulated_stats = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "cache_creation_tokens": 0,
-                "cache_read_tokens": 0,
-                "total_tokens": 0
-            }
-            
-            for msg in messages:
-                # Add user message
-                conversation.append({
-                    "role": "user",
-                    "content": msg
-                })
-                
-                trace = agent(msg)
-                
-                # Extract response text
-                response_text = ""
-                if hasattr(trace, 'text'):
-                    response_text = trace.text
-                elif hasattr(trace, 'output_text'):
-                    response_text = trace.output_text
-                else:
-                    response_text = str(trace)
-                
-                # Get token statistics for this specific response
-                trace_stats = get_token_stats_from_trace(trace)
-                
-                # Calculate cost for this response
-                msg_input_cost = trace_stats["input_tokens"] * 0.003 / 1000
-                msg_output_cost = trace_stats["output_tokens"] * 0.015 / 1000
-                msg_cache_write_cost = trace_stats["cache_creation_tokens"] * 0.00375 / 1000
-                msg_cache_read_cost = trace_stats["cache_read_tokens"] * 0.0003 / 1000
-                msg_total_cost = msg_input_cost + msg_output_cost + msg_cache_write_cost + msg_cache_read_cost
-                
-                # Add assistant response with token info
-                conversation.append({
-                    "role": "assistant",
-                    "content": response_text,
-                    "tokens": trace_stats,
-                    "cost": round(msg_total_cost, 6)
-                })
-                
-                # Accumulate token statistics
-                for key in accumulated_stats:
-                    accumulated_stats[key] += trace_stats[key]
-            
-            stats = accumulated_stats
-            
-            # Calculate cost
-            input_cost = stats["input_tokens"] * 0.003 / 1000
-            output_cost = stats["output_tokens"] * 0.015 / 1000
-            cache_write_cost = stats["cache_creation_tokens"] * 0.00375 / 1000
-            cache_read_cost = stats["cache_read_tokens"] * 0.0003 / 1000
-            total_cost = input_cost + output_cost + cache_write_cost + cache_read_cost
+            _, conversation, stats = run_conversation(agent, messages)
             
             results.append({
                 "manager_type": config["manager_type"],
                 "use_cache": config["use_cache"],
                 "stats": stats,
                 "cost": {
-                    "total": round(total_cost, 6)
+                    "total": calculate_cost(stats)["total"]
                 },
                 "conversation": conversation
             })
@@ -280,8 +365,58 @@ def compare_configurations():
                 "traceback": traceback.format_exc()
             })
     
+    return jsonify({"results": results, "preflight": projection})
+
+@app.route('/simulate', methods=['POST'])
+def simulate_configurations_offline():
+    """Project token usage for every configuration without calling the model."""
+    data = request.json
+    messages = data.get('messages', [])
+    
+    if not messages:
+        return jsonify({"error": "No messages provided"}), 400
+    
+    try:
+        responder = create_responder(data.get('responder'))
+        results = simulate_configurations(
+            messages,
+            configurations=data.get('configurations'),
+            responder=responder,
+            system_prompt=data.get('system_prompt', "")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     return jsonify({"results": results})
 
+@app.route('/sweep', methods=['POST'])
+def sweep_configurations():
+    """Run a parameter grid over the conversation managers and return the result matrix."""
+    data = request.json
+    messages = data.get('messages', [])
+    backend = data.get('backend', 'fake')
+    
+    if not messages:
+        return jsonify({"error": "No messages provided"}), 400
+    if backend not in BACKENDS:
+        return jsonify({"error": f"Unknown backend: {backend}"}), 400
+    
+    try:
+        sweep = run_sweep(
+            messages,
+            grid=data.get('grid'),
+            manager_types=data.get('manager_types'),
+            backend=backend,
+            max_workers=resolve_max_workers(data.get('max_workers')),
+            fake_options=data.get('fake_options'),
+            create_agent=create_agent,
+            run_conversation=run_conversation
+        )
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(sweep)
+
 @app.route('/history')
 def get_history():
     """Get test history."""
@@ -0,0 +1,108 @@
+"""Local stand-in for BedrockModel used by sweeps and offline checks.
+
+FakeModel speaks the Strands streaming event protocol, so a real Agent with
+a real conversation manager can run against it without network access.
+Replies are deterministic and reflect how much history the model was sent,
+which lets the sweep's quality proxy see the effect of trimming. With
+use_cache the model reports prompt-cache reads for the prefix shared with
+the previous request, like Bedrock with cache points enabled.
+"""
+
+import asyncio
+
+from strands.models import Model
+from strands.types.exceptions import ContextWindowOverflowException
+
+from simulator import estimate_tokens, MESSAGE_OVERHEAD_TOKENS, MIN_CACHEABLE_TOKENS
+
+
+def _message_text(message):
+    return " ".join(
+        block["text"] for block in message.get("content", [])
+        if isinstance(block, dict) and "text" in block
+    )
+
+
+class FakeModel(Model):
+    """Deterministic model that reports estimated token usage."""
+
+    def __init__(self, latency_ms=0, reply_words=40, context_window_tokens=None, use_cache=False):
+        self.config = {
+            "model_id": "fake-model",
+            "latency_ms": latency_ms,
+            "reply_words": reply_words,
+            "context_window_tokens": context_window_tokens,
+            "use_cache": use_cache
+        }
+        self._previous_request = None
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError("FakeModel does not support structured output")
+
+    def _reply(self, messages):
+        user_texts = [_message_text(m) for m in messages if m["role"] == "user"]
+        # Echo the topics of every user message still in context
+        topics = [" ".join(text.split()[:6]) for text in user_texts]
+        words = f"I can see {len(messages)} messages. Topics: {' | '.join(topics)}.".split()
+        filler = ["detail"] * max(0, self.config["reply_words"] - len(words))
+        return " ".join(words + filler)
+
+    def _cache_usage(self, system_prompt, message_tokens, texts, input_tokens):
+        """Split the prompt into cache reads (prefix shared with the last request) and cache writes."""
+        previous, self._previous_request = self._previous_request, (system_prompt, texts)
+        if not self.config["use_cache"] or input_tokens < MIN_CACHEABLE_TOKENS:
+            return {}
+        cached = 0
+        if previous and previous[0] == system_prompt:
+            cached = estimate_tokens(system_prompt or "")
+            for tokens, text, previous_text in zip(message_tokens, texts, previous[1]):
+                if text != previous_text:
+                    break
+                cached += tokens
+        if cached < MIN_CACHEABLE_TOKENS:
+            cached = 0
+        return {"cacheReadInputTokens": cached, "cacheWriteInputTokens": input_tokens - cached}
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        texts = [(m["role"], _message_text(m)) for m in messages]
+        message_tokens = [estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS for _, text in texts]
+        input_tokens = estimate_tokens(system_prompt or "") + sum(message_tokens)
+        context_window = self.config["context_window_tokens"]
+        if context_window and input_tokens > context_window:
+            raise ContextWindowOverflowException(
+                f"Input of {input_tokens} tokens exceeds the {context_window} token context window"
+            )
+
+        if self.config["latency_ms"]:
+            await asyncio.sleep(self.config["latency_ms"] / 1000)
+
+        reply = self._reply(messages)
+        output_tokens = estimate_tokens(reply)
+        cache_usage = self._cache_usage(system_prompt, message_tokens, texts, input_tokens)
+        if cache_usage:
+            # Cached tokens are billed separately from the uncached input
+            input_tokens = 0
+
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"contentBlockStart": {"start": {}}}
+        for word in reply.split(" "):
+            yield {"contentBlockDelta": {"delta": {"text": word + " "}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {
+            "metadata": {
+                "usage": {
+                    "inputTokens": input_tokens,
+                    "outputTokens": output_tokens,
+                    "totalTokens": input_tokens + output_tokens + sum(cache_usage.values()),
+                    **cache_usage
+                },
+                "metrics": {"latencyMs": self.config["latency_ms"]}
+            }
+        }
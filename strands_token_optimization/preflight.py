@@ -0,0 +1,133 @@
+"""Pre-flight token estimation and per-request budgets.
+
+Before /test or /compare sends anything to Bedrock, the message script is
+replayed through the offline simulator to project every turn's tokens and
+cost under the chosen conversation manager. Scripts whose projection exceeds
+the configured budget are rejected or truncated to the turns that fit.
+"""
+
+import math
+import os
+
+from simulator import simulate_conversation, SyntheticResponder
+
+POLICIES = ("reject", "truncate")
+
+# Assumed reply length when projecting turns that have not happened yet
+DEFAULT_REPLY_TOKENS = 500
+
+
+def get_default_budget():
+    """Read the server-wide budget from the environment; unset limits are disabled."""
+    max_tokens = os.getenv("TOKEN_BUDGET_MAX_TOKENS")
+    max_cost = os.getenv("TOKEN_BUDGET_MAX_COST")
+    return {
+        "max_tokens": int(max_tokens) if max_tokens else None,
+        "max_cost": float(max_cost) if max_cost else None,
+        "policy": os.getenv("TOKEN_BUDGET_POLICY", "reject"),
+        "reply_tokens": int(os.getenv("TOKEN_BUDGET_REPLY_TOKENS", DEFAULT_REPLY_TOKENS))
+    }
+
+
+# Numeric budget fields and the type their request values are coerced to
+NUMERIC_FIELDS = {"max_tokens": int, "max_cost": float, "reply_tokens": int}
+
+
+def resolve_budget(overrides=None):
+    """Merge per-request budget overrides into the server defaults.
+
+    Raises ValueError when overrides is not an object or a numeric field
+    is not a finite, non-negative number. Integer fields accept whole numbers
+    only (2.0 is fine, 2.5 is rejected rather than truncated).
+    """
+    if overrides is not None and not isinstance(overrides, dict):
+        raise ValueError(f"budget must be an object, got {type(overrides).__name__}")
+    budget = get_default_budget()
+    for key, value in (overrides or {}).items():
+        if key in budget and value is not None:
+            if key in NUMERIC_FIELDS:
+                # bool is an int subclass, but true/false is never a meaningful limit
+                if isinstance(value, bool):
+                    raise ValueError(f"budget.{key} must be a number, got {value!r}")
+                try:
+                    number = float(value)
+                except (TypeError, ValueError, OverflowError):
+                    raise ValueError(f"budget.{key} must be a number, got {value!r}") from None
+                if not math.isfinite(number):
+                    raise ValueError(f"budget.{key} must be finite, got {value!r}")
+                if NUMERIC_FIELDS[key] is int:
+                    if not number.is_integer():
+                        raise ValueError(f"budget.{key} must be a whole number, got {value!r}")
+                    value = value if isinstance(value, int) else int(number)
+                else:
+                    value = number
+                if value < 0:
+                    raise ValueError(f"budget.{key} must not be negative, got {value!r}")
+            budget[key] = value
+    if budget["policy"] not in POLICIES:
+        raise ValueError(f"Unknown budget policy: {budget['policy']}")
+    return budget
+
+
+def project_configuration(messages, manager_type, use_cache, reply_tokens=DEFAULT_REPLY_TOKENS):
+    """Project per-turn tokens and cost of one configuration."""
+    simulated = simulate_conversation(
+        messages,
+        manager_type=manager_type,
+        use_cache=use_cache,
+        responder=SyntheticResponder(tokens_per_reply=reply_tokens)
+    )
+    running_tokens = 0
+    turns = []
+    for turn in simulated["turns"]:
+        running_tokens += turn["tokens"]["total_tokens"]
+        turns.append({
+            "turn": turn["turn"],
+            "prompt_tokens": turn["prompt_tokens"],
+            "tokens": turn["tokens"]["total_tokens"],
+            "cost": turn["cost"],
+            "running_tokens": running_tokens,
+            "running_cost": turn["running_cost"]
+        })
+    return {
+        "manager_type": manager_type,
+        "use_cache": use_cache,
+        "turns": turns,
+        "tokens": simulated["stats"]["total_tokens"],
+        "cost": simulated["cost"]["total"]
+    }
+
+
+def preflight(messages, configurations, budget):
+    """Project the whole request and check it against the budget.
+
+    The budget covers every configuration in the request together, so for
+    /compare it limits the sum of all six runs. Returns the projection with
+    "allowed_messages", the longest prefix of the script that fits.
+    """
+    projections = [
+        project_configuration(messages, config["manager_type"], config["use_cache"], budget["reply_tokens"])
+        for config in configurations
+    ]
+
+    def fits(turn_count):
+        tokens = sum(p["turns"][turn_count - 1]["running_tokens"] for p in projections)
+        cost = sum(p["turns"][turn_count - 1]["running_cost"] for p in projections)
+        return (
+            (budget["max_tokens"] is None or tokens <= budget["max_tokens"])
+            and (budget["max_cost"] is None or cost <= budget["max_cost"])
+        )
+
+    # Running totals only grow, so the first turn that does not fit ends the prefix
+    allowed = 0
+    while allowed < len(messages) and fits(allowed + 1):
+        allowed += 1
+
+    return {
+        "budget": budget,
+        "configurations": projections,
+        "total_tokens": sum(p["tokens"] for p in projections),
+        "total_cost": round(sum(p["cost"] for p in projections), 6),
+        "within_budget": allowed == len(messages),
+        "allowed_messages": allowed
+    }
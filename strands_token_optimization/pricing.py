@@ -0,0 +1,26 @@
+"""Token pricing shared by the live endpoints and the offline simulator."""
+
+# USD per 1K tokens (Claude Sonnet pricing on Bedrock)
+PRICING = {
+    "input": 0.003,
+    "output": 0.015,
+    "cache_write": 0.00375,
+    "cache_read": 0.0003,
+}
+
+
+def calculate_cost(stats):
+    """Calculate the cost breakdown for a token stats dictionary."""
+    input_cost = stats.get("input_tokens", 0) * PRICING["input"] / 1000
+    output_cost = stats.get("output_tokens", 0) * PRICING["output"] / 1000
+    cache_write_cost = stats.get("cache_creation_tokens", 0) * PRICING["cache_write"] / 1000
+    cache_read_cost = stats.get("cache_read_tokens", 0) * PRICING["cache_read"] / 1000
+    total_cost = input_cost + output_cost + cache_write_cost + cache_read_cost
+
+    return {
+        "input": round(input_cost, 6),
+        "output": round(output_cost, 6),
+        "cache_write": round(cache_write_cost, 6),
+        "cache_read": round(cache_read_cost, 6),
+        "total": round(total_cost, 6)
+    }
@@ -0,0 +1,385 @@
+"""Offline token-growth simulator for the conversation managers.
+
+Replays a message script through local re-implementations of the history
+trimming done by NullConversationManager, SlidingWindowConversationManager
+and SummarizingConversationManager, and projects per-turn token usage and
+cost without calling Bedrock.
+"""
+
+import argparse
+import functools
+import json
+import math
+import sys
+import time
+
+from pricing import calculate_cost
+
+# Rough per-message framing overhead added by the Converse API
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Anthropic models only cache prefixes of at least this many tokens
+MIN_CACHEABLE_TOKENS = 1024
+
+DEFAULT_CONTEXT_WINDOW_TOKENS = 200000
+
+CONFIGURATIONS = [
+    {"manager_type": "null", "use_cache": False},
+    {"manager_type": "null", "use_cache": True},
+    {"manager_type": "sliding", "use_cache": False},
+    {"manager_type": "sliding", "use_cache": True},
+    {"manager_type": "summarizing", "use_cache": False},
+    {"manager_type": "summarizing", "use_cache": True},
+]
+
+
+def _is_cjk(char):
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x303F
+        or 0xFF00 <= code <= 0xFFEF
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def estimate_tokens(text):
+    """Estimate the token count of a string.
+
+    Uses ~4 characters per token for Latin text and one token per CJK
+    character, which tracks Claude's tokenizer closely enough for budgeting.
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if _is_cjk(char))
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def synthetic_text(tokens):
+    """Filler text whose estimate_tokens count is exactly the given number of tokens."""
+    # Four Latin characters per chunk, matching the estimator's ~4 characters per token
+    return "tok " * max(0, tokens)
+
+
+def estimate_message_tokens(message):
+    """Estimate the tokens of one {"role", "content"} message."""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class SyntheticResponder:
+    """Produces filler replies of a fixed or input-proportional length."""
+
+    def __init__(self, tokens_per_reply=150, input_ratio=0.0):
+        self.tokens_per_reply = tokens_per_reply
+        self.input_ratio = input_ratio
+
+    def __call__(self, turn, message):
+        tokens = self.tokens_per_reply + int(estimate_tokens(message) * self.input_ratio)
+        return synthetic_text(tokens)
+
+
+class RecordedResponder:
+    """Replays assistant replies captured from an earlier live run."""
+
+    def __init__(self, responses, fallback=None):
+        if not responses and fallback is None:
+            raise ValueError("RecordedResponder needs at least one response")
+        self.responses = list(responses)
+        self.fallback = fallback or SyntheticResponder()
+
+    @classmethod
+    def from_result(cls, result):
+        """Build a responder from a /test result or a stored history entry."""
+        if result.get("responses"):
+            return cls(result["responses"])
+        return cls([
+            turn["content"] for turn in result.get("conversation", [])
+            if turn.get("role") == "assistant"
+        ])
+
+    def __call__(self, turn, message):
+        if turn < len(self.responses):
+            return self.responses[turn]
+        return self.fallback(turn, message)
+
+
+def create_responder(spec):
+    """Create a responder from a JSON spec such as {"type": "synthetic", "tokens_per_reply": 200}."""
+    spec = spec or {}
+    responder_type = spec.get("type", "synthetic")
+    if responder_type == "synthetic":
+        return SyntheticResponder(
+            tokens_per_reply=spec.get("tokens_per_reply", 150),
+            input_ratio=spec.get("input_ratio", 0.0)
+        )
+    elif responder_type == "recorded":
+        return RecordedResponder(spec.get("responses", []))
+    else:
+        raise ValueError(f"Unknown responder type: {responder_type}")
+
+
+class NullHistory:
+    """Keeps the full history, like NullConversationManager."""
+
+    def before_call(self, history, budget_tokens):
+        return None
+
+    def after_turn(self, history):
+        pass
+
+
+class SlidingWindowHistory:
+    """Mirrors SlidingWindowConversationManager.apply_management."""
+
+    def __init__(self, window_size=2):
+        self.window_size = window_size
+
+    def before_call(self, history, budget_tokens):
+        return None
+
+    def after_turn(self, history):
+        if len(history) <= self.window_size:
+            return
+        trim_index = len(history) - self.window_size
+        # The trimmed history has to start with a user message
+        while trim_index < len(history) and history[trim_index]["role"] != "user":
+            trim_index += 1
+        del history[:trim_index]
+
+
+class SummarizingHistory:
+    """Mirrors SummarizingConversationManager, which only acts on context overflow."""
+
+    def __init__(self, summary_ratio=0.3, preserve_recent_messages=2,
+                 context_window_tokens=DEFAULT_CONTEXT_WINDOW_TOKENS, summary_tokens=300):
+        self.summary_ratio = max(0.1, min(0.8, summary_ratio))
+        self.preserve_recent_messages = preserve_recent_messages
+        self.context_window_tokens = context_window_tokens
+        self.summary_tokens = summary_tokens
+
+    def before_call(self, history, budget_tokens):
+        """Summarize the oldest messages until the request fits the context window.
+
+        Returns the token usage of the summarization calls, or None.
+        """
+        usage = None
+        while budget_tokens(history) > self.context_window_tokens:
+            before = budget_tokens(history)
+            count = max(1, int(len(history) * self.summary_ratio))
+            count = min(count, len(history) - self.preserve_recent_messages)
+            if count <= 0:
+                break
+            summarized = history[:count]
+            summarized_tokens = sum(estimate_message_tokens(m) for m in summarized)
+            summary_tokens = min(self.summary_tokens, summarized_tokens)
+            history[:count] = [{
+                "role": "user",
+                "content": synthetic_text(summary_tokens),
+                "summary": True
+            }]
+            usage = usage or {"input_tokens": 0, "output_tokens": 0}
+            usage["input_tokens"] += summarized_tokens
+            usage["output_tokens"] += summary_tokens
+            if budget_tokens(history) >= before:
+                # Only an earlier summary is left to compress
+                break
+        return usage
+
+    def after_turn(self, history):
+        pass
+
+
+def create_history_manager(manager_type, window_size=2, summary_ratio=0.3,
+                           preserve_recent_messages=2,
+                           context_window_tokens=DEFAULT_CONTEXT_WINDOW_TOKENS):
+    """Create the simulated counterpart of create_agent's conversation manager."""
+    if manager_type == "null":
+        return NullHistory()
+    elif manager_type == "sliding":
+        return SlidingWindowHistory(window_size=window_size)
+    elif manager_type == "summarizing":
+        return SummarizingHistory(
+            summary_ratio=summary_ratio,
+            preserve_recent_messages=preserve_recent_messages,
+            context_window_tokens=context_window_tokens
+        )
+    else:
+        raise ValueError(f"Unknown manager type: {manager_type}")
+
+
+def _common_prefix_tokens(previous, current):
+    """Tokens of the leading messages shared by two consecutive requests."""
+    tokens = 0
+    for prev_msg, cur_msg in zip(previous, current):
+        if prev_msg["role"] != cur_msg["role"] or prev_msg["content"] != cur_msg["content"]:
+            break
+        tokens += estimate_message_tokens(cur_msg)
+    return tokens
+
+
+def simulate_conversation(messages, manager_type="null", use_cache=False, responder=None,
+                          system_prompt="", window_size=2, summary_ratio=0.3,
+                          preserve_recent_messages=2,
+                          context_window_tokens=DEFAULT_CONTEXT_WINDOW_TOKENS):
+    """Replay a message script and project per-turn token usage and cost.
+
+    The result has the same "stats", "cost" and "conversation" layout as the
+    /test endpoint, with an extra "turns" list of per-turn projections.
+    """
+    started = time.perf_counter()
+    responder = responder or SyntheticResponder()
+    manager = create_history_manager(
+        manager_type,
+        window_size=window_size,
+        summary_ratio=summary_ratio,
+        preserve_recent_messages=preserve_recent_messages,
+        context_window_tokens=context_window_tokens
+    )
+    system_tokens = estimate_tokens(system_prompt)
+
+    def request_tokens(history):
+        return system_tokens + sum(estimate_message_tokens(m) for m in history)
+
+    history = []
+    previous_request = []
+    conversation = []
+    turns = []
+    accumulated_stats = {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_creation_tokens": 0,
+        "cache_read_tokens": 0,
+        "total_tokens": 0
+    }
+
+    for turn, msg in enumerate(messages):
+        history.append({"role": "user", "content": msg})
+        conversation.append({"role": "user", "content": msg})
+
+        summary_usage = manager.before_call(history, request_tokens)
+        prompt_tokens = request_tokens(history)
+
+        trace_stats = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": 0,
+            "cache_creation_tokens": 0,
+            "cache_read_tokens": 0,
+            "total_tokens": 0
+        }
+
+        if use_cache and prompt_tokens >= MIN_CACHEABLE_TOKENS:
+            # The system prompt is part of the cached prefix whenever it is unchanged
+            cached = _common_prefix_tokens(previous_request, history)
+            if previous_request:
+                cached += system_tokens
+            if cached < MIN_CACHEABLE_TOKENS:
+                cached = 0
+            trace_stats["cache_read_tokens"] = cached
+            trace_stats["cache_creation_tokens"] = prompt_tokens - cached
+            trace_stats["input_tokens"] = 0
+
+        response_text = responder(turn, msg)
+        trace_stats["output_tokens"] = estimate_tokens(response_text)
+
+        if summary_usage:
+            trace_stats["input_tokens"] += summary_usage["input_tokens"]
+            trace_stats["output_tokens"] += summary_usage["output_tokens"]
+
+        trace_stats["total_tokens"] = (
+            trace_stats["input_tokens"] + trace_stats["output_tokens"]
+            + trace_stats["cache_creation_tokens"] + trace_stats["cache_read_tokens"]
+        )
+
+        previous_request = [dict(m) for m in history]
+        history.append({"role": "assistant", "content": response_text})
+        manager.after_turn(history)
+
+        msg_cost = calculate_cost(trace_stats)
+        conversation.append({
+            "role": "assistant",
+            "content": response_text,
+            "tokens": trace_stats,
+            "cost": msg_cost["total"]
+        })
+
+        for key in accumulated_stats:
+            accumulated_stats[key] += trace_stats[key]
+
+        turns.append({
+            "turn": turn + 1,
+            "prompt_tokens": prompt_tokens,
+            "history_messages": len(previous_request),
+            "summarized": summary_usage is not None,
+            "tokens": trace_stats,
+            "cost": msg_cost["total"],
+            "running_cost": calculate_cost(accumulated_stats)["total"]
+        })
+
+    return {
+        "manager_type": manager_type,
+        "use_cache": use_cache,
+        "simulated": True,
+        "stats": accumulated_stats,
+        "cost": calculate_cost(accumulated_stats),
+        "turns": turns,
+        "conversation": conversation,
+        "message_count": len(messages),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
+def simulate_configurations(messages, configurations=None, responder=None, **kwargs):
+    """Simulate every /compare configuration against the same script.
+
+    Each configuration needs a "manager_type"; "use_cache" defaults to False.
+    """
+    results = []
+    for config in (configurations or CONFIGURATIONS):
+        if not isinstance(config, dict) or "manager_type" not in config:
+            raise ValueError(f"Configuration needs a manager_type: {config!r}")
+        results.append(simulate_conversation(
+            messages,
+            manager_type=config["manager_type"],
+            use_cache=bool(config.get("use_cache", False)),
+            responder=responder,
+            **kwargs
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate conversation manager token growth offline")
+    parser.add_argument("script", help="JSON file with a list of user messages")
+    parser.add_argument("--reply_tokens", type=int, default=150,
+                        help="Length of synthetic assistant replies in tokens")
+    parser.add_argument("--recorded", help="JSON result from /test whose responses are replayed")
+    parser.add_argument("--context_window", type=int, default=DEFAULT_CONTEXT_WINDOW_TOKENS,
+                        help="Context window that triggers summarization")
+    args = parser.parse_args()
+
+    with open(args.script, "r", encoding="utf-8") as f:
+        messages = json.load(f)
+
+    if args.recorded:
+        with open(args.recorded, "r", encoding="utf-8") as f:
+            responder = RecordedResponder.from_result(json.load(f))
+    else:
+        responder = SyntheticResponder(tokens_per_reply=args.reply_tokens)
+
+    results = simulate_configurations(messages, responder=responder,
+                                      context_window_tokens=args.context_window)
+
+    print(f"{'manager':<12} {'cache':<6} {'input':>9} {'output':>8} {'cache_w':>9} "
+          f"{'cache_r':>9} {'cost($)':>10} {'ms':>7}")
+    for result in results:
+        stats = result["stats"]
+        print(f"{result['manager_type']:<12} {str(result['use_cache']):<6} "
+              f"{stats['input_tokens']:>9} {stats['output_tokens']:>8} "
+              f"{stats['cache_creation_tokens']:>9} {stats['cache_read_tokens']:>9} "
+              f"{result['cost']['total']:>10.6f} {result['elapsed_ms']:>7.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
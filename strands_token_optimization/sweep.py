@@ -0,0 +1,257 @@
+"""Parameter sweep for conversation manager tuning.
+
+Runs a grid over window_size, summary_ratio, preserve_recent_messages and the
+cache setting concurrently against one message script, and reports tokens,
+cost, latency and a response-quality proxy for every configuration together
+with the Pareto frontier over (cost, latency, quality).
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pricing import calculate_cost
+from simulator import simulate_conversation
+
+DEFAULT_GRID = {
+    "window_size": [2, 4, 8],
+    "summary_ratio": [0.2, 0.3, 0.5],
+    "preserve_recent_messages": [2, 4],
+    "use_cache": [False, True],
+}
+
+MANAGER_TYPES = ["null", "sliding", "summarizing"]
+
+# Parameters that actually change each manager's behaviour
+MANAGER_PARAMS = {
+    "null": [],
+    "sliding": ["window_size"],
+    "summarizing": ["summary_ratio", "preserve_recent_messages"],
+}
+
+BACKENDS = ["live", "fake", "simulate"]
+
+# Latency differences below this fraction of the slower run, or below
+# LATENCY_FLOOR_S, are treated as noise
+LATENCY_TOLERANCE = 0.1
+LATENCY_FLOOR_S = 0.05
+
+REFERENCE_CONFIG = {"manager_type": "null", "use_cache": False}
+
+# Upper bound on concurrently running configurations; each one holds an agent
+# and, on the live backend, an open Bedrock stream
+MAX_WORKERS = 16
+
+
+def resolve_max_workers(value, default=4):
+    """Validate a requested worker count and clamp it to MAX_WORKERS.
+
+    Raises ValueError for non-integer or non-positive values.
+    """
+    if value is None:
+        return default
+    # bool is an int subclass, but true/false is never a meaningful worker count
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not float(value).is_integer():
+        raise ValueError(f"max_workers must be a positive integer, got {value!r}")
+    if value < 1:
+        raise ValueError(f"max_workers must be a positive integer, got {value!r}")
+    return min(int(value), MAX_WORKERS)
+
+
+def build_configurations(grid=None, manager_types=None):
+    """Expand the grid into one configuration per distinct manager setting."""
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    configurations = []
+    for manager_type in manager_types or MANAGER_TYPES:
+        names = MANAGER_PARAMS[manager_type] + ["use_cache"]
+        for values in itertools.product(*(grid[name] for name in names)):
+            configurations.append({"manager_type": manager_type, **dict(zip(names, values))})
+    return configurations
+
+
+def quality_score(responses, reference):
+    """Response-quality proxy: mean word-set Jaccard similarity to the full-history reference."""
+    if not reference:
+        return None
+    scores = []
+    for response, expected in zip(responses, reference):
+        words, expected_words = set(response.lower().split()), set(expected.lower().split())
+        union = words | expected_words
+        scores.append(len(words & expected_words) / len(union) if union else 1.0)
+    return round(sum(scores) / len(scores), 4) if scores else None
+
+
+def run_configuration(config, messages, backend="fake", fake_options=None,
+                      create_agent=None, run_conversation=None):
+    """Run one configuration and return its responses, stats and latency."""
+    started = time.perf_counter()
+
+    if backend == "simulate":
+        result = simulate_conversation(messages, **config)
+        responses = [turn["content"] for turn in result["conversation"] if turn["role"] == "assistant"]
+        stats = result["stats"]
+    elif backend in ("live", "fake"):
+        model = None
+        if backend == "fake":
+            from fake_model import FakeModel
+            model = FakeModel(**{**(fake_options or {}), "use_cache": config.get("use_cache", False)})
+        agent = create_agent(model=model, quiet=True, **config)
+        responses, _, stats = run_conversation(agent, messages)
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    return {
+        **config,
+        "stats": stats,
+        "cost": calculate_cost(stats)["total"],
+        "latency_s": round(time.perf_counter() - started, 4),
+        "responses": responses
+    }
+
+
+def _latency_le(a, b, tolerance):
+    """a is no slower than b, counting differences within the tolerance as ties."""
+    return a <= b or (a - b) <= max(tolerance * max(a, b), LATENCY_FLOOR_S)
+
+
+def _latency_lt(a, b, tolerance):
+    """a is faster than b by more than the tolerance."""
+    return (b - a) > max(tolerance * max(a, b), LATENCY_FLOOR_S)
+
+
+def dominates(row, other, latency_tolerance=LATENCY_TOLERANCE):
+    """row is at least as good as other on (cost, latency, quality) and strictly better on one.
+
+    Latency differences within latency_tolerance are wall-clock jitter, so they
+    never make a row better or worse on their own.
+    """
+    quality, other_quality = row["quality"] or 0.0, other["quality"] or 0.0
+    no_worse = (
+        row["cost"] <= other["cost"]
+        and _latency_le(row["latency_s"], other["latency_s"], latency_tolerance)
+        and quality >= other_quality
+    )
+    better = (
+        row["cost"] < other["cost"]
+        or _latency_lt(row["latency_s"], other["latency_s"], latency_tolerance)
+        or quality > other_quality
+    )
+    return no_worse and better
+
+
+def pareto_frontier(rows, latency_tolerance=LATENCY_TOLERANCE):
+    """Return the rows not dominated on (lower cost, lower latency, higher quality)."""
+    return [
+        row for row in rows
+        if not any(dominates(other, row, latency_tolerance) for other in rows if other is not row)
+    ]
+
+
+def run_sweep(messages, grid=None, manager_types=None, backend="fake", max_workers=4,
+              fake_options=None, create_agent=None, run_conversation=None,
+              latency_tolerance=LATENCY_TOLERANCE):
+    """Run every grid configuration concurrently and build the result matrix."""
+    if backend in ("live", "fake") and (create_agent is None or run_conversation is None):
+        from app import create_agent, run_conversation
+
+    configurations = build_configurations(grid, manager_types)
+    if REFERENCE_CONFIG not in configurations:
+        configurations.append(dict(REFERENCE_CONFIG))
+
+    def run(config):
+        try:
+            return run_configuration(config, messages, backend, fake_options,
+                                     create_agent, run_conversation)
+        except Exception as e:
+            return {**config, "error": str(e)}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(executor.map(run, configurations))
+
+    reference = next(
+        (row.get("responses") for row in rows
+         if row["manager_type"] == "null" and not row["use_cache"] and "error" not in row),
+        None
+    )
+    completed = [row for row in rows if "error" not in row]
+    for row in completed:
+        row["quality"] = quality_score(row["responses"], reference)
+
+    frontier = pareto_frontier(completed, latency_tolerance)
+    for row in rows:
+        row["pareto"] = any(row is other for other in frontier)
+
+    return {
+        "backend": backend,
+        "message_count": len(messages),
+        "elapsed_s": round(time.perf_counter() - started, 4),
+        "results": rows,
+        "pareto": [
+            {key: row[key] for key in row if key not in ("responses", "stats")}
+            for row in frontier
+        ]
+    }
+
+
+def _format_params(row):
+    names = MANAGER_PARAMS[row["manager_type"]]
+    return ", ".join(f"{name}={row[name]}" for name in names) or "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep conversation manager parameters")
+    parser.add_argument("script", help="JSON file with a list of user messages")
+    parser.add_argument("--backend", choices=BACKENDS, default="fake",
+                        help="live calls Bedrock, fake uses the local FakeModel, simulate uses the offline estimator")
+    parser.add_argument("--window_sizes", type=int, nargs="+", default=DEFAULT_GRID["window_size"])
+    parser.add_argument("--summary_ratios", type=float, nargs="+", default=DEFAULT_GRID["summary_ratio"])
+    parser.add_argument("--preserve_recent", type=int, nargs="+",
+                        default=DEFAULT_GRID["preserve_recent_messages"])
+    parser.add_argument("--no_cache_sweep", action="store_true", help="Only run with the cache disabled")
+    parser.add_argument("--workers", type=int, default=4, help="Number of configurations run concurrently")
+    parser.add_argument("--fake_context_window", type=int,
+                        help="Context window of the fake model, to trigger summarization")
+    parser.add_argument("--output", help="Write the full result matrix to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.script, "r", encoding="utf-8") as f:
+        messages = json.load(f)
+
+    grid = {
+        "window_size": args.window_sizes,
+        "summary_ratio": args.summary_ratios,
+        "preserve_recent_messages": args.preserve_recent,
+        "use_cache": [False] if args.no_cache_sweep else [False, True],
+    }
+    sweep = run_sweep(
+        messages,
+        grid=grid,
+        backend=args.backend,
+        max_workers=resolve_max_workers(args.workers),
+        fake_options={"context_window_tokens": args.fake_context_window}
+    )
+
+    print(f"{'':1} {'manager':<12} {'params':<42} {'cache':<6} {'tokens':>8} "
+          f"{'cost($)':>10} {'latency':>8} {'quality':>8}")
+    for row in sweep["results"]:
+        if "error" in row:
+            print(f"  {row['manager_type']:<12} {_format_params(row):<42} ERROR: {row['error']}")
+            continue
+        marker = "*" if row["pareto"] else " "
+        quality = "-" if row["quality"] is None else f"{row['quality']:.3f}"
+        print(f"{marker} {row['manager_type']:<12} {_format_params(row):<42} "
+              f"{str(row['use_cache']):<6} {row['stats']['total_tokens']:>8} "
+              f"{row['cost']:>10.6f} {row['latency_s']:>8.3f} {quality:>8}")
+    print(f"\n* = Pareto frontier, {len(sweep['results'])} configurations in {sweep['elapsed_s']}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(sweep, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
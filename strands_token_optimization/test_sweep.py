@@ -0,0 +1,80 @@
+"""Sweep tests against the local FakeModel; no Bedrock calls."""
+
+import pytest
+
+from app import app
+from sweep import MAX_WORKERS, dominates, pareto_frontier, resolve_max_workers, run_sweep
+
+# Long enough that every request passes the fake model's minimum cacheable size
+MESSAGES = [f"Question {i} about cloud cost: " + "word " * 400 for i in range(5)]
+
+GRID = {"window_size": [2, 8], "summary_ratio": [0.3], "preserve_recent_messages": [2]}
+
+
+def _key(row):
+    return row["manager_type"], row.get("window_size"), row["use_cache"]
+
+
+@pytest.fixture(scope="module")
+def sweep():
+    # Wall-clock latency of the fake model is pure jitter, so treat every latency as a tie
+    return run_sweep(MESSAGES, grid=GRID, backend="fake", max_workers=4, latency_tolerance=1.0)
+
+
+def test_sweep_runs_every_configuration(sweep):
+    rows = sweep["results"]
+    assert len(rows) == 8
+    assert all("error" not in row for row in rows)
+    reference = next(row for row in rows if _key(row) == ("null", None, False))
+    assert reference["quality"] == 1.0
+
+
+def test_sweep_pareto_rows(sweep):
+    # Cached full-history runs give the reference replies at a lower cost; the
+    # 2-message window loses context and is no cheaper than they are
+    assert sorted(_key(row) for row in sweep["pareto"]) == [
+        ("null", None, True), ("sliding", 8, True), ("summarizing", None, True)
+    ]
+    frontier = [row for row in sweep["results"] if row["pareto"]]
+    for row in sweep["results"]:
+        if not row["pareto"]:
+            assert any(dominates(other, row, 1.0) for other in frontier)
+    for row in sweep["pareto"]:
+        assert "responses" not in row and "stats" not in row
+        assert row["quality"] == 1.0
+
+
+def test_cache_reduces_cost(sweep):
+    rows = {_key(row): row for row in sweep["results"]}
+    cached, uncached = rows[("null", None, True)], rows[("null", None, False)]
+    assert cached["stats"]["cache_read_tokens"] > 0
+    assert uncached["stats"]["cache_read_tokens"] == 0
+    assert cached["cost"] < uncached["cost"]
+
+
+def test_pareto_frontier_ignores_latency_jitter():
+    rows = [
+        {"name": "a", "cost": 1.0, "latency_s": 1.00, "quality": 0.9},
+        {"name": "b", "cost": 1.0, "latency_s": 1.05, "quality": 0.9},
+        {"name": "c", "cost": 2.0, "latency_s": 0.50, "quality": 0.9},
+        {"name": "d", "cost": 2.0, "latency_s": 2.00, "quality": 0.8},
+    ]
+    assert [row["name"] for row in pareto_frontier(rows)] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("value,expected", [(None, 4), (1, 1), (8.0, 8), (10_000, MAX_WORKERS)])
+def test_resolve_max_workers(value, expected):
+    assert resolve_max_workers(value) == expected
+
+
+@pytest.mark.parametrize("value", [0, -1, 1.5, "4", True, float("nan")])
+def test_resolve_max_workers_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        resolve_max_workers(value)
+
+
+@pytest.mark.parametrize("value", [0, -3, 2.5, "two"])
+def test_sweep_endpoint_rejects_invalid_max_workers(value):
+    response = app.test_client().post("/sweep", json={"messages": ["hi"], "max_workers": value})
+    assert response.status_code == 400
+    assert "max_workers" in response.get_json()["error"]
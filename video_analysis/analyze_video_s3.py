@@ -4,13 +4,121 @@
 """
 
 import boto3
+import hashlib
 import json
+import math
+import os
+import sys
+import threading
+import warnings
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from datetime import datetime, timezone
 from pathlib import Path
 import time
 
+# 仓库根目录下的 Bedrock 录制/回放封装
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bedrock_replay import wrap_bedrock_client
+
+MB = 1024 * 1024
+
+# 小于这个大小直接单次 PUT，分片上传的额外请求不划算
+SINGLE_PUT_LIMIT = 64 * MB
+# S3 分片大小 5MB~5GB、最多 10000 片；按约 1000 片切分，大文件的分片随之变大
+# （上限取 S3 的 5GB，5TB 的最大对象也只需约 1000 片）
+MIN_CHUNK_SIZE = 8 * MB
+MAX_CHUNK_SIZE = 5 * 1024 * MB
+MAX_PARTS = 10000
+TARGET_PARTS = 1000
+MAX_CONCURRENCY = 16
+
+# 按内容寻址的暂存前缀：同一个文件总是落在同一个键上，重复分析不再重新上传
+STAGING_PREFIX = "staging/sha256/"
+# 暂存对象由 bucket 生命周期规则在创建若干天后过期，不再分析完立即删除
+STAGING_RETENTION_DAYS = 7
+STAGING_LIFECYCLE_RULE_ID = "expire-staged-videos"
+# 已有对象距离过期不足这个天数时先刷新创建时间再分析，避免分析过程中或刚结束就被生命周期规则删除
+STAGING_REFRESH_MARGIN_DAYS = 1
+# copy_object 单次复制的上限，更大的对象刷新时改为重新上传
+COPY_OBJECT_LIMIT = 5 * 1024 * MB
+HASH_BLOCK_SIZE = 8 * MB
+
+
+def file_sha256(path, block_size=HASH_BLOCK_SIZE):
+    """流式计算文件的 SHA-256，内存占用与文件大小无关"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def choose_transfer_config(file_size, multipart_threshold=None, multipart_chunksize=None, max_concurrency=None):
+    """
+    根据文件大小选择分片上传参数，显式传入的参数优先
+    
+    Args:
+        file_size: 文件字节数
+        multipart_threshold: 超过该大小使用分片上传
+        multipart_chunksize: 分片大小
+        max_concurrency: 并发上传的分片数
+        
+    Returns:
+        boto3 TransferConfig
+    """
+    threshold = multipart_threshold or SINGLE_PUT_LIMIT
+    if multipart_chunksize is None:
+        chunk = math.ceil(file_size / TARGET_PARTS / MB) * MB
+        multipart_chunksize = min(max(chunk, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    if max_concurrency is None:
+        parts = math.ceil(file_size / multipart_chunksize) if file_size >= threshold else 1
+        max_concurrency = max(1, min(parts, MAX_CONCURRENCY))
+    return TransferConfig(
+        multipart_threshold=threshold,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=max_concurrency,
+        use_threads=max_concurrency > 1
+    )
+
+
+class TransferProgress:
+    """上传进度回调：boto3 在多个线程中调用，按百分比打印进度和实时速率"""
+
+    def __init__(self, total_bytes, label="", step_percent=10):
+        self.total_bytes = total_bytes
+        self.label = label
+        self.step_percent = step_percent
+        self.transferred = 0
+        self.started = time.perf_counter()
+        self._next_report = step_percent
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.transferred += bytes_amount
+            percent = self.transferred * 100 / self.total_bytes if self.total_bytes else 100
+            if percent < self._next_report:
+                return
+            while self._next_report <= percent:
+                self._next_report += self.step_percent
+            elapsed = time.perf_counter() - self.started
+            speed = self.transferred / MB / elapsed if elapsed else 0
+            print(f"  {self.label} {percent:5.1f}%  {self.transferred / MB:.1f}/{self.total_bytes / MB:.1f} MB  "
+                  f"{speed:.1f} MB/s")
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "bytes": self.transferred,
+            "seconds": round(elapsed, 3),
+            "mb_per_s": round(self.transferred / MB / elapsed, 2) if elapsed else None
+        }
+
 
 class VideoAnalyzerS3:
-    def __init__(self, region_name="us-east-1", model_id="amazon.nova-lite-v1:0", bucket_name=None):
+    def __init__(self, region_name="us-east-1", model_id="amazon.nova-lite-v1:0", bucket_name=None,
+                 endpoint_url=None, multipart_threshold=None, multipart_chunksize=None, max_concurrency=None):
         """
         初始化分析器
         
@@ -18,23 +126,37 @@ class VideoAnalyzerS3:
             region_name: AWS 区域
             model_id: 模型 ID
             bucket_name: S3 bucket 名称
+            endpoint_url: S3 端点（可选，用于本地 S3 兼容服务，默认读取 S3_ENDPOINT_URL）
+            multipart_threshold: 分片上传阈值（可选，默认按文件大小自动选择）
+            multipart_chunksize: 分片大小（可选，默认按文件大小自动选择）
+            max_concurrency: 并发上传的分片数（可选，默认按文件大小自动选择）
         """
-        self.bedrock_runtime = boto3.client(
+        self.bedrock_runtime = wrap_bedrock_client(boto3.client(
             service_name="bedrock-runtime",
             region_name=region_name
-        )
-        self.s3_client = boto3.client('s3', region_name=region_name)
+        ))
+        self.s3_client = boto3.client('s3', region_name=region_name,
+                                      endpoint_url=endpoint_url or os.getenv("S3_ENDPOINT_URL"))
+        self.transfer_options = {
+            "multipart_threshold": multipart_threshold,
+            "multipart_chunksize": multipart_chunksize,
+            "max_concurrency": max_concurrency
+        }
+        self.last_upload = None
+        self._lifecycle_checked = False
+        self._lifecycle_warned = False
         self.model_id = model_id
         self.bucket_name = bucket_name
         self.region_name = region_name
     
-    def upload_video_to_s3(self, video_path, s3_key=None):
+    def upload_video_to_s3(self, video_path, s3_key=None, extra_args=None):
         """
         上传视频到 S3
         
         Args:
             video_path: 本地视频文件路径
             s3_key: S3 对象键（可选，默认使用文件名）
+            extra_args: 传给 upload_file 的 ExtraArgs（可选，例如 Metadata）
             
         Returns:
             S3 URI
@@ -45,17 +167,174 @@ class VideoAnalyzerS3:
         if s3_key is None:
             s3_key = f"videos/{Path(video_path).name}"
         
+        file_size = os.path.getsize(video_path)
+        config = choose_transfer_config(file_size, **self.transfer_options)
+        multipart = file_size >= config.multipart_threshold
+        
         print(f"正在上传视频到 S3...")
         print(f"  Bucket: {self.bucket_name}")
         print(f"  Key: {s3_key}")
+        print(f"  大小: {file_size / MB:.1f} MB，" + (
+            f"分片上传 {config.multipart_chunksize // MB} MB x {math.ceil(file_size / config.multipart_chunksize)} 片，"
+            f"并发 {config.max_concurrency}" if multipart else "单次上传"))
         
-        self.s3_client.upload_file(video_path, self.bucket_name, s3_key)
+        progress = TransferProgress(file_size, label=Path(video_path).name)
+        self.s3_client.upload_file(video_path, self.bucket_name, s3_key, ExtraArgs=extra_args,
+                                   Config=config, Callback=progress)
         
         s3_uri = f"s3://{self.bucket_name}/{s3_key}"
-        print(f"✅ 上传成功: {s3_uri}")
+        self.last_upload = {
+            "s3_uri": s3_uri,
+            "multipart": multipart,
+            "chunksize": config.multipart_chunksize,
+            "max_concurrency": config.max_concurrency,
+            **progress.summary()
+        }
+        print(f"✅ 上传成功: {s3_uri}（{self.last_upload['seconds']:.2f} s，{self.last_upload['mb_per_s']} MB/s）")
         
         return s3_uri
     
+    def stage_video_to_s3(self, video_path, retention_days=STAGING_RETENTION_DAYS):
+        """
+        按内容寻址暂存视频：键为 staging/sha256/<哈希><扩展名>，对象已存在时跳过上传
+        
+        生命周期规则按对象创建时间过期，且删除是异步的，已过期的对象可能还在。
+        已有对象的年龄超过 retention_days - STAGING_REFRESH_MARGIN_DAYS 时，用 copy_object 复制到自身刷新创建时间
+        （超过 5GB 或复制失败时重新上传），保证分析期间对象不会被删除
+        
+        Args:
+            video_path: 本地视频文件路径
+            retention_days: 暂存前缀生命周期规则的保留天数；为 None 时不检查对象年龄
+            
+        Returns:
+            S3 URI
+        """
+        if not self.bucket_name:
+            raise ValueError("需要指定 bucket_name")
+        
+        started = time.perf_counter()
+        sha256 = file_sha256(video_path)
+        s3_key = f"{STAGING_PREFIX}{sha256}{Path(video_path).suffix.lower()}"
+        s3_uri = f"s3://{self.bucket_name}/{s3_key}"
+        metadata = {"sha256": sha256}
+        print(f"SHA-256: {sha256}（{time.perf_counter() - started:.2f} s）")
+        
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            # 没有 s3:ListBucket 权限时不存在的对象返回 403，同样按需要上传处理
+            if e.response.get("Error", {}).get("Code") not in ("403", "404", "NoSuchKey", "NotFound"):
+                raise
+            head = None
+        
+        if head is not None and head["ContentLength"] == os.path.getsize(video_path):
+            age_days = (datetime.now(timezone.utc) - head["LastModified"]).total_seconds() / 86400
+            if retention_days is None or age_days < retention_days - STAGING_REFRESH_MARGIN_DAYS:
+                self.last_upload = {"s3_uri": s3_uri, "skipped": True, "bytes": 0}
+                print(f"✅ S3 中已有相同内容，跳过上传: {s3_uri}")
+                return s3_uri
+            if head["ContentLength"] <= COPY_OBJECT_LIMIT:
+                try:
+                    self.s3_client.copy_object(
+                        Bucket=self.bucket_name, Key=s3_key,
+                        CopySource={"Bucket": self.bucket_name, "Key": s3_key},
+                        Metadata=metadata, MetadataDirective="REPLACE"
+                    )
+                    self.last_upload = {"s3_uri": s3_uri, "skipped": True, "refreshed": True, "bytes": 0}
+                    print(f"✅ S3 中已有相同内容（已存在 {age_days:.1f} 天，接近过期），已刷新创建时间: {s3_uri}")
+                    return s3_uri
+                except ClientError as e:
+                    # 对象可能刚好被生命周期规则删除，重新上传
+                    print(f"⚠️  刷新暂存对象失败，重新上传: {e}")
+            else:
+                print(f"S3 中已有相同内容但已存在 {age_days:.1f} 天，接近过期，重新上传")
+        
+        return self.upload_video_to_s3(video_path, s3_key, extra_args={"Metadata": metadata})
+    
+    def ensure_staging_lifecycle(self, retention_days=STAGING_RETENTION_DAYS):
+        """
+        在 bucket 上添加（或更新）暂存前缀的过期规则，保留其他已有规则和 TransitionDefaultMinimumObjectSize
+        
+        这是 bucket 级别的配置，先读再整体写回，与其他同时修改生命周期配置的操作之间没有原子性，
+        适合由 bucket 管理员一次性执行；analyze_video 只在 manage_lifecycle=True 时调用
+        
+        Args:
+            retention_days: 暂存对象创建后保留的天数
+            
+        Returns:
+            是否设置成功（没有权限时只打印警告）
+        """
+        rule = {
+            "ID": STAGING_LIFECYCLE_RULE_ID,
+            "Filter": {"Prefix": STAGING_PREFIX},
+            "Status": "Enabled",
+            "Expiration": {"Days": retention_days},
+            "AbortIncompleteMultipartUpload": {"DaysAfterInitiation": 1}
+        }
+        try:
+            current = self._get_lifecycle_configuration()
+            rules = current["Rules"]
+            existing = next((r for r in rules if r.get("ID") == STAGING_LIFECYCLE_RULE_ID), None)
+            if existing == rule:
+                return True
+            rules = [r for r in rules if r.get("ID") != STAGING_LIFECYCLE_RULE_ID] + [rule]
+            extra = {}
+            # 整体写回时不带这个设置会被重置为默认值
+            if current.get("TransitionDefaultMinimumObjectSize"):
+                extra["TransitionDefaultMinimumObjectSize"] = current["TransitionDefaultMinimumObjectSize"]
+            self.s3_client.put_bucket_lifecycle_configuration(
+                Bucket=self.bucket_name,
+                LifecycleConfiguration={"Rules": rules},
+                **extra
+            )
+            print(f"✅ 已设置暂存对象过期规则: {STAGING_PREFIX} 保留 {retention_days} 天")
+            return True
+        except ClientError as e:
+            print(f"⚠️  设置生命周期规则失败，暂存对象不会自动过期: {e}")
+            return False
+    
+    def _get_lifecycle_configuration(self):
+        """读取 bucket 生命周期配置，没有配置时返回空规则列表"""
+        try:
+            return self.s3_client.get_bucket_lifecycle_configuration(Bucket=self.bucket_name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchLifecycleConfiguration":
+                raise
+            return {"Rules": []}
+    
+    def staging_expiration_rule(self):
+        """
+        返回对暂存前缀生效的过期规则（已启用、带 Expiration，且只按前缀过滤），没有时返回 None
+        
+        没有 s3:GetLifecycleConfiguration 权限时抛出 ClientError
+        """
+        for rule in self._get_lifecycle_configuration()["Rules"]:
+            if rule.get("Status") != "Enabled" or not rule.get("Expiration"):
+                continue
+            rule_filter = rule.get("Filter", {})
+            if set(rule_filter) - {"Prefix"}:
+                # 按标签或对象大小过滤的规则不一定覆盖暂存对象
+                continue
+            prefix = rule_filter.get("Prefix", rule.get("Prefix", ""))
+            if STAGING_PREFIX.startswith(prefix):
+                return rule
+        return None
+    
+    def warn_if_staging_never_expires(self):
+        """
+        暂存前缀没有过期规则时打印醒目的警告，返回是否找到规则（无法读取配置时返回 None）
+        """
+        try:
+            rule = self.staging_expiration_rule()
+        except ClientError as e:
+            print(f"⚠️  无法读取 bucket 生命周期配置，不能确认暂存对象会过期: {e}")
+            return None
+        if rule is None:
+            print("⚠️" * 3 + f"  bucket {self.bucket_name} 没有对 {STAGING_PREFIX} 生效的过期规则，暂存视频会一直保留并持续计费！")
+            print("⚠️  请由 bucket 管理员执行一次 ensure_staging_lifecycle()，或调用 analyze_video(manage_lifecycle=True)")
+            return False
+        return True
+    
     def analyze_video_from_s3(self, s3_uri, prompt="请详细描述这个视频的内容", max_tokens=2048, temperature=0.7, top_p=0.9):
         """
         使用 S3 URI 分析视频
@@ -118,9 +397,10 @@ class VideoAnalyzerS3:
             print(f"❌ 调用失败: {e}")
             raise
     
-    def analyze_video(self, video_path, prompt="请详细描述这个视频的内容", max_tokens=2048, temperature=0.7, top_p=0.9, cleanup=True):
+    def analyze_video(self, video_path, prompt="请详细描述这个视频的内容", max_tokens=2048, temperature=0.7, top_p=0.9,
+                      retention_days=STAGING_RETENTION_DAYS, manage_lifecycle=False, cleanup=None):
         """
-        分析本地视频文件（自动上传到 S3）
+        分析本地视频文件（按内容暂存到 S3，同一文件重复分析不再上传）
         
         Args:
             video_path: 本地视频文件路径
@@ -128,34 +408,36 @@ class VideoAnalyzerS3:
             max_tokens: 最大生成 token 数
             temperature: 温度参数
             top_p: Top-p 采样参数
-            cleanup: 分析后是否删除 S3 上的视频
+            retention_days: 暂存前缀生命周期规则的保留天数，用于判断已有对象是否接近过期；为 None 时不检查
+            manage_lifecycle: 为 True 时先用 ensure_staging_lifecycle 设置 bucket 生命周期规则（bucket 级别配置，默认不修改）
+            cleanup: 已弃用，不再生效。暂存对象按内容寻址，同一视频的并发分析可能正在读取，分析后不删除
             
         Returns:
             模型的分析结果
         """
-        # 上传到 S3
-        s3_key = f"temp-videos/{int(time.time())}-{Path(video_path).name}"
-        s3_uri = self.upload_video_to_s3(video_path, s3_key)
+        if cleanup is not None:
+            warnings.warn("cleanup 参数已弃用且不再生效：暂存对象按内容复用（可能正被同一视频的其他分析读取），"
+                          "由 bucket 生命周期规则过期", DeprecationWarning, stacklevel=2)
+        if manage_lifecycle and retention_days is not None:
+            if not self._lifecycle_checked:
+                self.ensure_staging_lifecycle(retention_days)
+                self._lifecycle_checked = True
+        elif not self._lifecycle_warned:
+            # 不修改 bucket 配置，但暂存对象没有过期规则时要让调用方知道
+            self.warn_if_staging_never_expires()
+            self._lifecycle_warned = True
         
-        try:
-            # 分析视频
-            response = self.analyze_video_from_s3(
-                s3_uri=s3_uri,
-                prompt=prompt,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p
-            )
-            
-            return response
-        finally:
-            # 清理 S3 文件
-            if cleanup:
-                try:
-                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
-                    print(f"✅ 已清理 S3 临时文件")
-                except Exception as e:
-                    print(f"⚠️  清理 S3 文件失败: {e}")
+        # 暂存到 S3（已存在相同内容且不会很快过期时跳过上传）
+        s3_uri = self.stage_video_to_s3(video_path, retention_days)
+        
+        # 分析视频
+        return self.analyze_video_from_s3(
+            s3_uri=s3_uri,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p
+        )
     
     def extract_text_response(self, response):
         """提取响应文本"""
@@ -216,7 +498,7 @@ def main():
             max_tokens=2048,
             temperature=0.7,
             top_p=0.9,
-            cleanup=True  # 分析后删除 S3 文件
+            retention_days=7  # bucket 上暂存前缀的保留天数，已有对象接近过期时先刷新
         )
         
         # 提取并打印结果
@@ -0,0 +1,142 @@
+"""上传路径测试：用 moto 的本地 S3 服务代替 S3，不访问 AWS"""
+
+import os
+import threading
+
+import pytest
+
+from analyze_video_s3 import (
+    MAX_CHUNK_SIZE, MAX_CONCURRENCY, MAX_PARTS, MB, MIN_CHUNK_SIZE, SINGLE_PUT_LIMIT, STAGING_PREFIX,
+    TransferProgress, VideoAnalyzerS3, choose_transfer_config
+)
+
+moto_server = pytest.importorskip("moto.server")
+
+BUCKET = "video-staging-test"
+GB = 1024 * MB
+
+
+@pytest.fixture(scope="module")
+def endpoint_url():
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def analyzer(endpoint_url, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    # 5MB 分片（S3 允许的最小值），让几十 MB 的测试文件也走分片上传
+    analyzer = VideoAnalyzerS3(bucket_name=BUCKET, endpoint_url=endpoint_url,
+                               multipart_threshold=5 * MB, multipart_chunksize=5 * MB, max_concurrency=4)
+    try:
+        analyzer.s3_client.create_bucket(Bucket=BUCKET)
+    except analyzer.s3_client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    return analyzer
+
+
+def write_video(path, size):
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return str(path)
+
+
+def parts(config, size):
+    return -(-size // config.multipart_chunksize) if size >= config.multipart_threshold else 1
+
+
+def test_small_file_uses_single_put():
+    config = choose_transfer_config(SINGLE_PUT_LIMIT - 1)
+    assert config.multipart_threshold == SINGLE_PUT_LIMIT
+    assert config.max_concurrency == 1
+    assert not config.use_threads
+
+
+@pytest.mark.parametrize("size", [SINGLE_PUT_LIMIT, GB, 100 * GB, 5 * 1024 * GB])
+def test_large_file_part_counts(size):
+    config = choose_transfer_config(size)
+    count = parts(config, size)
+    assert MIN_CHUNK_SIZE <= config.multipart_chunksize <= MAX_CHUNK_SIZE
+    assert config.multipart_chunksize % MB == 0
+    assert 1 < count <= MAX_PARTS
+    assert config.max_concurrency == min(count, MAX_CONCURRENCY)
+    assert config.use_threads
+
+
+def test_chunk_grows_with_file_size():
+    # 1GB 按 1000 片切只有约 1MB，取下限；100GB 切成约 1000 片
+    assert choose_transfer_config(GB).multipart_chunksize == MIN_CHUNK_SIZE
+    assert parts(choose_transfer_config(100 * GB), 100 * GB) <= 1000
+
+
+def test_explicit_options_win():
+    config = choose_transfer_config(GB, multipart_threshold=2 * GB, multipart_chunksize=16 * MB, max_concurrency=3)
+    assert (config.multipart_threshold, config.multipart_chunksize, config.max_concurrency) == (2 * GB, 16 * MB, 3)
+
+
+def test_transfer_progress_reaches_total(capsys):
+    progress = TransferProgress(100 * MB, label="video.mp4")
+    threads = [threading.Thread(target=lambda: [progress(MB) for _ in range(25)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert progress.transferred == 100 * MB
+    assert progress.summary()["bytes"] == 100 * MB
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 10
+    assert "100.0%" in lines[-1]
+
+
+def test_multipart_upload(analyzer, tmp_path, capsys):
+    size = 12 * MB + 123
+    video_path = write_video(tmp_path / "clip.mp4", size)
+
+    s3_uri = analyzer.upload_video_to_s3(video_path, "videos/clip.mp4")
+
+    assert s3_uri == f"s3://{BUCKET}/videos/clip.mp4"
+    assert analyzer.last_upload["s3_uri"] == s3_uri
+    assert analyzer.last_upload["multipart"] is True
+    assert analyzer.last_upload["chunksize"] == 5 * MB
+    assert analyzer.last_upload["max_concurrency"] == 4
+    assert analyzer.last_upload["bytes"] == size
+    assert analyzer.last_upload["seconds"] >= 0
+    assert "100.0%" in capsys.readouterr().out
+    body = analyzer.s3_client.get_object(Bucket=BUCKET, Key="videos/clip.mp4")["Body"].read()
+    with open(video_path, "rb") as f:
+        assert body == f.read()
+
+
+def test_single_put_upload(analyzer, tmp_path):
+    video_path = write_video(tmp_path / "short.mp4", MB)
+    analyzer.upload_video_to_s3(video_path)
+    assert analyzer.last_upload["multipart"] is False
+    assert analyzer.last_upload["bytes"] == MB
+    head = analyzer.s3_client.head_object(Bucket=BUCKET, Key="videos/short.mp4")
+    assert head["ContentLength"] == MB
+
+
+def test_staging_reuses_uploaded_content(analyzer, tmp_path):
+    video_path = write_video(tmp_path / "again.mp4", 6 * MB)
+
+    s3_uri = analyzer.stage_video_to_s3(video_path)
+    assert s3_uri.startswith(f"s3://{BUCKET}/{STAGING_PREFIX}")
+    assert analyzer.last_upload["bytes"] == 6 * MB
+
+    assert analyzer.stage_video_to_s3(video_path) == s3_uri
+    assert analyzer.last_upload == {"s3_uri": s3_uri, "skipped": True, "bytes": 0}
+
+
+def test_staging_lifecycle_warning(analyzer, capsys):
+    analyzer.s3_client.delete_bucket_lifecycle(Bucket=BUCKET)
+    assert analyzer.warn_if_staging_never_expires() is False
+    assert "过期规则" in capsys.readouterr().out
+
+    assert analyzer.ensure_staging_lifecycle(retention_days=3)
+    assert analyzer.staging_expiration_rule()["Expiration"] == {"Days": 3}
+    assert analyzer.warn_if_staging_never_expires() is True